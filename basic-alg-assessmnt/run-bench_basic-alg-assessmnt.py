@@ -5,6 +5,11 @@ import subprocess
 import shutil
 import time
 from datetime import datetime
+from pathlib import Path
+
+# Shared helpers of the benchmark runners
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench-common"))
+from results_sink import CHECKPOINT_PER_CELL, ResultsSink, parse_checkpoint
 
 
 # List of the traditional algorithms used for reference
@@ -16,26 +21,23 @@ TRADITIONAL_SIG_ALGS.append("ecdsap256")
 def run_benchmark_test():
     
     # Write Header to file for each algorithm
-    results_file = open(results_file_name, "a")
-    results_file.write("Testrun for the Algorithm: "+alg+"\n")
-    results_file.close()
+    results.write_line("Testrun for the Algorithm: "+alg)
     
     # Execute OpenSSL library benchmark speed test for given algorithm for 120 seconds (instead of default=10)
-    results = subprocess.run(['openssl', 'speed', '-seconds', '120', alg], capture_output=True)
+    speed = subprocess.run(['openssl', 'speed', '-seconds', '120', alg], capture_output=True)
        
     # Save output line by line in array
-    output = bytes.decode(results.stdout, 'utf-8').splitlines()
+    output = bytes.decode(speed.stdout, 'utf-8').splitlines()
     
     # Prepare line-by-line write, if in future stripping of the results is to be implemented
     for result in output:
-        results_file = open(results_file_name, "a")
-        results_file.write(result+"\n")
-        results_file.close()
+        results.write_line(result)
     
     # Add blank line at the end of the algorithm section
-    results_file = open(results_file_name, "a")
-    results_file.write("------------------------------\n")
-    results_file.close()
+    results.write_line("------------------------------")
+    
+    # Checkpoint the results of the algorithm (depending on the checkpoint mode)
+    results.cell_completed()
         
     print('\033[1;32mSUCCESS:\tResults for {} written to file.\n\033[0m'.format(alg), file=sys.stdout)
                 
@@ -114,6 +116,7 @@ if __name__ == '__main__':
         description='Benchmarking Post-Quantum Signature Algorithm performance using OpenSSL speed.')
     parser.add_argument('-sigs', help='path to file with list of PQ signature algorithms to be included in the tests', metavar='<file path>', required=True)
     parser.add_argument('-out', help='path to directory where the results should be saved to', metavar='<dir path>', required=True)
+    parser.add_argument('-checkpoint', help='when the results are flushed and synced to disk, "cell" (after every algorithm) or a number of lines, default is cell', metavar='cell|INT', type=parse_checkpoint, default=CHECKPOINT_PER_CELL, required=False)
     
     args = parser.parse_args()
     
@@ -132,8 +135,7 @@ if __name__ == '__main__':
     
     # Prepare file for benchmark results
     results_file_name = out_dir+"results_"+datetime.now().strftime("%Y-%m-%d_%H:%M:%S")+".csv"
-    results_file = open(results_file_name, "a")
-    results_file.close()
+    results = ResultsSink(results_file_name, checkpoint=args.checkpoint)
 
     # Read the post-quantum signature algorithms from file and check if activated in oqs-provider
     pq_sig_algs = read_pq_sigalgs(sig_file)
@@ -147,5 +149,8 @@ if __name__ == '__main__':
         # Run OpenSSL speed benchmark test
         run_benchmark_test()
     
+    # Write the remaining results and the manifest of the completed run
+    results.finish({"signature_algorithms": sig_algs})
+    
     print('\033[1;32mSUCCESS:\tResults were stored in "{}". Finished.\033[0m'.format(results_file_name), file=sys.stdout)
     sys.exit(0)
@@ -0,0 +1,115 @@
+##############################################################################################
+##      Title:          Adaptive Sample Size for Benchmark Cells                            ##
+##                                                                                          ##
+##      Description:    Keeps a cell running until the distribution-free confidence         ##
+##                      intervals of the chosen statistics (e.g. median and p95) are        ##
+##                      narrower than a target width, bounded by a minimum and a maximum    ##
+##                      number of rounds.                                                   ##
+##############################################################################################
+
+import math
+from statistics import NormalDist
+
+# Reasons why a cell stopped, as recorded in the manifests
+STOP_FIXED = "fixed_rounds"
+STOP_CONVERGED = "converged"
+STOP_MAX_ROUNDS = "max_rounds"
+
+# Number of rounds after which the confidence intervals are checked again
+CHECK_INTERVAL = 10
+
+
+def parse_statistics(value):
+    # Argument type for the "-stats" option: comma-separated list of "median" and percentiles like "p95"
+    statistics = {}
+    for name in value.split(","):
+        name = name.strip()
+        if name == "median":
+            statistics[name] = 0.5
+        elif name.startswith("p") and name[1:].replace(".", "", 1).isdigit():
+            quantile = float(name[1:]) / 100
+            if not 0 < quantile < 1:
+                raise ValueError(f"percentile {name} out of range")
+            statistics[name] = quantile
+        else:
+            raise ValueError(f"unknown statistic {name}, use median or pNN")
+    return statistics
+
+
+def quantile_ci(sorted_samples, q, confidence):
+    # Distribution-free confidence interval of a quantile, based on the ranks of the order statistics
+    # (normal approximation of the binomial distribution). Returns None if there are too few samples.
+    n = len(sorted_samples)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    spread = z * math.sqrt(n * q * (1 - q))
+    lower = math.floor(n * q - spread)
+    upper = math.ceil(n * q + spread)
+    if lower < 0 or upper > n - 1:
+        return None
+    return sorted_samples[lower], sorted_samples[upper]
+
+
+def quantile(sorted_samples, q):
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+class AdaptiveSampler:
+    # Collects the handshake durations of one cell and decides when the cell has enough rounds.
+    # The width of a confidence interval is relative to the estimate, e.g. 0.05 for +-2.5 %.
+
+    def __init__(self, statistics, ci_width, confidence, min_rounds, max_rounds):
+        self.statistics = statistics
+        self.ci_width = ci_width
+        self.confidence = confidence
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.samples = []
+
+    def add(self, duration_ms):
+        # Note: Only successful handshakes are samples, failed ones still count as rounds
+        self.samples.append(duration_ms)
+        return
+
+    def relative_widths(self):
+        sorted_samples = sorted(self.samples)
+        widths = {}
+        for name, q in self.statistics.items():
+            interval = quantile_ci(sorted_samples, q, self.confidence)
+            estimate = quantile(sorted_samples, q) if sorted_samples else 0
+            if interval is None or estimate <= 0:
+                widths[name] = None
+            else:
+                widths[name] = (interval[1] - interval[0]) / estimate
+        return widths
+
+    def stop_reason(self, rounds):
+        # Returns why the cell can stop after the given number of rounds, or None if it has to continue
+        if rounds < self.min_rounds:
+            return None
+        widths = self.relative_widths()
+        if all(
+            width is not None and width <= self.ci_width for width in widths.values()
+        ):
+            return STOP_CONVERGED
+        if rounds >= self.max_rounds:
+            return STOP_MAX_ROUNDS
+        return None
+
+    def next_rounds(self, rounds):
+        # Number of rounds to run next (0 if the cell is done)
+        if self.stop_reason(rounds) is not None:
+            return 0
+        if rounds < self.min_rounds:
+            return self.min_rounds - rounds
+        return min(CHECK_INTERVAL, self.max_rounds - rounds)
+
+    def summary(self, rounds):
+        widths = self.relative_widths()
+        return {
+            "stop_reason": self.stop_reason(rounds),
+            "samples": len(self.samples),
+            "ci_widths": {
+                name: None if width is None else round(width, 4)
+                for name, width in widths.items()
+            },
+        }
@@ -0,0 +1,99 @@
+##############################################################################################
+##      Title:          Campaign Manifest for Resumable Benchmark Campaigns                 ##
+##                                                                                          ##
+##      Description:    Records the configuration of a campaign and each completed cell,    ##
+##                      so that an interrupted campaign can be resumed and only runs the    ##
+##                      missing cells.                                                      ##
+##############################################################################################
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from results_sink import write_json_atomic
+
+
+def cell_key(alg, rate, delay, loss):
+    # Numbers are compared as floats, as e.g. a loss of 0 and 0.0 is the same cell
+    return (alg, float(rate), float(delay), float(loss))
+
+
+class CampaignManifest:
+    # The manifest is rewritten atomically whenever a cell is completed. It only lists cells whose
+    # rows are already synced to the results file, together with the size of the file at that point.
+
+    def __init__(self, path, data):
+        self.path = Path(path)
+        self.data = data
+        self.lock = threading.Lock()
+        self.completed = {
+            cell_key(cell["alg"], cell["rate"], cell["delay"], cell["loss"])
+            for cell in data["completed_cells"]
+        }
+
+    def config(self, name, default=None):
+        # Settings added in later versions are missing in the manifests of older campaigns
+        return self.data["config"].get(name, default)
+
+    def results_path(self):
+        # The results file is stored next to the manifest
+        return self.path.with_name(self.data["results_file"])
+
+    def is_completed(self, alg, rate, delay, loss):
+        return cell_key(alg, rate, delay, loss) in self.completed
+
+    def mark_completed(self, alg, rate, delay, loss, rounds, results_bytes, **details):
+        with self.lock:
+            cell = {
+                "alg": alg,
+                "rate": rate,
+                "delay": delay,
+                "loss": loss,
+                "rounds": [1, rounds],
+                "completed": datetime.now().isoformat(timespec="seconds"),
+            }
+            cell.update(details)
+            self.data["completed_cells"].append(cell)
+            self.data["results_bytes"] = results_bytes
+            self.completed.add(cell_key(alg, rate, delay, loss))
+            self.save()
+        return
+
+    def mark_finished(self):
+        with self.lock:
+            self.data["finished"] = datetime.now().isoformat(timespec="seconds")
+            self.save()
+        return
+
+    def save(self):
+        write_json_atomic(self.path, self.data)
+        return
+
+    def truncate_results(self):
+        # Cut off rows written after the last completed cell (e.g. of a cell interrupted by a crash)
+        results_path = self.results_path()
+        if results_path.stat().st_size > self.data["results_bytes"]:
+            os.truncate(results_path, self.data["results_bytes"])
+        return
+
+
+def create_campaign_manifest(path, results_path, config):
+    data = {
+        "results_file": Path(results_path).name,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "finished": None,
+        "config": config,
+        "results_bytes": 0,
+        "completed_cells": [],
+    }
+    manifest = CampaignManifest(path, data)
+    manifest.save()
+    return manifest
+
+
+def load_campaign_manifest(path):
+    with open(path, "r", encoding="utf-8") as manifest_file:
+        data = json.load(manifest_file)
+    return CampaignManifest(path, data)
@@ -0,0 +1,191 @@
+##############################################################################################
+##      Title:          Campaign Files and Cell Planner                                     ##
+##                                                                                          ##
+##      Description:    Reads a TOML campaign file (algorithms, network grid, TLS groups    ##
+##                      and cipher suites, rounds and recording) and expands it into        ##
+##                      benchmark cells, ordered such that the expensive transitions        ##
+##                      between consecutive cells (TLS server restarts and qdisc changes)   ##
+##                      are minimised.                                                      ##
+##############################################################################################
+
+import itertools
+import math
+import tomllib
+
+# Estimated cost in seconds of the transitions between cells, used to choose the order of the cells
+PKI_BUILD_COST = 2.0
+SERVER_RESTART_COST = 0.2
+QDISC_CHANGE_COST = 0.02
+
+# Orders of the cells
+ORDER_ALGORITHM_MAJOR = "algorithm-major"
+ORDER_NETWORK_MAJOR = "network-major"
+
+
+# Settings of a campaign file, the keys of the top level and of its sections (None for plain values)
+CAMPAIGN_FILE_KEYS = {
+    "rounds": None,
+    "record": None,
+    "algorithms": {"traditional", "pq", "pq_file"},
+    "network": {"rate", "delay", "loss"},
+    "tls": {"groups", "ciphersuites"},
+}
+
+
+class CampaignFileError(Exception):
+    pass
+
+
+def check_keys(data):
+    # A misspelled setting would otherwise silently fall back to the default of the script
+    for key, value in data.items():
+        if key not in CAMPAIGN_FILE_KEYS:
+            raise CampaignFileError(f"unknown setting {key}")
+        section_keys = CAMPAIGN_FILE_KEYS[key]
+        if section_keys is None:
+            continue
+        if not isinstance(value, dict):
+            raise CampaignFileError(f"{key} must be a section ([{key}])")
+        for name in value:
+            if name not in section_keys:
+                raise CampaignFileError(f"unknown setting {name} in [{key}]")
+
+
+def number_list(section, name, values):
+    if not isinstance(values, list) or not values:
+        raise CampaignFileError(f"[{section}] {name} must be a non-empty list")
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise CampaignFileError(
+                f"[{section}] {name} must only contain non-negative numbers, found {value!r}"
+            )
+    return [float(value) for value in values]
+
+
+def name_list(section, name, values):
+    if not isinstance(values, list) or not values or not all(isinstance(value, str) and value for value in values):
+        raise CampaignFileError(f"[{section}] {name} must be a non-empty list of names")
+    return values
+
+
+def load_campaign_file(path):
+    # Returns the settings of the campaign file, settings which are not given are None
+    try:
+        with open(path, "rb") as campaign_file:
+            data = tomllib.load(campaign_file)
+    except tomllib.TOMLDecodeError as error:
+        raise CampaignFileError(f"invalid TOML: {error}") from error
+    check_keys(data)
+
+    algorithms = data.get("algorithms", {})
+    network = data.get("network", {})
+    campaign = {
+        "traditional": algorithms.get("traditional"),
+        "pq": algorithms.get("pq"),
+        "pq_file": algorithms.get("pq_file"),
+        "rate_values": None,
+        "delay_values": None,
+        "loss_values": None,
+        "kex_groups": None,
+        "cipher_suites": None,
+        "rounds": data.get("rounds"),
+        "record": data.get("record"),
+    }
+
+    for name in ["traditional", "pq"]:
+        values = campaign[name]
+        if values is not None and not (
+            isinstance(values, list) and all(isinstance(alg, str) for alg in values)
+        ):
+            raise CampaignFileError(f"[algorithms] {name} must be a list of algorithm names")
+    if campaign["pq"] is not None and campaign["pq_file"] is not None:
+        raise CampaignFileError("[algorithms] only one of pq and pq_file can be given")
+
+    for name in ["rate", "delay", "loss"]:
+        if name in network:
+            campaign[f"{name}_values"] = number_list("network", name, network[name])
+
+    tls = data.get("tls", {})
+    for name, setting in [("groups", "kex_groups"), ("ciphersuites", "cipher_suites")]:
+        if name in tls:
+            campaign[setting] = name_list("tls", name, tls[name])
+
+    if campaign["rounds"] is not None and (
+        isinstance(campaign["rounds"], bool)
+        or not isinstance(campaign["rounds"], int)
+        or campaign["rounds"] < 1
+    ):
+        raise CampaignFileError("rounds must be a positive integer")
+    if campaign["record"] is not None and not isinstance(campaign["record"], bool):
+        raise CampaignFileError("record must be true or false")
+    return campaign
+
+
+def snake(blocks):
+    # Reverse every other block, so that the last cell of a block and the first cell of the next one are
+    # as similar as possible (e.g. the same network emulation for the next algorithm)
+    return [block if i % 2 == 0 else block[::-1] for i, block in enumerate(blocks)]
+
+
+def transition_counts(sequences):
+    # Number of TLS server restarts and qdisc changes if every sequence runs on a freshly set up pair
+    # Note: A qdisc change is only needed if the emulation differs from the previous cell
+    restarts = 0
+    qdisc_changes = 0
+    for sequence in sequences:
+        previous = None
+        for alg, *emulation in sequence:
+            if previous is None or previous[0] != alg:
+                restarts += 1
+            if previous is None or previous[1:] != emulation:
+                qdisc_changes += 1
+            previous = [alg, *emulation]
+    return restarts, qdisc_changes
+
+
+def split_blocks(blocks, pair_count):
+    # Parallel pairs take whole blocks from a shared queue. If there are fewer blocks than pairs,
+    # the blocks are split, so that no pair stays idle.
+    pieces = math.ceil(pair_count / len(blocks)) if blocks else 1
+    units = []
+    for block in blocks:
+        size = math.ceil(len(block) / pieces)
+        units += [block[i : i + size] for i in range(0, len(block), size)]
+    return units
+
+
+def plan_cells(algs, rate_values, delay_values, loss_values, pair_count=1, skip=None, pki_builds=0):
+    # Returns the cells grouped in units (lists of cells run back to back on one pair) and the planned cost
+    # skip(alg, rate, delay, loss) tells whether a cell is already done (e.g. of a resumed campaign)
+    grid = list(itertools.product(rate_values, delay_values, loss_values))
+
+    candidates = {}
+    for order in [ORDER_ALGORITHM_MAJOR, ORDER_NETWORK_MAJOR]:
+        if order == ORDER_ALGORITHM_MAJOR:
+            blocks = [[(alg, *emulation) for emulation in grid] for alg in algs]
+        else:
+            blocks = [[(alg, *emulation) for alg in algs] for emulation in grid]
+        blocks = [
+            [cell for cell in block if not (skip and skip(*cell))] for block in snake(blocks)
+        ]
+        blocks = [block for block in blocks if block]
+
+        units = split_blocks(blocks, pair_count)
+        # With a single pair, all units run one after the other on the same pair
+        sequences = [[cell for unit in units for cell in unit]] if pair_count == 1 else units
+        restarts, qdisc_changes = transition_counts(sequences)
+        cost = restarts * SERVER_RESTART_COST + qdisc_changes * QDISC_CHANGE_COST
+        candidates[order] = (cost, units, restarts, qdisc_changes)
+
+    order = min(candidates, key=lambda name: candidates[name][0])
+    cost, units, restarts, qdisc_changes = candidates[order]
+    plan = {
+        "order": order,
+        "cells": sum(len(unit) for unit in units),
+        "units": len(units),
+        "pki_builds": pki_builds,
+        "server_restarts": restarts,
+        "qdisc_changes": qdisc_changes,
+        "estimated_overhead_s": round(cost + pki_builds * PKI_BUILD_COST, 1),
+    }
+    return units, plan
@@ -0,0 +1,110 @@
+##############################################################################################
+##      Title:          Condition-Aware Handshake Timeouts                                  ##
+##                                                                                          ##
+##      Description:    Computes the timeout of a handshake from the emulated delay and     ##
+##                      packet loss (TCP retransmissions with exponential backoff) and      ##
+##                      from the durations observed so far for the algorithm.               ##
+##############################################################################################
+
+import csv
+import math
+import threading
+
+# Initial TCP retransmission timeout (RFC 6298) in seconds, which also applies to a lost SYN
+INITIAL_RTO = 1.0
+
+# Accepted probability that a handshake exceeds the timeout only because of the emulated packet loss
+TAIL_PROBABILITY = 1e-4
+
+# Round trips of a loss-free mTLS handshake including TCP connect, plus slack for the transmission
+HANDSHAKE_RTTS = 4
+
+# Factor applied to the 99th percentile of the observed durations
+HISTORY_FACTOR = 3
+
+# Number of observed handshakes of a cell before its own distribution is used
+MIN_HISTORY = 20
+
+# Timeout in seconds as long as nothing is known about the algorithm (e.g. the first SPHINCS-s handshake)
+PILOT_TIMEOUT = 10.0
+
+# Bounds of the timeout of a single handshake in seconds
+MIN_TIMEOUT = 0.5
+MAX_TIMEOUT = 300.0
+
+
+def p99(durations):
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+
+
+class HandshakeTimeoutModel:
+    # Keeps the durations (in ms) of successful handshakes per cell. All methods are thread-safe.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+
+    def observe(self, alg, rate, delay, loss, duration_ms):
+        with self.lock:
+            key = (alg, float(rate), float(delay), float(loss))
+            self.durations.setdefault(key, []).append(duration_ms)
+        return
+
+    def load_results(self, results_path):
+        # Use the rows of an existing results file (e.g. of a resumed campaign) as history
+        with open(results_path, "r", encoding="utf-8", newline="") as results_file:
+            for row in csv.DictReader(results_file):
+                if row["Success"] == "1":
+                    self.observe(
+                        row["Signature Algorithm"],
+                        row["Rate Limit"],
+                        row["Delay"],
+                        row["Packet Loss"],
+                        float(row["Handshake Duration [ms]"]),
+                    )
+        return
+
+    def network_bound(self, delay, loss):
+        # Emulated delay is added on both veth devices
+        rtt = 2 * float(delay) / 1000
+        bound = HANDSHAKE_RTTS * rtt
+
+        # With packet loss, a packet may be lost several times in a row, each time doubling the RTO.
+        # Allow as many retransmissions as needed to keep the probability of a timeout below TAIL_PROBABILITY.
+        loss_rate = float(loss) / 100
+        if loss_rate >= 1:
+            # Every packet is lost, no number of retransmissions is enough
+            return MAX_TIMEOUT
+        if loss_rate > 0:
+            retransmissions = math.ceil(math.log(TAIL_PROBABILITY) / math.log(loss_rate))
+            # Stop at MAX_TIMEOUT, close to 100% loss the doubled RTOs would overflow a float
+            for attempt in range(retransmissions):
+                if bound >= MAX_TIMEOUT:
+                    break
+                bound += (INITIAL_RTO + rtt) * 2**attempt
+        return bound
+
+    def per_handshake(self, alg, rate, delay, loss):
+        # Timeout in seconds for a single handshake of the given cell
+        key = (alg, float(rate), float(delay), float(loss))
+        with self.lock:
+            cell = self.durations.get(key, [])
+            alg_cells = [
+                durations
+                for (cell_alg, *_), durations in self.durations.items()
+                if cell_alg == alg and durations
+            ]
+
+            if len(cell) >= MIN_HISTORY:
+                # Distribution of the cell itself
+                history_bound = HISTORY_FACTOR * p99(cell) / 1000
+            elif alg_cells:
+                # Pilot: computation time of the algorithm from its fastest cell, on top of the network model
+                history_bound = HISTORY_FACTOR * min(p99(d) for d in alg_cells) / 1000
+                history_bound += self.network_bound(delay, loss)
+            else:
+                history_bound = PILOT_TIMEOUT
+
+        timeout = max(self.network_bound(delay, loss), history_bound)
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, timeout))
@@ -0,0 +1,203 @@
+##############################################################################################
+##      Title:          Netlink Controller for Namespaces and Network Emulation             ##
+##                                                                                          ##
+##      Description:    Sets up a pair of network namespaces connected by a veth pair and   ##
+##                      changes the netem qdiscs of both veth ends in-process over          ##
+##                      rtnetlink (pyroute2), instead of spawning ip and tc for every       ##
+##                      change. Applied parameters are read back and verified.              ##
+##                                                                                          ##
+##      Prerequisites:                                                                      ##
+##                      - pyroute2 installed (optional, only needed for this controller).   ##
+##                      - Runs as root (or with CAP_NET_ADMIN and CAP_SYS_ADMIN).           ##
+##############################################################################################
+
+import math
+import os
+import subprocess
+
+try:
+    from pyroute2 import NetNS, netns
+    from pyroute2.netlink import NLM_F_ACK, NLM_F_CREATE, NLM_F_EXCL, NLM_F_REQUEST
+    from pyroute2.netlink.exceptions import NetlinkError
+    from pyroute2.netlink.rtnl import RTM_NEWQDISC, TC_H_ROOT
+    from pyroute2.netlink.rtnl.tcmsg import sched_netem, tcmsg
+
+    # Kernel ticks per us, in which netem stores the delay (see /proc/net/psched)
+    from pyroute2.netlink.rtnl.tcmsg.common import tick_in_usec as TICKS_PER_USEC
+except ImportError:
+    NetNS = None
+
+# Parameters of the emulated link before the first cell: rate limit of 10 Gbit/s, 0 delay and 0 packet loss
+INITIAL_EMULATION = (10000.0, 0.0, 0.0)
+
+# Highest rate in mbit/s of the netem qdiscs set over netlink: pyroute2 only encodes the 32-bit TCA_NETEM_RATE
+# (bytes/s), not TCA_NETEM_RATE64 as tc does for faster links
+MAX_NETEM_RATE = (2**32 - 1) * 8 / 1e6
+
+# Relative tolerance when comparing applied with requested parameters (the kernel stores the delay
+# in ticks and the loss as a fraction of 2^32)
+TOLERANCE = 1e-3
+
+
+class NetemError(Exception):
+    pass
+
+
+def netlink_available():
+    # Returns None if the controller can be used, otherwise the reason why not
+    if NetNS is None:
+        return "pyroute2 is not installed (pip install pyroute2)"
+    if os.geteuid() != 0:
+        return "the netlink controller requires root privileges"
+    return None
+
+
+def netem_message(index, rate, delay, loss):
+    # Message for the root netem qdisc of a device (rate in mbit/s, delay in ms, loss in %)
+    # Note: IPRoute.tc() would also send its "rate" argument as TCA_RATE (rate estimator) attribute of the qdisc,
+    # which the kernel rejects, so the message is built here and sent with nlm_request()
+    if float(rate) > MAX_NETEM_RATE:
+        raise NetemError(f"rate of {rate}mbit exceeds the {MAX_NETEM_RATE:.0f}mbit supported with -netlink")
+    msg = tcmsg()
+    msg["index"] = index
+    msg["handle"] = 0
+    msg["parent"] = TC_H_ROOT
+    # fmt: off
+    msg["attrs"] = [
+        ["TCA_KIND", "netem"],
+        # pyroute2 expects the rate in bytes/s and the delay in us
+        ["TCA_OPTIONS", sched_netem.get_parameters(
+            {"rate": int(float(rate) * 1e6 / 8), "delay": int(round(float(delay) * 1000)), "loss": float(loss)}
+        )],
+    ]
+    # fmt: on
+    return msg
+
+
+def send_netem(ipr, index, rate, delay, loss, create=False):
+    # Adds (create) or changes the root netem qdisc of a device, raises NetlinkError if the kernel rejects it
+    msg = netem_message(index, rate, delay, loss)
+    msg["header"]["type"] = RTM_NEWQDISC
+    msg["header"]["flags"] = NLM_F_REQUEST | NLM_F_ACK | (NLM_F_CREATE | NLM_F_EXCL if create else 0)
+    ipr.nlm_request_batch([msg])
+    return
+
+
+class NetlinkController:
+    # Holds a netlink socket in each namespace of a pair for its whole lifetime.
+    # Note: Not thread-safe, every pair is controlled by a single thread at a time.
+
+    def __init__(self, pair):
+        self.pair = pair
+        self.server = None
+        self.client = None
+        self.server_index = None
+        self.client_index = None
+        self.emulation = None
+
+    def setup(self):
+        # Same topology as virt-test-env/namespace-setup.sh, plus the permanent neighbor entries and the root qdiscs
+        pair = self.pair
+        try:
+            self.server = NetNS(pair.server_ns)
+            self.client = NetNS(pair.client_ns)
+
+            # Create the veth pair in the server namespace and move its peer into the client namespace
+            # fmt: off
+            self.server.link(
+                "add", ifname=pair.server_dev, address=pair.server_mac, kind="veth",
+                peer={"ifname": pair.client_dev, "address": pair.client_mac, "net_ns_fd": pair.client_ns},
+            )
+            # fmt: on
+            self.server_index = self.server.link_lookup(ifname=pair.server_dev)[0]
+            self.client_index = self.client.link_lookup(ifname=pair.client_dev)[0]
+
+            for ipr, index, address, peer_subnet, peer_ip, peer_mac in [
+                (self.server, self.server_index, pair.server_ip, pair.client_subnet, pair.client_ip, pair.client_mac),
+                (self.client, self.client_index, pair.client_ip, pair.server_subnet, pair.server_ip, pair.server_mac),
+            ]:  # fmt: skip
+                ipr.addr("add", index=index, address=address, prefixlen=24)
+                ipr.link("set", index=index, state="up")
+                ipr.route("add", dst=peer_subnet, oif=index)
+                # Hard-Code MAC Addresses to prevent ARP resolutions which may cause the processes to hang, especially with high packet loss rates
+                ipr.neigh("add", dst=peer_ip, lladdr=peer_mac, ifindex=index, state="permanent")
+                send_netem(ipr, index, *INITIAL_EMULATION, create=True)
+        except NetlinkError as error:
+            raise NetemError(f"netlink setup of {pair} failed: {error}") from error
+
+        # Disable TCP Segmentation Offload (TSO), GSO and GRO
+        # Note: ethtool is not namespace-aware in pyroute2, so this is the only process spawned per device
+        for namespace, device in [(pair.server_ns, pair.server_dev), (pair.client_ns, pair.client_dev)]:
+            ethtool_process = subprocess.run(
+                ["ip", "netns", "exec", namespace, "ethtool", "-K", device, "gso", "off", "gro", "off", "tso", "off"],
+                capture_output=True,
+            )  # fmt: skip
+            if ethtool_process.returncode != 0:
+                raise NetemError(
+                    f"disabling offloads of {device} failed: {ethtool_process.stderr.decode().strip()}"
+                )
+
+        self.verify(*INITIAL_EMULATION)
+        self.emulation = INITIAL_EMULATION
+        return
+
+    def apply(self, rate, delay, loss):
+        # Change the netem qdiscs of both veth ends and verify them before the cell starts
+        # Note: The ends are in different namespaces and changed one after the other, not atomically. A cell only
+        #       starts once both have been read back with the new parameters.
+        if self.emulation == (rate, delay, loss):
+            return
+        # Invalidate first, so that a failed change is never taken for the previous settings
+        self.emulation = None
+        try:
+            for ipr, index in [(self.server, self.server_index), (self.client, self.client_index)]:
+                send_netem(ipr, index, rate, delay, loss)
+        except NetlinkError as error:
+            raise NetemError(
+                f"changing netem of {self.pair} to {rate}mbit, {delay}ms, {loss}% failed: {error}"
+            ) from error
+        self.verify(rate, delay, loss)
+        self.emulation = (rate, delay, loss)
+        return
+
+    def read_back(self, ipr, index):
+        # Returns (rate in mbit/s, delay in ms, loss in %) of the root netem qdisc of a device
+        for qdisc in ipr.get_qdiscs(index=index):
+            if qdisc.get_attr("TCA_KIND") != "netem" or qdisc["parent"] != 0xFFFFFFFF:
+                continue
+            options = qdisc.get_attr("TCA_OPTIONS")
+            rate_options = options.get_attr("TCA_NETEM_RATE")
+            rate = rate_options["rate"] * 8 / 1e6 if rate_options else 0.0
+            delay = options["delay"] / TICKS_PER_USEC / 1000
+            loss = options["loss"] * 100 / (2**32 - 1)
+            return rate, delay, loss
+        return None
+
+    def verify(self, rate, delay, loss):
+        requested = (float(rate), float(delay), float(loss))
+        for ipr, index, device in [
+            (self.server, self.server_index, self.pair.server_dev),
+            (self.client, self.client_index, self.pair.client_dev),
+        ]:
+            applied = self.read_back(ipr, index)
+            if applied is None or not all(
+                math.isclose(a, r, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+                for a, r in zip(applied, requested)
+            ):
+                raise NetemError(
+                    f"netem of {device} in {self.pair} is {applied}, expected {requested} (rate, delay, loss)"
+                )
+        return
+
+    def cleanup(self):
+        # Deleting one end removes the whole veth pair, removing the namespaces removes their qdiscs and routes
+        for ipr in [self.server, self.client]:
+            if ipr is not None:
+                ipr.close()
+        self.server = None
+        self.client = None
+        for namespace in [self.pair.server_ns, self.pair.client_ns]:
+            if namespace in netns.listnetns():
+                netns.remove(namespace)
+        return
+
@@ -0,0 +1,347 @@
+##############################################################################################
+##      Title:          Streaming Per-Handshake Metrics of Traffic Recordings               ##
+##                                                                                          ##
+##      Description:    Reads pcap and pcapng captures packet by packet (tshark writes      ##
+##                      pcapng, even with a .pcap suffix) and extracts for every TLS        ##
+##                      handshake, i.e. every TCP connection of s_timer, the bytes and      ##
+##                      segments per direction, retransmissions, round trips and the size   ##
+##                      of the encrypted certificate flights. Only the TLS record headers   ##
+##                      are parsed, so no session secrets are needed.                       ##
+##############################################################################################
+
+import struct
+
+# Link-layer types of the captures
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+ETHERTYPE_IPV4 = 0x0800
+IPPROTO_TCP = 6
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# TLS record content types
+TLS_HANDSHAKE = 22
+TLS_APPLICATION_DATA = 23
+TLS_RECORD_HEADER = 5
+
+# Segments received out of order are buffered up to this size per direction
+MAX_OUT_OF_ORDER_BYTES = 16 * 1024 * 1024
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_SECTION_HEADER = b"\x0a\x0d\x0d\x0a"
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+PCAPNG_OPTION_TSRESOL = 9
+
+
+class CaptureError(Exception):
+    pass
+
+
+def read_exactly(file, size):
+    data = file.read(size)
+    if len(data) < size:
+        # A capture cut off by a terminated tshark ends with a partial packet, which is ignored
+        return None
+    return data
+
+
+def read_pcap(file, header):
+    # Yields (timestamp, linktype, frame) of a classic pcap file
+    endian, resolution = PCAP_MAGIC[header[:4]]
+    rest = read_exactly(file, 20)
+    if rest is None:
+        return
+    linktype = struct.unpack(endian + "I", rest[16:20])[0] & 0xFFFF
+    while (record := read_exactly(file, 16)) is not None:
+        seconds, fraction, captured, _ = struct.unpack(endian + "IIII", record)
+        frame = read_exactly(file, captured)
+        if frame is None:
+            return
+        yield seconds + fraction * resolution, linktype, frame
+
+
+def interface_resolution(options, endian):
+    # if_tsresol option of an interface description block, default is microseconds
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack(endian + "HH", options[offset : offset + 4])
+        if code == 0:
+            break
+        if code == PCAPNG_OPTION_TSRESOL and length >= 1:
+            value = options[offset + 4]
+            return 2 ** -(value & 0x7F) if value & 0x80 else 10 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def read_pcapng(file):
+    # Yields (timestamp, linktype, frame) of a pcapng file
+    endian = "<"
+    interfaces = []
+    while (block_header := read_exactly(file, 8)) is not None:
+        if block_header[:4] == PCAPNG_SECTION_HEADER:
+            # The byte-order magic of every section decides the endianness of its blocks
+            magic = read_exactly(file, 4)
+            if magic is None:
+                return
+            endian = "<" if magic == b"\x4d\x3c\x2b\x1a" else ">"
+            block_length = struct.unpack(endian + "I", block_header[4:8])[0]
+            if read_exactly(file, block_length - 12) is None:
+                return
+            interfaces = []
+            continue
+
+        block_type, block_length = struct.unpack(endian + "II", block_header)
+        if block_length < 12:
+            raise CaptureError(f"invalid pcapng block length {block_length}")
+        body = read_exactly(file, block_length - 8)
+        if body is None:
+            return
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+            linktype = struct.unpack(endian + "H", body[:2])[0]
+            interfaces.append((linktype, interface_resolution(body[8:-4], endian)))
+        elif block_type == PCAPNG_ENHANCED_PACKET:
+            interface, high, low, captured, _ = struct.unpack(endian + "IIIII", body[:20])
+            linktype, resolution = interfaces[interface]
+            yield ((high << 32) | low) * resolution, linktype, body[20 : 20 + captured]
+        elif block_type == PCAPNG_SIMPLE_PACKET:
+            # Simple packet blocks have no timestamp and belong to the first interface
+            linktype, _ = interfaces[0]
+            yield None, linktype, body[4:-4]
+
+
+def read_packets(path):
+    # Yields (timestamp in s, linktype, frame) of every packet in a pcap or pcapng file, without loading the file
+    with open(path, "rb") as file:
+        header = read_exactly(file, 4)
+        if header is None:
+            return
+        if header in PCAP_MAGIC:
+            yield from read_pcap(file, header)
+        elif header == PCAPNG_SECTION_HEADER:
+            file.seek(0)
+            yield from read_pcapng(file)
+        else:
+            raise CaptureError(f"{path} is neither a pcap nor a pcapng file")
+
+
+def tcp_segment(linktype, frame):
+    # Returns (source, destination, seq, flags, payload) of an IPv4/TCP frame, otherwise None
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 14
+        ethertype = struct.unpack("!H", frame[12:14])[0]
+    elif linktype == LINKTYPE_LINUX_SLL:
+        offset = 16
+        ethertype = struct.unpack("!H", frame[14:16])[0]
+    elif linktype == LINKTYPE_RAW:
+        offset = 0
+        ethertype = ETHERTYPE_IPV4
+    else:
+        raise CaptureError(f"unsupported link-layer type {linktype}")
+    if ethertype != ETHERTYPE_IPV4 or len(frame) < offset + 20:
+        return None
+
+    ip_header_length = (frame[offset] & 0x0F) * 4
+    total_length = struct.unpack("!H", frame[offset + 2 : offset + 4])[0]
+    if frame[offset + 9] != IPPROTO_TCP:
+        return None
+    source_ip, destination_ip = frame[offset + 12 : offset + 16], frame[offset + 16 : offset + 20]
+
+    tcp = offset + ip_header_length
+    source_port, destination_port, seq = struct.unpack("!HHI", frame[tcp : tcp + 8])
+    tcp_header_length = (frame[tcp + 12] >> 4) * 4
+    flags = frame[tcp + 13]
+    # The IP total length excludes the Ethernet padding of short frames
+    payload = frame[tcp + tcp_header_length : offset + total_length]
+    return (source_ip, source_port), (destination_ip, destination_port), seq, flags, payload
+
+
+class RecordStream:
+    # Reassembles one direction of a TCP connection and parses the headers of the TLS records in it.
+    # Record bodies are skipped, so only out-of-order segments are kept in memory.
+    # Note: Offsets are relative to the initial sequence number, a handshake never wraps around 2^32 bytes
+
+    def __init__(self, isn):
+        self.base = (isn + 1) & 0xFFFFFFFF
+        self.next_offset = 0
+        self.highest_end = 0
+        self.out_of_order = {}
+        self.header = b""
+        self.header_packet = None
+        self.body_left = 0
+        # (content type, record length, index of the packet with the first byte of the record header)
+        self.records = []
+
+    def add(self, seq, payload, packet_index):
+        # Returns True if the segment carries data which was sent before, i.e. it is a retransmission
+        # Note: In the capture of the receiver, the original of a retransmission is missing if netem dropped it,
+        # but the retransmission still arrives after data with higher sequence numbers
+        start = (seq - self.base) & 0xFFFFFFFF
+        if start >= 0x80000000:
+            # Sequence number before the first byte (e.g. a retransmitted SYN with data)
+            return True
+        end = start + len(payload)
+        retransmission = start < self.highest_end
+        self.highest_end = max(self.highest_end, end)
+
+        if end <= self.next_offset:
+            return retransmission
+        if start > self.next_offset:
+            if sum(len(data) for data in self.out_of_order.values()) < MAX_OUT_OF_ORDER_BYTES:
+                if len(payload) > len(self.out_of_order.get(start, b"")):
+                    self.out_of_order[start] = payload
+            return retransmission
+        self.parse(payload[self.next_offset - start :], packet_index)
+
+        # Continue with the buffered segments which are in order now
+        while ready := [offset for offset in self.out_of_order if offset <= self.next_offset]:
+            for offset in ready:
+                data = self.out_of_order.pop(offset)
+                if offset + len(data) > self.next_offset:
+                    self.parse(data[self.next_offset - offset :], packet_index)
+        return retransmission
+
+    def parse(self, data, packet_index):
+        self.next_offset += len(data)
+        while data:
+            if self.body_left:
+                skipped = min(self.body_left, len(data))
+                self.body_left -= skipped
+                data = data[skipped:]
+                continue
+            missing = TLS_RECORD_HEADER - len(self.header)
+            if not self.header:
+                self.header_packet = packet_index
+            self.header += data[:missing]
+            data = data[missing:]
+            if len(self.header) == TLS_RECORD_HEADER:
+                content_type, _, length = struct.unpack("!BHH", self.header)
+                self.records.append((content_type, length, self.header_packet))
+                self.header = b""
+                self.body_left = length
+        return
+
+
+class Handshake:
+    # Packets of one TCP connection of s_timer, i.e. one TLS handshake, in the order of the capture
+    # Direction 0 is client to server, 1 server to client
+
+    def __init__(self, isn):
+        self.isn = isn
+        self.segments = [0, 0]
+        self.wire_bytes = [0, 0]
+        self.retransmissions = 0
+        self.syn_seen = False
+        self.streams = [RecordStream(isn), None]
+        # Packets with which the server answered the client (SYN-ACK or the first data after a client flight)
+        self.responses = []
+        self.waiting = True
+
+    def add(self, packet_index, direction, seq, flags, payload, frame_length):
+        self.segments[direction] += 1
+        self.wire_bytes[direction] += frame_length
+        if flags & TCP_SYN:
+            if direction == 0:
+                # A SYN with the same ISN is a retransmission
+                self.retransmissions += self.syn_seen
+                self.syn_seen = True
+            elif self.streams[1] is not None:
+                self.retransmissions += 1
+            else:
+                self.streams[1] = RecordStream(seq)
+                self.respond(packet_index)
+            return
+        stream = self.streams[direction]
+        if not payload or stream is None:
+            return
+        retransmission = stream.add(seq, payload, packet_index)
+        self.retransmissions += retransmission
+        if direction == 1:
+            self.respond(packet_index)
+        elif not retransmission:
+            self.waiting = True
+        return
+
+    def respond(self, packet_index):
+        if self.waiting:
+            self.responses.append(packet_index)
+            self.waiting = False
+        return
+
+    def metrics(self):
+        # In TLS 1.3 everything after ServerHello is encrypted, so the flights are told apart by the order of
+        # the records: the certificate flight of the server are the encrypted records before the client sends
+        # its first encrypted record (Certificate, CertificateVerify and Finished of the client), which ends
+        # the handshake. Data after it (e.g. NewSessionTickets) is not part of the handshake.
+        client_records = self.streams[0].records
+        server_records = self.streams[1].records if self.streams[1] else []
+        client_flight = next(
+            (index for kind, _, index in client_records if kind == TLS_APPLICATION_DATA), None
+        )
+        handshake_end = float("inf") if client_flight is None else client_flight
+        server_after = min(
+            (index for kind, _, index in server_records if kind == TLS_APPLICATION_DATA and index > handshake_end),
+            default=float("inf"),
+        )  # fmt: skip
+        return {
+            "complete": client_flight is not None,
+            "client_bytes": self.wire_bytes[0],
+            "server_bytes": self.wire_bytes[1],
+            "client_segments": self.segments[0],
+            "server_segments": self.segments[1],
+            "retransmissions": self.retransmissions,
+            "round_trips": sum(index < handshake_end for index in self.responses),
+            "server_flight_bytes": sum(
+                TLS_RECORD_HEADER + length
+                for kind, length, index in server_records
+                if kind == TLS_APPLICATION_DATA and index < handshake_end
+            ),
+            "client_flight_bytes": sum(
+                TLS_RECORD_HEADER + length
+                for kind, length, index in client_records
+                if kind == TLS_APPLICATION_DATA and handshake_end <= index < server_after
+            ),
+        }
+
+
+def analyse_capture(path):
+    # Returns the metrics of every handshake in the capture, in the order in which the connections were opened
+    connections = {}
+    handshakes = []
+    for packet_index, (_, linktype, frame) in enumerate(read_packets(path)):
+        segment = tcp_segment(linktype, frame)
+        if segment is None:
+            continue
+        source, destination, seq, flags, payload = segment
+
+        if (source, destination) in connections:
+            direction, key = 0, (source, destination)
+        elif (destination, source) in connections:
+            direction, key = 1, (destination, source)
+        else:
+            direction, key = 0, (source, destination)
+        handshake = connections.get(key)
+
+        # A SYN with a new ISN opens a new connection, even if the ports are reused
+        if flags & TCP_SYN and not flags & TCP_ACK and (handshake is None or handshake.isn != seq):
+            handshake = Handshake(seq)
+            connections[key] = handshake
+            handshakes.append(handshake)
+            direction = 0
+        if handshake is None:
+            # Connection opened before the capture started
+            continue
+        handshake.add(packet_index, direction, seq, flags, payload, len(frame))
+    return [handshake.metrics() for handshake in handshakes]
@@ -0,0 +1,185 @@
+##############################################################################################
+##      Title:          PKI Builder for the Benchmark Runners                               ##
+##                                                                                          ##
+##      Description:    Sets up the PKI of a signature algorithm (Root CA, Intermediate CA, ##
+##                      server and client certificate) with the openssl CLI, and builds     ##
+##                      the PKIs of several algorithms concurrently. Every PKI writes its   ##
+##                      own log, and a failing algorithm does not stop the others.          ##
+##                      If tls-client/pki_builder is built, the whole chain is generated    ##
+##                      in that single process instead of one openssl call per step.        ##
+##############################################################################################
+
+import os
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+SUBJECT_PREFIX = "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
+
+# Name of the log file in the directory of every PKI
+LOG_FILE_NAME = "pki-setup.log"
+
+# Single-process PKI builder (make -C tls-client pki_builder), used if it exists
+PKI_BUILDER_BINARY = Path(__file__).resolve().parent.parent / "tls-client" / "pki_builder"
+
+# Validity of the certificates in days
+VALIDITY_DAYS = {"ca": 7300, "ica": 3650, "end_entity": 365}
+
+
+class PkiError(Exception):
+    def __init__(self, alg, step, log_path):
+        super().__init__(f"{step} setup of {alg} PKI failed, see {log_path}")
+        self.alg = alg
+        self.step = step
+        self.log_path = log_path
+
+
+def common_name(alg):
+    # ECDSA algorithms are named after the curve, e.g. ECDSAprime256v1
+    return alg[5:] if alg.startswith("ECDSA") else alg
+
+
+def key_command(alg, key, config):
+    # Note: ECDSA and RSA need additional arguments than EdDSA and PQC
+    if alg.startswith("ECDSA"):
+        return ["openssl", "ecparam", "-name", alg[5:], "-genkey", "-out", key]
+    if alg.startswith("RSA"):
+        # fmt: off
+        return ["openssl", "genpkey", "-algorithm", alg[:3], "-pkeyopt", f"rsa_keygen_bits:{alg[4:]}", "-out", key, "-config", config]
+        # fmt: on
+    return ["openssl", "genpkey", "-algorithm", alg, "-out", key, "-config", config]
+
+
+def write_config(template, config, path):
+    # Copy the config template, but set the real CA path
+    with open(template, "rt") as template_config:
+        with open(config, "wt") as new_config:
+            for line in template_config:
+                new_config.write(line.replace("{path}", str(path)))
+    return
+
+
+def init_ca_dir(path):
+    # Create the sub-directory of a CA and init the serial-number and index files
+    path.mkdir()
+    with open(path / "serial", "a") as serial_file:
+        serial_file.write("1000")
+    Path(path / "index.txt").touch()
+    return
+
+
+def build_pki(alg, pki_path, rca_template, ica_template, config_root=None, native=None):
+    # Sets up the PKI of alg in pki_path (which must not exist yet):
+    #   ca/ca.crt, ica/ica.crt, server/server.{crt,key}, client/client.{crt,key} and the CA configs
+    # If config_root is set, the CA configs point to config_root/ca and config_root/ica afterwards
+    # (e.g. the path of the PKI inside a container). Raises PkiError if a step fails.
+    # native selects the single-process builder (None: use it if it is built, otherwise the openssl CLI)
+    if native is None:
+        native = os.access(PKI_BUILDER_BINARY, os.X_OK)
+    pki_path = Path(pki_path)
+    pki_path.mkdir()
+    ca_config = pki_path / "oqs-openssl-ca.cnf"
+    ica_config = pki_path / "oqs-openssl-ica.cnf"
+    log_path = pki_path / LOG_FILE_NAME
+
+    ca_path = pki_path / "ca"
+    init_ca_dir(ca_path)
+    write_config(rca_template, ca_config, ca_path)
+    ica_path = pki_path / "ica"
+    init_ca_dir(ica_path)
+    write_config(ica_template, ica_config, ica_path)
+
+    with open(log_path, "w", encoding="utf-8") as log:
+
+        def run(step, command):
+            log.write(f"$ {shlex.join(str(arg) for arg in command)}\n")
+            process = subprocess.run(command, capture_output=True, text=True)
+            log.write(process.stdout + process.stderr)
+            log.flush()
+            if process.returncode != 0:
+                raise PkiError(alg, step, log_path)
+            return
+
+        if native:
+            # The builder loads the provider and both configs once and writes the same layout as the steps below
+            # fmt: off
+            run("PKI builder", [
+                PKI_BUILDER_BINARY, f"--rca-config={ca_config}", f"--ica-config={ica_config}",
+                f"--ca-days={VALIDITY_DAYS['ca']}", f"--ica-days={VALIDITY_DAYS['ica']}",
+                f"--ee-days={VALIDITY_DAYS['end_entity']}", alg, pki_path
+            ])
+            # fmt: on
+        else:
+            run_cli_steps(alg, pki_path, ca_config, ica_config, run)
+
+    if config_root is not None:
+        write_config(rca_template, ca_config, f"{config_root}/ca")
+        write_config(ica_template, ica_config, f"{config_root}/ica")
+    return
+
+
+def run_cli_steps(alg, pki_path, ca_config, ica_config, run):
+    # Sets up the chain with one openssl CLI call per key, CSR and certificate
+    ca_path = pki_path / "ca"
+    # Create CA key and certificate
+    subject = SUBJECT_PREFIX + common_name(alg) + " - Test Root CA"
+    if alg.startswith("ECDSA"):
+        new_key = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:" + alg[5:]]
+    else:
+        new_key = ["-newkey", alg]
+    # fmt: off
+    run("CA", [
+        "openssl", "req", "-x509", "-new", "-sha256", *new_key, "-keyout", ca_path / "ca.key",
+        "-out", ca_path / "ca.crt", "-nodes", "-subj", subject, "-days", str(VALIDITY_DAYS["ca"]),
+        "-extensions", "v3_ca", "-config", ca_config
+    ])
+    # fmt: on
+
+    # Create Intermediate-CA, server and client key, CSR and certificate
+    # fmt: off
+    for step, name, subject_suffix, extensions, days, signer_config in [
+        ("ICA", "ica", " - Test Intermediate CA", "v3_intermediate_ca", VALIDITY_DAYS["ica"], ca_config),
+        ("server certificate", "server", " - Server Certificate", "server_cert", VALIDITY_DAYS["end_entity"], ica_config),
+        ("client certificate", "client", " - Client Certificate", "server_cert", VALIDITY_DAYS["end_entity"], ica_config),
+    ]:
+        path = pki_path / name
+        path.mkdir(exist_ok=True)
+        key, csr, cert = path / f"{name}.key", path / f"{name}.csr", path / f"{name}.crt"
+        subject = SUBJECT_PREFIX + common_name(alg) + subject_suffix
+
+        run(step, key_command(alg, key, ica_config))
+        run(step, ["openssl", "req", "-new", "-sha256", "-key", key, "-out", csr, "-subj", subject, "-config", ica_config])
+        run(step, [
+            "openssl", "ca", "-extensions", extensions, "-md", "sha256", "-batch",
+            "-in", csr, "-out", cert, "-days", str(days), "-config", signer_config
+        ])
+    # fmt: on
+    return
+
+
+def build_pkis(jobs, workers=None, on_done=None, build=build_pki):
+    # Builds several PKIs concurrently. jobs maps an algorithm to the keyword arguments of build
+    # (build_pki or e.g. PkiCache.materialize). The work happens in the openssl processes, so a thread
+    # per PKI is enough to use all cores.
+    # on_done(alg, result, error) is called in the calling thread as soon as a PKI is finished
+    # (result is the return value of build, error is None on success).
+    # Returns the errors of the failed algorithms.
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(build, alg, **arguments): alg
+            for alg, arguments in jobs.items()
+        }
+        for future in as_completed(futures):
+            alg = futures[future]
+            result = None
+            error = None
+            try:
+                result = future.result()
+            except (PkiError, OSError) as exception:
+                error = exception
+                errors[alg] = error
+            if on_done:
+                on_done(alg, result, error)
+    return errors
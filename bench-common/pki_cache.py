@@ -0,0 +1,177 @@
+##############################################################################################
+##      Title:          Content-Addressed PKI Cache                                         ##
+##                                                                                          ##
+##      Description:    Keeps the PKIs built by pki_builder.py in a cache directory, keyed  ##
+##                      by algorithm, config templates, validity and the versions of        ##
+##                      OpenSSL and its providers. Runs link (or copy) the cached PKIs      ##
+##                      into their output directory instead of building them again, so     ##
+##                      repeated runs use identical key material.                           ##
+##############################################################################################
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+from pki_builder import LOG_FILE_NAME, VALIDITY_DAYS, PkiError, build_pki, write_config
+
+# Default cache directory
+DEFAULT_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "pqc-tls-tests" / "pki"
+)
+
+# Version of the layout of the cached PKIs, increase to invalidate all entries
+CACHE_FORMAT = 1
+
+# File in a PKI directory with the cache key it was created from
+KEY_FILE_NAME = "pki-cache.key"
+
+# Files which have to exist in a complete PKI
+PKI_FILES = [
+    "ca/ca.crt",
+    "ica/ica.crt",
+    "server/server.crt",
+    "server/server.key",
+    "client/client.crt",
+    "client/client.key",
+]
+
+# Cached PKIs whose certificates expire within this time are built again
+MIN_REMAINING_VALIDITY_DAYS = 30
+
+# PKI states as returned by PkiCache.state()
+PKI_CURRENT = "current"
+PKI_CACHED = "cached"
+PKI_MISSING = "missing"
+
+
+def pki_complete(pki_path):
+    return all((Path(pki_path) / file_path).is_file() for file_path in PKI_FILES)
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def link_or_copy(source, destination):
+    # Hard links keep the cache and the runs on the same key material without copying it
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+    return destination
+
+
+class PkiCache:
+    # Entries are only published complete (built in a temporary directory and renamed), so that
+    # parallel builds and interrupted runs never leave a partial PKI in the cache.
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # The OpenSSL and provider versions (e.g. of the oqs-provider) are part of every key
+        self.versions = {}
+        for name, command in [
+            ("openssl", ["openssl", "version", "-a"]),
+            ("providers", ["openssl", "list", "-providers", "-verbose"]),
+        ]:
+            process = subprocess.run(command, capture_output=True, text=True)
+            self.versions[name] = process.stdout.strip()
+
+    def key(self, alg, rca_template, ica_template):
+        material = {
+            "format": CACHE_FORMAT,
+            "alg": alg,
+            "rca_template": file_hash(rca_template),
+            "ica_template": file_hash(ica_template),
+            "validity_days": VALIDITY_DAYS,
+            "versions": self.versions,
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    def entry_path(self, pki_path, key):
+        return self.cache_dir / f"{Path(pki_path).name}-{key[:16]}"
+
+    def entry_valid(self, entry):
+        if not pki_complete(entry):
+            return False
+        # The end-entity certificates have the shortest validity
+        for cert in ["server/server.crt", "client/client.crt"]:
+            process = subprocess.run(
+                ["openssl", "x509", "-checkend", str(MIN_REMAINING_VALIDITY_DAYS * 86400), "-noout", "-in", entry / cert],
+                capture_output=True,
+            )  # fmt: skip
+            if process.returncode != 0:
+                return False
+        return True
+
+    def pki_key(self, pki_path):
+        # Returns the cache key the PKI in pki_path was created from, or None
+        key_file = Path(pki_path) / KEY_FILE_NAME
+        return key_file.read_text().strip() if key_file.is_file() else None
+
+    def state(self, alg, pki_path, rca_template, ica_template):
+        # Whether the PKI in pki_path is up to date, can be taken from the cache or has to be built
+        key = self.key(alg, rca_template, ica_template)
+        if self.pki_key(pki_path) == key and pki_complete(pki_path):
+            return PKI_CURRENT
+        if self.entry_valid(self.entry_path(pki_path, key)):
+            return PKI_CACHED
+        return PKI_MISSING
+
+    def materialize(self, alg, pki_path, rca_template, ica_template, config_root=None):
+        # Provides the PKI of alg in pki_path and returns its state before (see state())
+        # An outdated PKI in pki_path is replaced without asking, as it can always be recreated from the cache
+        # If config_root is set, the CA configs point to config_root/ca and config_root/ica (see build_pki)
+        key = self.key(alg, rca_template, ica_template)
+        pki_path = Path(pki_path)
+        state = self.state(alg, pki_path, rca_template, ica_template)
+        if state == PKI_CURRENT:
+            return state
+
+        entry = self.entry_path(pki_path, key)
+        if state == PKI_MISSING:
+            self.build_entry(alg, entry, rca_template, ica_template)
+
+        if pki_path.exists():
+            shutil.rmtree(pki_path)
+        shutil.copytree(entry, pki_path, copy_function=link_or_copy)
+
+        # The configs contain the path of the PKI, so they are written again instead of linked
+        ca_config = pki_path / "oqs-openssl-ca.cnf"
+        ica_config = pki_path / "oqs-openssl-ica.cnf"
+        ca_config.unlink()
+        ica_config.unlink()
+        write_config(rca_template, ca_config, f"{config_root}/ca" if config_root else pki_path / "ca")
+        write_config(ica_template, ica_config, f"{config_root}/ica" if config_root else pki_path / "ica")
+        (pki_path / KEY_FILE_NAME).write_text(key + "\n")
+        return state
+
+    def build_entry(self, alg, entry, rca_template, ica_template):
+        tmp_entry = entry.with_name(f".{entry.name}.{os.getpid()}.{threading.get_ident()}")
+        if tmp_entry.exists():
+            shutil.rmtree(tmp_entry)
+        try:
+            build_pki(alg, tmp_entry, rca_template, ica_template)
+        except PkiError as error:
+            # Keep the log of the failed build next to the cache entry
+            log_path = entry.with_name(entry.name + ".log")
+            shutil.copy2(tmp_entry / LOG_FILE_NAME, log_path)
+            shutil.rmtree(tmp_entry)
+            raise PkiError(alg, error.step, log_path) from error
+
+        # An expired entry is replaced, an entry published in the meantime by another run is kept
+        if entry.exists() and not self.entry_valid(entry):
+            shutil.rmtree(entry)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            shutil.rmtree(tmp_entry)
+            if not self.entry_valid(entry):
+                raise
+        return
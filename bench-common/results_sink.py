@@ -0,0 +1,156 @@
+##############################################################################################
+##      Title:          Results Sink for the Benchmark Runners                              ##
+##                                                                                          ##
+##      Description:    Keeps a results file open and writes the measurements in batches.   ##
+##                      Pending rows are flushed and fsync'ed at checkpoints (per cell or   ##
+##                      every N rows) and a manifest is written atomically once the run     ##
+##                      has completed.                                                      ##
+##############################################################################################
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# Checkpoint mode in which the runner decides when to checkpoint (e.g. after every cell or algorithm)
+CHECKPOINT_PER_CELL = "cell"
+
+
+def parse_checkpoint(value):
+    # Argument type for the "-checkpoint" option of the runners: "cell" or a number of rows
+    if value == CHECKPOINT_PER_CELL:
+        return value
+    try:
+        rows = int(value)
+    except ValueError:
+        rows = 0
+    if rows < 1:
+        raise ValueError(f"invalid checkpoint {value}, use 'cell' or a number of rows")
+    return rows
+
+
+class ResultsSink:
+    # Rows are collected in memory and only written to the (permanently open) results file at a checkpoint.
+    # With checkpoint=N, a checkpoint is taken automatically every N rows, with checkpoint="cell" whenever
+    # the runner completes a cell. All methods are thread-safe, so parallel workers can share a sink.
+
+    def __init__(self, path, header=None, checkpoint=CHECKPOINT_PER_CELL):
+        self.path = Path(path)
+        self.checkpoint_rows = 0 if checkpoint == CHECKPOINT_PER_CELL else checkpoint
+        self.lock = threading.Lock()
+        self.pending = []
+        self.on_durable = []
+        self.rows = 0
+        self.checkpoints = 0
+        self.started = datetime.now()
+
+        self.file = open(self.path, "a", encoding="utf-8")
+        # Only write the header into a new file, an existing file is continued
+        if header is not None and self.file.tell() == 0:
+            self.file.write(header + "\n")
+            self.sync()
+
+    def write_line(self, line):
+        self.write_lines([line])
+        return
+
+    def write_row(self, fields):
+        self.write_rows([fields])
+        return
+
+    def write_rows(self, rows, on_durable=None):
+        self.write_lines(
+            [",".join(str(field) for field in fields) for fields in rows], on_durable
+        )
+        return
+
+    def write_lines(self, lines, on_durable=None):
+        # All lines of one call end up next to each other in the file, even with parallel writers
+        # on_durable is called with the size of the file once the lines are synced to disk
+        with self.lock:
+            self.pending.extend(line + "\n" for line in lines)
+            if on_durable is not None:
+                self.on_durable.append(on_durable)
+            self.rows += len(lines)
+            if self.checkpoint_rows and len(self.pending) >= self.checkpoint_rows:
+                self.flush_pending()
+        return
+
+    def checkpoint(self):
+        with self.lock:
+            self.flush_pending()
+        return
+
+    def cell_completed(self):
+        # In per-cell mode every completed cell is a checkpoint, otherwise the rows stay pending until N are collected
+        if not self.checkpoint_rows:
+            self.checkpoint()
+        return
+
+    def flush_pending(self):
+        # Note: Caller must hold the lock
+        if self.pending:
+            self.file.writelines(self.pending)
+            self.pending.clear()
+        self.sync()
+        self.checkpoints += 1
+
+        size = self.file.tell()
+        for callback in self.on_durable:
+            callback(size)
+        self.on_durable.clear()
+        return
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return
+
+    def close(self):
+        # Write the last rows and close the file, e.g. when a run is aborted
+        with self.lock:
+            if not self.file.closed:
+                self.flush_pending()
+                self.file.close()
+        return
+
+    def finish(self, summary=None):
+        # Close the file and publish the manifest of the completed run
+        self.close()
+
+        manifest = {
+            "results_file": self.path.name,
+            "rows": self.rows,
+            "bytes": self.path.stat().st_size,
+            "checkpoints": self.checkpoints,
+            "started": self.started.isoformat(timespec="seconds"),
+            "completed": datetime.now().isoformat(timespec="seconds"),
+        }
+        if summary:
+            manifest.update(summary)
+        write_json_atomic(self.manifest_path(), manifest)
+        return
+
+    def manifest_path(self):
+        return self.path.with_name(self.path.stem + ".manifest.json")
+
+
+def write_json_atomic(path, data):
+    # Write to a temporary file first and rename it, so that readers never see a partially written file
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+        json.dump(data, tmp_file, indent=2)
+        tmp_file.write("\n")
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+    # Persist the rename itself
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return
@@ -0,0 +1,111 @@
+##############################################################################################
+##      Title:          Streaming Reader of the s_timer Output                              ##
+##                                                                                          ##
+##      Description:    Reads the output of a running s_timer line by line: the OpenSSL     ##
+##                      version and provider status, followed by one record per handshake   ##
+##                      as soon as it is done. The handshakes of a batch that is killed     ##
+##                      on a timeout are therefore not lost.                                ##
+##############################################################################################
+
+import queue
+import re
+import threading
+
+# Output line of a single handshake: measurement:success, with --resumption followed by the kind of the handshake
+# (full, psk_dhe, psk or early_data), with --cert-comp by the message sizes, with --cpu-stats by the CPU usage and with
+# --phases by the phase durations
+# Note: If the connection was unsuccessful (success=0), a value of -1.0ms is returned as measurement
+RECORD_PATTERN = re.compile(
+    r"^-?\d+\.\d+:[01](:[a-z_]+)?(:[a-z]+(/\d+){6})?(:-?\d+\.\d+/-?\d+/-?\d+)?(:-?\d+\.\d+(;-?\d+\.\d+)*)?$"
+)
+
+# Message sizes of a handshake with --cert-comp, in the order of the record (algorithm of the server certificate,
+# sizes of the Certificate messages as sent and uncompressed, bytes received and sent until the handshake is done)
+CERT_COMP_FIELDS = [
+    "server_cert_comp",
+    "server_cert_bytes",
+    "server_cert_uncompressed_bytes",
+    "client_cert_bytes",
+    "client_cert_uncompressed_bytes",
+    "received_bytes",
+    "sent_bytes",
+]
+
+# CPU usage of the client thread during a handshake with --cpu-stats (CPU time in ms, cycles and instructions in user
+# space, -1 if s_timer may not use perf_event_open)
+CPU_FIELDS = ["cpu_ms", "cycles", "instructions"]
+
+# Number of lines s_timer prints before the first handshake (OpenSSL version and provider status)
+HEADER_LINES = 2
+
+
+class StimerTimeout(Exception):
+    def __init__(self, timeout):
+        super().__init__(f"no output of s_timer within {timeout:.1f}s")
+        self.timeout = timeout
+
+
+def parse_record(line):
+    # Returns (measurement, success, handshake type, message sizes, CPU usage, phases) of a handshake as strings, or
+    # None if line is no record
+    # The handshake type is None if s_timer was run without --resumption, the message sizes (see CERT_COMP_FIELDS)
+    # are an empty list without --cert-comp and the CPU usage (see CPU_FIELDS) without --cpu-stats
+    if not RECORD_PATTERN.match(line):
+        return None
+    measurement, success, *fields = line.split(":")
+    handshake_type = fields.pop(0) if fields and "/" not in fields[0] and fields[0][0].isalpha() else None
+    message_sizes = fields.pop(0).split("/") if fields and "/" in fields[0] and fields[0][0].isalpha() else []
+    cpu_usage = fields.pop(0).split("/") if fields and "/" in fields[0] else []
+    return measurement, success, handshake_type, message_sizes, cpu_usage, fields[0].split(";") if fields else []
+
+
+class StimerOutput:
+    # Drains stdout of an s_timer process in its own thread and hands the lines over as they arrive.
+    # Lines which are neither header nor record (e.g. the "Load:" summary) are kept in other_lines.
+
+    def __init__(self, stream):
+        self.lines = queue.Queue()
+        self.other_lines = []
+        self.ended = False
+        self.thread = threading.Thread(target=self.drain, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def drain(self, stream):
+        for line in iter(stream.readline, b""):
+            self.lines.put(bytes.decode(line, "utf-8", errors="replace").rstrip())
+        stream.close()
+        # End of the output
+        self.lines.put(None)
+        return
+
+    def next_line(self, timeout):
+        # Returns the next line, None once s_timer has ended, raises StimerTimeout after timeout seconds
+        if self.ended:
+            return None
+        try:
+            line = self.lines.get(timeout=timeout)
+        except queue.Empty:
+            raise StimerTimeout(timeout) from None
+        self.ended = line is None
+        return line
+
+    def read_header(self, timeout=None):
+        # Returns the header lines, fewer if s_timer ended before printing them
+        header = []
+        while len(header) < HEADER_LINES:
+            line = self.next_line(timeout)
+            if line is None:
+                break
+            header.append(line)
+        return header
+
+    def records(self, timeout=None):
+        # Yields (measurement, success, handshake type, message sizes, CPU usage, phases) of every handshake until s_timer ends
+        # Every record has to arrive within timeout seconds of the previous one (None waits forever)
+        while (line := self.next_line(timeout)) is not None:
+            record = parse_record(line)
+            if record is None:
+                self.other_lines.append(line)
+                continue
+            yield record
+        return
@@ -0,0 +1,155 @@
+##############################################################################################
+##      Title:          Reader of the Binary s_timer Records                                ##
+##                                                                                          ##
+##      Description:    Maps the fixed-width records written by s_timer --binary-out into   ##
+##                      NumPy structured arrays without parsing or copying them, and        ##
+##                      derives the handshake and phase durations from the nanosecond       ##
+##                      timestamps. Files of version 1 (without message sizes) and 2        ##
+##                      (without CPU usage) are read as well.                               ##
+##                                                                                          ##
+##      Prerequisites:                                                                      ##
+##                      - numpy installed.                                                  ##
+##############################################################################################
+
+import numpy as np
+
+# Identification of the binary output of s_timer (see struct binary_header in s_timer.c)
+MAGIC = b"STIMERB"
+FORMAT_VERSION = 3
+
+# Phases of a handshake, in the order of the phase columns of s_timer --phases
+PHASES = ["connect", "server_hello", "certificate", "certificate_verify", "finished"]
+
+# Kinds of handshakes, indexed by the type field of a record (see enum handshake_type in s_timer.c)
+HANDSHAKE_TYPES = ["full", "psk_dhe", "psk", "early_data"]
+
+# Certificate compression algorithms, indexed by the server_cert_comp field of a record (RFC 8879 code points)
+CERT_COMP_ALGORITHMS = ["none", "zlib", "brotli", "zstd"]
+
+HEADER_FIELDS = [
+    ("magic", "S8"),
+    ("version", "u4"),
+    ("record_size", "u4"),
+    ("phase_count", "u4"),
+    ("reserved", "u4"),
+]
+
+# Times in ns since the start of the run, phase ends in ns since the start of the handshake (-1 if not reached)
+# Version 2 adds the message sizes of s_timer --cert-comp (all 0 without it or for failed handshakes)
+# Version 3 adds the CPU time of the client thread in ns and its cycles and instructions of s_timer --cpu-stats
+# (all -1 without it, the counters also if perf_event_open is not permitted)
+RECORD_FIELDS = {
+    1: [
+        ("round", "u8"),
+        ("start_ns", "i8"),
+        ("end_ns", "i8"),
+        ("status", "i4"),
+        ("type", "i4"),
+        ("phase_end_ns", "i8", (len(PHASES),)),
+    ],
+}
+RECORD_FIELDS[2] = RECORD_FIELDS[1] + [
+    ("server_cert_comp", "i4"),
+    ("server_cert_bytes", "u4"),
+    ("server_cert_uncompressed_bytes", "u4"),
+    ("client_cert_bytes", "u4"),
+    ("client_cert_uncompressed_bytes", "u4"),
+    ("reserved", "u4"),
+    ("received_bytes", "u8"),
+    ("sent_bytes", "u8"),
+]
+RECORD_FIELDS[3] = RECORD_FIELDS[2] + [
+    ("cpu_ns", "i8"),
+    ("cycles", "i8"),
+    ("instructions", "i8"),
+]
+
+
+class RecordFormatError(Exception):
+    pass
+
+
+def dtypes(byte_order, version=FORMAT_VERSION):
+    header = np.dtype([(name, byte_order + kind) for name, kind in HEADER_FIELDS])
+    record = np.dtype(
+        [(name, byte_order + kind, *shape) for name, kind, *shape in RECORD_FIELDS[version]]
+    )
+    return header, record
+
+
+def record_dtype(header_bytes):
+    # Checks the header of a binary output and returns its record dtype
+    # s_timer writes in host byte order, which is detected from the version field
+    for byte_order in ["<", ">"]:
+        header_dtype = dtypes(byte_order)[0]
+        if len(header_bytes) < header_dtype.itemsize:
+            raise RecordFormatError("incomplete header")
+        header = np.frombuffer(header_bytes, dtype=header_dtype, count=1)[0]
+        if header["version"] in RECORD_FIELDS:
+            dtype = dtypes(byte_order, int(header["version"]))[1]
+            break
+    else:
+        raise RecordFormatError("unknown format version")
+
+    if header["magic"] != MAGIC:
+        raise RecordFormatError("not an s_timer binary output")
+    if header["record_size"] != dtype.itemsize or header["phase_count"] != len(PHASES):
+        raise RecordFormatError(
+            f"records of {header['record_size']} bytes with {header['phase_count']} phases, "
+            f"expected {dtype.itemsize} bytes with {len(PHASES)} phases"
+        )
+    return dtype
+
+
+def parse_records(buffer):
+    # Returns a structured array viewing the records in buffer (e.g. the bytes read from a pipe)
+    # A record cut off at the end (s_timer killed while writing) is left out
+    header_size = dtypes("<")[0].itemsize
+    dtype = record_dtype(bytes(buffer[:header_size]))
+    count = (len(buffer) - header_size) // dtype.itemsize
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=header_size)
+
+
+def read_records(path):
+    # Returns a read-only structured array mapping the records of a binary output file
+    header_size = dtypes("<")[0].itemsize
+    with open(path, "rb") as records_file:
+        dtype = record_dtype(records_file.read(header_size))
+        records_file.seek(0, 2)
+        count = (records_file.tell() - header_size) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(count,))
+
+
+def handshake_times_ms(records):
+    # Handshake durations in ms, -1.0 for unsuccessful handshakes (as in the text output)
+    durations = (records["end_ns"] - records["start_ns"]) / 1e6
+    return np.where(records["status"] == 1, durations, -1.0)
+
+
+def phase_times_ms(records):
+    # Duration of every phase since the end of the previous one in ms (as with --phases),
+    # -1.0 for phases which were not reached
+    phase_ends = records["phase_end_ns"]
+    durations = np.full(phase_ends.shape, -1.0)
+    previous_end = np.zeros(len(records), dtype=np.int64)
+    for phase in range(len(PHASES)):
+        reached = phase_ends[:, phase] >= 0
+        durations[reached, phase] = (phase_ends[reached, phase] - previous_end[reached]) / 1e6
+        previous_end = np.where(reached, phase_ends[:, phase], previous_end)
+    return durations
+
+
+def certificate_compression_ratio(records):
+    # Size of the server Certificate message as sent relative to its uncompressed size, NaN without sizes
+    sent = records["server_cert_bytes"].astype(float)
+    uncompressed = records["server_cert_uncompressed_bytes"].astype(float)
+    return np.divide(sent, uncompressed, out=np.full(len(records), np.nan), where=uncompressed > 0)
+
+
+def instructions_per_cycle(records):
+    # Instructions per cycle of the client thread during every handshake, NaN without counters
+    cycles = records["cycles"].astype(float)
+    instructions = records["instructions"].astype(float)
+    return np.divide(instructions, cycles, out=np.full(len(records), np.nan), where=cycles > 0)
@@ -0,0 +1,182 @@
+##############################################################################################
+##      Title:          Traffic Recording Analysis of the Emulated Benchmark                ##
+##                                                                                          ##
+##      Description:    Extracts per-handshake wire metrics (bytes and TCP segments per     ##
+##                      direction, retransmissions, round trips and the size of the         ##
+##                      certificate flights) from the server and client captures of a       ##
+##                      benchmark run with -rec, and joins them to its results file by      ##
+##                      cell and test round. The captures are streamed in parallel.         ##
+##############################################################################################
+
+import argparse
+import csv
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from termcolor import cprint
+
+# Shared helpers of the benchmark runners
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench-common"))
+from pcap_metrics import CaptureError, analyse_capture  # noqa: E402
+
+# Name of the captures written by run-bench_emulated-nw-assessmnt.py
+# Note: Algorithm names can contain "_" (e.g. p256_dilithium2), therefore the name is matched from the end
+CAPTURE_NAME = re.compile(
+    r"^(?P<side>server|client)-(?P<alg>.+)_Rate-(?P<rate>[^_]+)_Delay-(?P<delay>[^_]+)_Loss-(?P<loss>[^_]+)"
+    r"_(?P<timestamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.pcap$"
+)
+
+# Columns added to the columns of the results file
+METRIC_COLUMNS = {
+    "Capture": "side",
+    "Client Bytes": "client_bytes",
+    "Server Bytes": "server_bytes",
+    "Client Segments": "client_segments",
+    "Server Segments": "server_segments",
+    "Retransmissions": "retransmissions",
+    "Round Trips": "round_trips",
+    "Server Certificate Flight [bytes]": "server_flight_bytes",
+    "Client Certificate Flight [bytes]": "client_flight_bytes",
+    "Handshake Captured": "complete",
+}
+
+
+def print_error(msg, **kwargs):
+    cprint(msg, "light_red", attrs=["bold"], file=sys.stderr, **kwargs)
+
+
+def print_info(msg, **kwargs):
+    cprint(msg, "blue", file=sys.stdout, **kwargs)
+
+
+def print_warning(msg, **kwargs):
+    cprint(msg, "light_yellow", file=sys.stdout, **kwargs)
+
+
+def print_success(msg, **kwargs):
+    cprint(msg, "light_green", file=sys.stdout, **kwargs)
+
+
+def cell_key(algname, rate, delay, loss):
+    # Algorithm names as in the file names (without ":") and the emulation parameters as numbers
+    return algname.replace(":", ""), float(rate), float(delay), float(loss)
+
+
+def find_captures(recordings_path):
+    # Returns the captures per (side, cell), the latest one if a cell was recorded more than once (e.g. resumed)
+    captures = {}
+    for path in sorted(recordings_path.glob("*.pcap")):
+        match = CAPTURE_NAME.match(path.name)
+        if not match:
+            continue
+        key = (match["side"], cell_key(match["alg"], match["rate"], match["delay"], match["loss"]))
+        if key not in captures or captures[key][0] < match["timestamp"]:
+            captures[key] = (match["timestamp"], path)
+    return {key: path for key, (_, path) in captures.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="PQC TLS Traffic Analysis",
+        description="Per-handshake wire metrics (bytes and TCP segments per direction, retransmissions, round trips and certificate flights) of the traffic recordings of an emulated benchmark run, joined to the rows of its results file.",
+    )
+    parser.add_argument(
+        "-results",
+        help="path to the results file of the run",
+        metavar="<file path>",
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        "-recordings",
+        help="path to the traffic recordings of the run (default: traffic-recordings next to the results file)",
+        metavar="<dir path>",
+        type=Path,
+        required=False,
+    )
+    parser.add_argument(
+        "-out",
+        help="path of the joined output file (default: <results file>_traffic.csv)",
+        metavar="<file path>",
+        type=Path,
+        required=False,
+    )
+    parser.add_argument(
+        "-workers",
+        help="number of captures analysed in parallel, default is the number of CPU cores",
+        metavar="INT",
+        type=int,
+        required=False,
+    )
+    args = parser.parse_args()
+
+    recordings_path = args.recordings or args.results.parent / "traffic-recordings"
+    out_path = args.out or args.results.with_name(f"{args.results.stem}_traffic.csv")
+    if not args.results.is_file():
+        print_error(f"ERROR: Results file {args.results} does not exist. Aborting.")
+        sys.exit(-1)
+    if not recordings_path.is_dir():
+        print_error(f"ERROR: Directory {recordings_path} does not exist. Aborting.")
+        sys.exit(-1)
+
+    captures = find_captures(recordings_path)
+    if not captures:
+        print_error(f"ERROR: No traffic recordings found in {recordings_path}. Aborting.")
+        sys.exit(-1)
+
+    # Number of rounds per cell in the results file, to check that every handshake of a capture has its row
+    with open(args.results, newline="") as results_file:
+        rounds = Counter(
+            cell_key(row["Signature Algorithm"], row["Rate Limit"], row["Delay"], row["Packet Loss"])
+            for row in csv.DictReader(results_file)
+        )
+
+    # The captures are parsed packet by packet, every process analyses one capture at a time
+    print_info(
+        f"INFO: Analysing {len(captures)} captures with up to {args.workers or os.cpu_count()} in parallel."
+    )
+    handshakes = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(analyse_capture, path): key for key, path in captures.items()}
+        for future in as_completed(futures):
+            side, cell = futures[future]
+            try:
+                metrics = future.result()
+            except (CaptureError, OSError) as error:
+                print_warning(f"WARNING: Skipping {captures[side, cell].name}: {error}.")
+                continue
+            # Handshakes of chunks which were retried after a timeout cannot be assigned to a round
+            if len(metrics) != rounds[cell]:
+                print_warning(
+                    f"WARNING: Skipping {captures[side, cell].name}: {len(metrics)} handshakes captured, "
+                    f"but {rounds[cell]} rounds in the results."
+                )
+                continue
+            handshakes[side, cell] = metrics
+
+    # Join the metrics to the rows of the results file, the n-th connection of a capture is the n-th row of its cell
+    # (not test round n, which starts again for every key exchange group and cipher suite of a cell)
+    joined_rows = 0
+    cell_rows = Counter()
+    with open(args.results, newline="") as results_file, open(out_path, "w", newline="") as out_file:
+        results = csv.DictReader(results_file)
+        writer = csv.writer(out_file)
+        writer.writerow(results.fieldnames + list(METRIC_COLUMNS))
+        for row in results:
+            cell = cell_key(row["Signature Algorithm"], row["Rate Limit"], row["Delay"], row["Packet Loss"])
+            index = cell_rows[cell]
+            cell_rows[cell] += 1
+            for side in ["client", "server"]:
+                if (side, cell) not in handshakes:
+                    continue
+                metrics = dict(handshakes[side, cell][index], side=side)
+                metrics["complete"] = int(metrics["complete"])
+                writer.writerow(list(row.values()) + [metrics[name] for name in METRIC_COLUMNS.values()])
+                joined_rows += 1
+
+    print_success(f"SUCCESS: {joined_rows} handshakes written to {out_path}.")
+    sys.exit(0)
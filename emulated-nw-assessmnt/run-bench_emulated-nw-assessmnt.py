@@ -14,20 +14,39 @@
 ##############################################################################################
 
 import argparse
+import collections
+import itertools
+import os
+import queue
 import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
 from termcolor import colored, cprint
 
+# Shared helpers of the benchmark runners
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench-common"))
+from adaptive_sampling import STOP_FIXED, AdaptiveSampler, parse_statistics  # noqa: E402
+from campaign_manifest import create_campaign_manifest, load_campaign_manifest  # noqa: E402
+from campaign_plan import CampaignFileError, load_campaign_file, plan_cells  # noqa: E402
+from handshake_timeouts import HandshakeTimeoutModel  # noqa: E402
+from netem_control import MAX_NETEM_RATE, NetemError, NetlinkController, netlink_available  # noqa: E402
+from pki_builder import build_pkis  # noqa: E402
+from pki_cache import PKI_CACHED, PKI_CURRENT, PKI_MISSING, PkiCache, pki_complete  # noqa: E402
+from results_sink import CHECKPOINT_PER_CELL, ResultsSink, parse_checkpoint  # noqa: E402
+from stimer_output import StimerOutput, StimerTimeout  # noqa: E402
+
 CWD = Path.cwd()
 
 # Path to s_timer binary
 STIMER_BINARY = CWD / "tls-client" / "s_timer"
+# Path to the benchmark server, which replaces s_server with -server bench_server (make -C tls-client bench_server)
+BENCH_SERVER_BINARY = CWD / "tls-client" / "bench_server"
 # Path to namespace setup script
 NSPACE_SETUP = CWD / "virt-test-env" / "namespace-setup.sh"
 # Path to namespace cleanup script
@@ -39,15 +58,74 @@ OSSL_RCA_CONFIG = CWD / "emulated-nw-assessmnt" / "oqs-openssl-rca.cnf"
 # Path to OpenSSL ICA config file
 OSSL_ICA_CONFIG = CWD / "emulated-nw-assessmnt" / "oqs-openssl-ica.cnf"
 
+# Maximum number of namespace pairs (-parallel), the pair index is an octet of their subnets and MAC addresses
+MAX_PARALLEL_PAIRS = 256
+
 # Sample size per iteration
 # Note: The number of rounds provided as argument to this script is split up in SAMPLE_SIZE chunks.
-SAMPLE_SIZE = 1
-
-# Maximum duration in seconds for a single handshake (used for timeout)
-MAX_HS_DUR = 1
+#       s_timer prints every handshake as soon as it is done, so a timeout only repeats the unfinished rounds of a chunk.
+SAMPLE_SIZE = 100
+
+# Number of times the timeout is doubled and the unfinished rounds of a chunk repeated, before they are recorded as failed
+# Note: The timeout of a single handshake is computed per cell from delay, loss and the observed durations (see handshake_timeouts.py)
+MAX_TIMEOUT_RETRIES = 4
+
+# Columns of the handshake phases measured by s_timer with -phases (durations since the end of the previous phase)
+PHASE_COLUMNS = ["Connect [ms]", "ServerHello [ms]", "Certificate [ms]", "CertificateVerify [ms]", "Finished [ms]"]
+
+# Columns of the message sizes measured by s_timer with -cert-comp (algorithm of the server certificate, sizes of the
+# Certificate messages as sent and uncompressed, bytes received and sent by the client until the handshake is done)
+CERT_COMP_COLUMNS = [
+    "Certificate Compression",
+    "Server Certificate [B]",
+    "Server Certificate Uncompressed [B]",
+    "Client Certificate [B]",
+    "Client Certificate Uncompressed [B]",
+    "Received [B]",
+    "Sent [B]",
+]
+
+# Columns of the CPU usage of the client thread measured by s_timer with -cpu-stats (user space cycles and instructions
+# are -1 where perf_event_open is not permitted, e.g. in a container or with a restrictive perf_event_paranoid)
+CPU_COLUMNS = ["Client CPU [ms]", "Cycles", "Instructions"]
+
+# Certificate compression algorithms of OpenSSL 3.2 (RFC 8879), which ones are available depends on the build
+CERT_COMP_ALGORITHMS = ["zlib", "brotli", "zstd"]
+
+# Options of s_server for the session resumption modes of s_timer (-resumption)
+# Note: Without -early_data, the server issues tickets without early data, and without -allow_no_dhe_kex it
+#       always resumes with (EC)DHE. Which kind of handshake was negotiated is recorded per row.
+RESUMPTION_SERVER_OPTIONS = {
+    "psk-dhe": [],
+    "psk": ["-allow_no_dhe_kex"],
+    "early-data": ["-early_data"],
+}
+
+# Port on which the TLS server listens inside its namespace
+TLS_PORT = 4433
+
+# Maximum time in seconds to wait for s_server to listen and for tshark to capture, before aborting
+SERVER_READY_TIMEOUT = 5
+CAPTURE_READY_TIMEOUT = 10
+
+# Time in seconds given to tshark on top of the emulated delay, to capture the last in-flight packets of a cell
+CAPTURE_STOP_GRACE = 0.1
+
+# Roles of the processes of a namespace pair, which can be pinned to their own CPU cores
+PROCESS_ROLES = ["server", "client", "capture"]
+
+# Scheduling priorities for the server and client processes (-priority), as command prefix
+PRIORITY_COMMANDS = {
+    "nice": ["nice", "-n", "-10"],
+    "realtime": ["chrt", "--fifo", "50"],
+}
+
+# Number of consecutive client timeouts after which a still running TLS server is considered stuck and restarted
+SERVER_RESTART_AFTER_TIMEOUTS = 3
 
 # List of the traditional algorithms used for reference
 # Uncomment if an algorithm should be included in the test
+# Note: This list and the values below are the defaults, a campaign file (-campaign) replaces them
 TRADITIONAL_SIG_ALGS = []
 # TRADITIONAL_SIG_ALGS.append("ED448")
 TRADITIONAL_SIG_ALGS.append("ED25519")
@@ -62,6 +140,13 @@ RATE_VALUES = [10000.0]
 DELAY_VALUES = [0.0, 5.0, 10.0]  # , 5.0, 50.0]
 LOSS_VALUES = [0, 0.05, 0.1, 0.15]  # , 0.1, 1.0]
 
+# Key exchange group and TLS 1.3 cipher suite of s_timer, used for the other list if only -groups or -ciphersuites
+# (or only one of them in the [tls] section of a campaign file) is given
+# Note: Classical groups (e.g. "x25519"), pure ML-KEM/Kyber levels (e.g. "kyber512", "kyber1024") and hybrids
+#       (e.g. "p384_kyber768") can be combined, as long as the oqs-provider offers them
+KEX_GROUPS = ["x25519_kyber768"]
+CIPHER_SUITES = ["TLS_AES_256_GCM_SHA384"]
+
 
 def print_error(msg, **kwargs):
     cprint(msg, "light_red", attrs=["bold"], file=sys.stderr, **kwargs)
@@ -79,533 +164,739 @@ def print_success(msg, **kwargs):
     cprint(msg, "light_green", file=sys.stdout, **kwargs)
 
 
-def run_benchmark_test(retry):
-    # Prepare file paths
-    ca_cert = pki_path / "ca" / "ca.crt"
-    ica_cert = pki_path / "ica" / "ica.crt"
-    server_cert = pki_path / "server" / "server.crt"
-    server_key = pki_path / "server" / "server.key"
-    client_cert = pki_path / "client" / "client.crt"
-    client_key = pki_path / "client" / "client.key"
-
-    # If record flag is set, prepare Wireshark file for traffic dump
-    if record_traffic:
-        traffic_recordings_file_name_server = (
-            wireshark_folder_path
-            / f"server-{algname}_Rate-{rate}_Delay-{delay}_Loss-{loss}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.pcap"
-        )
-        Path(traffic_recordings_file_name_server).touch()
-
-        traffic_recordings_file_name_client = (
-            wireshark_folder_path
-            / f"client-{algname}_Rate-{rate}_Delay-{delay}_Loss-{loss}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.pcap"
-        )
-        Path(traffic_recordings_file_name_client).touch()
-
-        # Prepare tls session secrets file for later traffic decryption in Wireshark
-        session_secrets_file_name = (
-            wireshark_folder_path
-            / f"{algname}_Rate-{rate}_Delay-{delay}_Loss-{loss}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.secrets"
-        )
-        Path(session_secrets_file_name).touch()
-
-        # Give "others" write permissions to recording file, otherwise tshark cannot record traffic (if the file is in a user's home-dir)
-        Path.chmod(traffic_recordings_file_name_server, 0o666)
-        Path.chmod(traffic_recordings_file_name_client, 0o666)
+class OutputWatcher:
+    # Drains the output of a background process in its own thread, so that the pipe never fills up,
+    # and signals as soon as a line containing ready_text has been seen (e.g. "ACCEPT" of s_server).
+    # The last lines are kept for error messages.
 
-        # Start wireshark process in namespace ns1 (server)
-        # Note: Use Popen, as the process needs to run in background
-        # fmt: off
-        wireshark_server = subprocess.Popen(
-            ["sudo", "ip", "netns", "exec", "ns1", "tshark", "-i", "veth1", "-w", traffic_recordings_file_name_server],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+    def __init__(self, stream, ready_text):
+        self.ready = threading.Event()
+        self.last_lines = collections.deque(maxlen=20)
+        self.thread = threading.Thread(
+            target=self.drain, args=(stream, ready_text), daemon=True
         )
-        # fmt: on
-
-        # Wait for wireshark to start
-        time.sleep(2)
-
-        if wireshark_server is None:
-            print_error(
-                "ERROR: Failure during start of wireshark for server. Aborting."
+        self.thread.start()
+
+    def drain(self, stream, ready_text):
+        for line in iter(stream.readline, b""):
+            text = bytes.decode(line, "utf-8", errors="replace").rstrip()
+            self.last_lines.append(text)
+            if ready_text in text:
+                self.ready.set()
+        stream.close()
+        return
+
+    def wait_until_ready(self, process, timeout):
+        # Block until the ready text was seen, the process died or the deadline has passed
+        deadline = time.monotonic() + timeout
+        while not self.ready.wait(timeout=0.01):
+            if process.poll() is not None or time.monotonic() > deadline:
+                return False
+        return process.poll() is None
+
+
+class TestbedPair:
+    # One isolated pair of network namespaces (server and client) connected by a veth pair.
+    # Pair 0 uses the original names (ns1/ns2, veth1/veth2, 10.5.0.1/10.6.0.1), further pairs
+    # get a "-p<index>" suffix and their own subnets 10.5.<index>.0/24 and 10.6.<index>.0/24.
+    # placement maps each process role (server, client, capture) to the CPU cores it is pinned to,
+    # roles without cores are not pinned. priority is a key of PRIORITY_COMMANDS or None.
+    # If netlink is set, namespaces and netem qdiscs are configured in-process instead of with ip/tc.
+
+    def __init__(self, index, placement=None, priority=None, netlink=False):
+        suffix = "" if index == 0 else f"-p{index}"
+        self.index = index
+        self.server_ns = f"ns1{suffix}"
+        self.client_ns = f"ns2{suffix}"
+        self.server_dev = f"veth1{suffix}"
+        self.client_dev = f"veth2{suffix}"
+        self.server_ip = f"10.5.{index}.1"
+        self.client_ip = f"10.6.{index}.1"
+        self.server_subnet = f"10.5.{index}.0/24"
+        self.client_subnet = f"10.6.{index}.0/24"
+        self.server_mac = f"00:00:00:00:{index:02x}:01"
+        self.client_mac = f"00:00:00:00:{index:02x}:02"
+        self.placement = placement or {}
+        self.priority = priority
+        self.netlink = NetlinkController(self) if netlink else None
+
+    def netns_exec(self, namespace, env=None, role=None):
+        # Command prefix to run a process in the given namespace (pinned to the cores of its role)
+        command = ["sudo"]
+        if env:
+            command += env
+        command += ["ip", "netns", "exec", namespace]
+        if self.priority and role in ["server", "client"]:
+            command += PRIORITY_COMMANDS[self.priority]
+        if self.placement.get(role):
+            command += ["taskset", "-c", ",".join(str(cpu) for cpu in self.placement[role])]
+        return command
+
+    def __str__(self):
+        return f"{self.server_ns}/{self.client_ns}"
+
+
+class TlsServerManager:
+    # Keeps a single long-lived s_server in the server namespace of a pair for the PKI currently under test.
+    # The server is shared by all rate/delay/loss cells and rounds of an algorithm and is
+    # only (re)started if the PKI changes, the process died or it stopped answering.
+
+    def __init__(self, pair):
+        self.pair = pair
+        self.process = None
+        self.output = None
+        self.pki_path = None
+        self.records_path = None
+        self.consecutive_timeouts = 0
+        self.starts = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ensure_running(self, pki_path, algname):
+        if self.pki_path == pki_path and self.is_alive():
+            if self.consecutive_timeouts < SERVER_RESTART_AFTER_TIMEOUTS:
+                return
+            print_warning(
+                f"WARNING: TLS server for {algname} did not answer {self.consecutive_timeouts} times in a row. Restarting it."
             )
-            sys.exit(-1)
-
-        # Start wireshark process in namespace ns2 (client)
-        # Note: Use Popen, as the process needs to run in background
-        # fmt: off
-        wireshark_client = subprocess.Popen(
-            ["sudo", "ip", "netns", "exec", "ns2", "tshark", "-i", "veth2", "-w", traffic_recordings_file_name_client],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        # fmt: on
-
-        # Wait for wireshark to start
-        time.sleep(2)
-
-        if wireshark_client is None:
-            print_error(
-                "ERROR: Failure during start of wireshark for client. Aborting."
+        elif self.pki_path == pki_path and self.process is not None:
+            print_warning(
+                f"WARNING: TLS server for {algname} died (exit code {self.process.returncode}). Restarting it."
             )
-            sys.exit(-1)
-
-    # Split in SAMPLE_SIZE-chunks of rounds to fail faster and repeat the execution if TIMEOUT is reached
-    open_rounds = rounds
-    output_iterator = 1
-
-    while open_rounds > 0:
-
-        if open_rounds - SAMPLE_SIZE >= 0:
-            # Another full SAMPLE_SIZE-rounds chunk to go
-            run_rounds = SAMPLE_SIZE
-            open_rounds -= SAMPLE_SIZE
+            print("\n".join(self.output.last_lines))
+
+        self.stop()
+        self.start(pki_path, algname)
+        return
+
+    def start(self, pki_path, algname):
+        server_cert = pki_path / "server" / "server.crt"
+        server_key = pki_path / "server" / "server.key"
+        ca_cert = pki_path / "ca" / "ca.crt"
+        ica_cert = pki_path / "ica" / "ica.crt"
+
+        # The benchmark server takes the options of s_server and records the server CPU time of every handshake
+        # Note: As the server lives across cells, one records file per server start holds the handshakes of all its
+        #       cells, which are told apart by the accept times (see the started_ns/finished_ns of the cells)
+        if tls_server_program == "bench_server":
+            self.records_path = (
+                server_records_folder_path
+                / f"{algname}_{self.pair.server_ns}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.csv"
+            )
+            server_command = [BENCH_SERVER_BINARY, "-records", self.records_path]
         else:
-            # Run a last time with the left-over rounds to go
-            run_rounds = open_rounds
-            open_rounds = 0
+            self.records_path = None
+            server_command = ["openssl", "s_server"]
 
-        # Start s_server process in namespace ns1
+        # Note: The output is drained by an OutputWatcher, as a pipe that is never read fills up and blocks a long-lived server
         if record_traffic:
+            # Prepare tls session secrets file for later traffic decryption in Wireshark
+            # Note: As the server lives across cells, one secrets file per algorithm holds the keys of all its recordings
+            session_secrets_file_name = (
+                wireshark_folder_path
+                / f"{algname}_{self.pair.server_ns}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.secrets"
+            )
+            Path(session_secrets_file_name).touch()
+
             # fmt: off
-            tls_server = subprocess.Popen(
-                [
-                    "sudo", f"OPENSSL_CONF={OSSL_CONFIG}", "ip", "netns", "exec", "ns1", "openssl", "s_server", "-cert",
+            self.process = subprocess.Popen(
+                self.pair.netns_exec(self.pair.server_ns, [f"OPENSSL_CONF={OSSL_CONFIG}"], "server") + [
+                    *server_command, "-accept", str(TLS_PORT), "-cert",
                     server_cert, "-key", server_key, "-tls1_3", "-Verify", "2", "-verify_return_error", "-CAfile",
-                    ca_cert, "-chainCAfile", ica_cert, "-ignore_unexpected_eof", "-keylogfile", session_secrets_file_name
+                    ca_cert, "-chainCAfile", ica_cert, "-ignore_unexpected_eof", "-keylogfile", session_secrets_file_name,
+                    *(RESUMPTION_SERVER_OPTIONS[resumption["mode"]] if resumption else []),
+                    *(["-cert_comp"] if cert_comp and cert_comp != "none" else []),
+                    *tls_server_options
                 ],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
             )
             # fmt: on
         else:
             # fmt: off
-            tls_server = subprocess.Popen(
-                [
-                    "sudo", f"OPENSSL_CONF={OSSL_CONFIG}", "ip", "netns", "exec", "ns1", "openssl", "s_server", "-cert",
+            self.process = subprocess.Popen(
+                self.pair.netns_exec(self.pair.server_ns, [f"OPENSSL_CONF={OSSL_CONFIG}"], "server") + [
+                    *server_command, "-accept", str(TLS_PORT), "-cert",
                     server_cert, "-key", server_key, "-tls1_3", "-verify", "2", "-verify_return_error", "-CAfile",
-                    ca_cert, "-chainCAfile", ica_cert, "-ignore_unexpected_eof"
+                    ca_cert, "-chainCAfile", ica_cert, "-ignore_unexpected_eof",
+                    *(RESUMPTION_SERVER_OPTIONS[resumption["mode"]] if resumption else []),
+                    *(["-cert_comp"] if cert_comp and cert_comp != "none" else []),
+                    *tls_server_options
                 ],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
             )
             # fmt: on
 
-        # Wait for server to start
-        time.sleep(0.2)
-
-        # Check if process start was successful
-        if tls_server is None:
+        # Wait until the server listens, s_server and bench_server print "ACCEPT" as soon as their socket is bound
+        self.output = OutputWatcher(self.process.stdout, "ACCEPT")
+        if not self.output.wait_until_ready(self.process, SERVER_READY_TIMEOUT):
+            print("\n".join(self.output.last_lines))
             print_error("ERROR: Failure during start of TLS server. Aborting.")
+            self.stop()
             sys.exit(-1)
 
-        # Start s_timer process in namespace ns2
+        self.pki_path = pki_path
+        self.consecutive_timeouts = 0
+        self.starts += 1
+        return
+
+    def stop(self):
+        if self.is_alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        self.output = None
+        self.pki_path = None
+        return
+
+    def report_success(self):
+        self.consecutive_timeouts = 0
+        return
+
+    def report_timeout(self):
+        # A single-threaded s_server can get stuck on a half-open connection of a killed client
+        self.consecutive_timeouts += 1
+        return
+
+
+def run_tls_config(pair, tls_server, alg, algname, rate, delay, loss, group, ciphersuite, cell_rows):
+    # Measures the handshakes of one TLS configuration of a cell and appends their rows to cell_rows
+    # group and ciphersuite are None for the defaults of s_timer (campaigns without TLS configurations)
+    pki_path = out_dir / f"pki-{algname}"
+    ca_cert = pki_path / "ca" / "ca.crt"
+    ica_cert = pki_path / "ica" / "ica.crt"
+    client_cert = pki_path / "client" / "client.crt"
+    client_key = pki_path / "client" / "client.key"
+
+    tls_values = [group, ciphersuite] if tls_columns else []
+    tls_info = f" ({group}, {ciphersuite})" if tls_columns else ""
+
+    # In adaptive mode, every TLS configuration starts with its minimum number of rounds and is extended until the
+    # sampler stops it
+    if adaptive:
+        sampler = AdaptiveSampler(
+            adaptive["statistics"],
+            adaptive["ci_width"],
+            adaptive["confidence"],
+            adaptive["min_rounds"],
+            adaptive["max_rounds"],
+        )
+        open_rounds = sampler.next_rounds(0)
+        max_rounds = adaptive["max_rounds"]
+    else:
+        sampler = None
+        open_rounds = rounds
+        max_rounds = rounds
+
+    # Split in SAMPLE_SIZE-chunks of rounds to fail faster and repeat the execution if TIMEOUT is reached
+    output_iterator = 1
+    # Number of timeouts of the TLS configuration and of the current chunk (for the backoff)
+    config_timeouts = 0
+    chunk_timeouts = 0
+
+    while open_rounds > 0:
+
+        if open_rounds - SAMPLE_SIZE >= 0:
+            # Another full SAMPLE_SIZE-rounds chunk to go
+            run_rounds = SAMPLE_SIZE
+            open_rounds -= SAMPLE_SIZE
+        else:
+            # Run a last time with the left-over rounds to go
+            run_rounds = open_rounds
+            open_rounds = 0
+
+        # Make sure the long-lived s_server for this PKI is up (only (re)started if not running or dead)
+        tls_server.ensure_running(pki_path, algname)
+
+        # Start s_timer process in the client namespace
         # fmt: off
         tls_client = subprocess.Popen(
-            [
-                "sudo", "ip", "netns", "exec", "ns2", STIMER_BINARY, "-h", "10.5.0.1:4433",
+            pair.netns_exec(pair.client_ns, role="client") + [
+                STIMER_BINARY, "-h", f"{pair.server_ip}:{TLS_PORT}",
                 "-r", str(run_rounds), f"--cert={client_cert}", f"--key={client_key}",
-                f"--rootcert={ca_cert}", f"--chaincert={ica_cert}", f"--config={OSSL_CONFIG}"
+                f"--rootcert={ca_cert}", f"--chaincert={ica_cert}", f"--config={OSSL_CONFIG}",
+                *(["--phases"] if measure_phases else []),
+                *([f"--resumption={resumption["mode"]}", f"--resumption-ratio={resumption["ratio"]}"] if resumption else []),
+                *([f"--groups={group}", f"--ciphersuites={ciphersuite}"] if group else []),
+                *([f"--cert-comp={cert_comp}"] if cert_comp else []),
+                *(["--cpu-stats"] if cpu_stats else [])
             ],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
         # fmt: on
 
-        # It is assumed that no more than MAX_HS_DUR seconds per handshake are required.
-        timeout = MAX_HS_DUR * run_rounds
-
-        try:
-            tls_client.wait(timeout=timeout)
-        except subprocess.TimeoutExpired:
-            print_error(
-                f"ERROR: Timeout reached for {alg} with rate of {rate}, {delay}ms delay and {loss}% packet loss. Repeating the test."
-            )
-            # End all processes
-            tls_server.terminate()
-            tls_client.terminate()
-
-            # Adding up the failed rounds and start again
-            open_rounds += run_rounds
-            continue
+        # Note: Both pipes are drained while s_timer runs, as a full pipe would block a long chunk
+        stimer = StimerOutput(tls_client.stdout)
+        stimer_errors = OutputWatcher(tls_client.stderr, "Unrecoverable OpenSSL error")
 
-        # Save output line by line in array
-        s_time_output = bytes.decode(tls_client.stdout.read(), "utf-8").splitlines()
+        # The timeout of every handshake depends on the conditions of the cell and is doubled each time the chunk
+        # timed out, so that slow handshakes in the tail are measured instead of being discarded
+        timeout = timeout_model.per_handshake(alg, rate, delay, loss) * 2**chunk_timeouts
 
-        # Check that OpenSSL >= 3.2.0 was used
-        # Note: s_timer outputs the OpenSSL version in the first output line
+        # The rows of the handshakes are taken over as soon as s_timer prints them
+        finished_rounds = 0
+        try:
+            s_time_header = stimer.read_header(timeout)
+
+            # Check that OpenSSL >= 3.2.0 was used
+            # Note: s_timer outputs the OpenSSL version in the first output line
+            if s_time_header:
+                openssl_version = extract_openssl_version(s_time_header[0])
+                if openssl_version is None or openssl_version < [3, 2, 0]:
+                    # Correct version string not found, abort
+                    tls_client.terminate()
+                    print_error("ERROR: Wrong OpenSSL version in s_timer. Aborting.")
+                    sys.exit(-1)
 
-        openssl_version = extract_openssl_version(s_time_output[0])
-        if openssl_version < [3, 2, 0]:
-            # Correct version string not found, abort
-            print_error("ERROR: Wrong OpenSSL version in s_timer. Aborting.")
-            sys.exit(-1)
-        else:
             # Check if provider could be loaded successfully
             # Note: s_timer output if provider load was successful on the second line
-            if s_time_output[1].find("provider loaded successfully") < 0:
+            if len(s_time_header) > 1 and s_time_header[1].find("provider loaded successfully") < 0:
                 # Provider not found
+                tls_client.terminate()
                 print_error("ERROR: OQS-Provider in s_timer not loaded. Aborting.")
                 sys.exit(-1)
-            else:
-                # Provider loaded successfully, print results
-                for result in s_time_output[-1].split(","):
-                    # s_timer outputs results as pairs of measurement:success (float:bool)
-                    # Note: If connection was unsuccessful (success=false), a value of -1.0ms is returned as measurement
-                    measurement, success = result.split(":")
-                    with open(results_file_name, "a") as results_file:
-                        results_file.write(
-                            f"{alg},{output_iterator},{rate},{delay},{loss},{success},{measurement}\n"
-                        )
-                    output_iterator = output_iterator + 1
-
-                print_success(
-                    f"SUCCESS: (Round {rounds - open_rounds:{len(str(rounds))}}). {alg}, {rate}mbit, {delay}ms delay, {loss}% packet loss."
+
+            # s_timer outputs one record per handshake (measurement:success, with -resumption followed by the kind of
+            # the handshake, with -cert-comp by the message sizes, with -cpu-stats by the CPU usage and with --phases by
+            # the phases)
+            for measurement, success, handshake_type, message_sizes, cpu_usage, phases in stimer.records(timeout):
+                handshake_types = [handshake_type] if resumption else []
+                cell_rows.append(
+                    [alg, output_iterator, rate, delay, loss, *tls_values, success, measurement, *handshake_types]
+                    + message_sizes
+                    + cpu_usage
+                    + phases
                 )
+                output_iterator = output_iterator + 1
+                finished_rounds += 1
+                if success == "1":
+                    timeout_model.observe(alg, rate, delay, loss, float(measurement))
+                    if sampler:
+                        sampler.add(float(measurement))
+            tls_client.wait()
+            timed_out = False
+        except StimerTimeout:
+            # End the client process, the server stays alive unless it seems to hang
+            tls_client.terminate()
+            tls_client.wait()
+            tls_server.report_timeout()
+            timed_out = True
+
+        unfinished_rounds = run_rounds - finished_rounds
+        if unfinished_rounds > 0:
+            if timed_out:
+                config_timeouts += 1
+            else:
+                print("\n".join(stimer_errors.last_lines))
+            chunk_timeouts += 1
+            reason = f"Timeout of {timeout:.1f}s reached" if timed_out else f"s_timer ended after {finished_rounds} of {run_rounds} rounds"
 
-        # Terminate TLS server process
-        tls_server.terminate()
+            if chunk_timeouts <= MAX_TIMEOUT_RETRIES:
+                print_error(
+                    f"ERROR: {reason} for {alg}{tls_info} with rate of {rate}, {delay}ms delay and {loss}% packet loss{pair_info(pair)}. Repeating the {unfinished_rounds} unfinished round(s)."
+                )
+                # Only the unfinished rounds of this chunk are repeated, the rows of the finished handshakes are kept
+                open_rounds += unfinished_rounds
+                continue
 
-        # End of while loop
+            # Give up on the chunk, but keep its handshakes in the results as failed (like s_timer does for failed connections)
+            print_error(
+                f"ERROR: {alg}{tls_info} with rate of {rate}, {delay}ms delay and {loss}% packet loss did not finish {chunk_timeouts} times{pair_info(pair)}. Recording {unfinished_rounds} round(s) as failed."
+            )
+            for _ in range(unfinished_rounds):
+                failed_phases = ["-1.0"] * len(PHASE_COLUMNS) if measure_phases else []
+                # The kind, the message sizes and the CPU usage of a handshake which did not finish are unknown
+                handshake_types = [""] if resumption else []
+                failed_sizes = [""] * len(CERT_COMP_COLUMNS) if cert_comp else []
+                failed_cpu = [""] * len(CPU_COLUMNS) if cpu_stats else []
+                cell_rows.append(
+                    [alg, output_iterator, rate, delay, loss, *tls_values, "0", "-1.0", *handshake_types]
+                    + failed_sizes
+                    + failed_cpu
+                    + failed_phases
+                )
+                output_iterator = output_iterator + 1
+            chunk_timeouts = 0
+            if sampler and open_rounds == 0:
+                open_rounds = sampler.next_rounds(output_iterator - 1)
+            continue
 
-    if record_traffic:
-        time.sleep(2)
-        wireshark_server.terminate()
-        wireshark_client.terminate()
+        chunk_timeouts = 0
+        print_success(
+            f"SUCCESS: (Round {output_iterator - 1:{len(str(max_rounds))}}). {alg}{tls_info}, {rate}mbit, {delay}ms delay, {loss}% packet loss{pair_info(pair)}."
+        )
+        tls_server.report_success()
 
-    return
+        # In adaptive mode, ask the sampler whether more rounds are needed
+        if sampler and open_rounds == 0:
+            open_rounds = sampler.next_rounds(output_iterator - 1)
 
+        # End of while loop
 
-def pki_setup(alg, algname, out_dir):
-    # Prepare parent directory for algorithm specific PKI
-    pki_path = out_dir / f"pki-{algname}"
-    create_dir(pki_path)
-    ca_config = pki_path / "oqs-openssl-ca.cnf"
-    ica_config = pki_path / "oqs-openssl-ica.cnf"
-
-    # Create sub-directory for CA, prepare file paths, create and init serial-number file
-    ca_path = pki_path / "ca"
-    create_dir(ca_path)
-    ca_cert = ca_path / "ca.crt"
-    ca_key = ca_path / "ca.key"
-    with open(ca_path / "serial", "a") as serial_file:
-        serial_file.write("1000")
-    Path(ca_path / "index.txt").touch()
-    # Copy CA config, but set real CA path
-    with open(OSSL_RCA_CONFIG, "rt") as template_config:
-        with open(ca_config, "wt") as new_config:
-            for line in template_config:
-                new_config.write(line.replace("{path}", str(ca_path)))
-
-    # Create sub-directory for ICA, prepare file paths, create and init serial-number file
-    ica_path = pki_path / "ica"
-    create_dir(ica_path)
-    ica_cert = ica_path / "ica.crt"
-    ica_csr = ica_path / "ica.csr"
-    ica_key = ica_path / "ica.key"
-    with open(ica_path / "serial", "a") as file:
-        file.write("1000")
-    Path(ica_path / "index.txt").touch()
-    # Copy ICA config, but set real ICA path
-    with open(OSSL_ICA_CONFIG, "rt") as template_config:
-        with open(ica_config, "wt") as new_config:
-            for line in template_config:
-                new_config.write(line.replace("{path}", str(ica_path)))
-
-    # Create sub-directory for server certificate, prepare file paths
-    server_path = pki_path / "server"
-    create_dir(server_path)
-    server_cert = server_path / "server.crt"
-    server_csr = server_path / "server.csr"
-    server_key = server_path / "server.key"
-
-    # Create sub-directory for client certificate, prepare file paths
-    client_path = pki_path / "client"
-    create_dir(client_path)
-    client_cert = client_path / "client.crt"
-    client_csr = client_path / "client.csr"
-    client_key = client_path / "client.key"
-
-    ####################################################################
-    # Create CA key and certificate
-    # Note: if/else is needed, because ECDSA needs additional arguments than EdDSA, RSA and PQC
-    if alg.startswith("ECDSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg[5:]
-            + " - Test Root CA"
-        )
-        ec_param = "ec_paramgen_curve:" + alg[5:]
-        # fmt: off
-        ca_cert_process = subprocess.run(
-            [
-                "openssl", "req", "-x509", "-new", "-sha256", "-newkey", "ec", "-pkeyopt", ec_param,
-                "-keyout", ca_key, "-out", ca_cert, "-nodes", "-subj", subject, "-days", "7300",
-                "-extensions", "v3_ca", "-config", ca_config
-            ],
-            capture_output=True,
-            text=True,
+    completed_rounds = output_iterator - 1
+    if sampler:
+        summary = sampler.summary(completed_rounds)
+        print_info(
+            f"INFO: {alg}{tls_info}, {rate}mbit, {delay}ms delay, {loss}% packet loss stopped after {completed_rounds} rounds ({summary["stop_reason"]}){pair_info(pair)}."
         )
-        # fmt: on
     else:
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Test Root CA"
+        summary = {"stop_reason": STOP_FIXED}
+    summary["timeouts"] = config_timeouts
+    summary["rounds"] = completed_rounds
+    if tls_columns:
+        summary.update(group=group, ciphersuite=ciphersuite)
+    return summary
+
+
+def run_benchmark_test(pair, tls_server, alg, algname, rate, delay, loss):
+    # If record flag is set, prepare Wireshark file for traffic dump
+    if record_traffic:
+        traffic_recordings_file_name_server = (
+            wireshark_folder_path
+            / f"server-{algname}_Rate-{rate}_Delay-{delay}_Loss-{loss}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.pcap"
         )
-        # fmt: off
-        ca_cert_process = subprocess.run(
-            [
-                "openssl", "req", "-x509", "-new", "-sha256", "-newkey", alg, "-keyout", ca_key,
-                "-out", ca_cert, "-nodes", "-subj", subject, "-days", "7300", "-extensions",
-                "v3_ca", "-config", ca_config
-            ],
-            capture_output=True,
-            text=True,
+        Path(traffic_recordings_file_name_server).touch()
+
+        traffic_recordings_file_name_client = (
+            wireshark_folder_path
+            / f"client-{algname}_Rate-{rate}_Delay-{delay}_Loss-{loss}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.pcap"
         )
-        # fmt: on
+        Path(traffic_recordings_file_name_client).touch()
 
-    if ca_cert_process.returncode != 0:
-        # Print the error messages from subprocess
-        print(ca_cert_process.stderr)
-        print_error("ERROR: Error during CA setup. Aborting.")
-        sys.exit(-1)
+        # Give "others" write permissions to recording file, otherwise tshark cannot record traffic (if the file is in a user's home-dir)
+        Path.chmod(traffic_recordings_file_name_server, 0o666)
+        Path.chmod(traffic_recordings_file_name_client, 0o666)
 
-    ####################################################################
-    # Create Intermediate-CA key, CSR and certificate
-    if alg.startswith("ECDSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg[5:]
-            + " - Test Intermediate CA"
-        )
+        # Start wireshark process in the server namespace
+        # Note: Use Popen, as the process needs to run in background
         # fmt: off
-        ica_key_process = subprocess.run(
-            ["openssl", "ecparam", "-name", alg[5:], "-genkey", "-out", ica_key],
-            capture_output=True,
-            text=True,
+        wireshark_server = subprocess.Popen(
+            pair.netns_exec(pair.server_ns, role="capture") + ["tshark", "-i", pair.server_dev, "-w", traffic_recordings_file_name_server],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
         )
         # fmt: on
-    elif alg.startswith("RSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Test Intermediate CA"
-        )
+
+        # Wait for wireshark to start, tshark reports "Capturing on '<device>'" as soon as the capture runs
+        wireshark_server_output = OutputWatcher(wireshark_server.stderr, "Capturing on")
+        if not wireshark_server_output.wait_until_ready(
+            wireshark_server, CAPTURE_READY_TIMEOUT
+        ):
+            print("\n".join(wireshark_server_output.last_lines))
+            print_error(
+                "ERROR: Failure during start of wireshark for server. Aborting."
+            )
+            wireshark_server.terminate()
+            sys.exit(-1)
+
+        # Start wireshark process in the client namespace
+        # Note: Use Popen, as the process needs to run in background
         # fmt: off
-        ica_key_process = subprocess.run(
-            ["openssl", "genpkey", "-algorithm", alg[:3], "-pkeyopt", f"rsa_keygen_bits:{alg[4:]}", "-out", ica_key, "-config", ica_config],
-            capture_output=True,
-            text=True,
+        wireshark_client = subprocess.Popen(
+            pair.netns_exec(pair.client_ns, role="capture") + ["tshark", "-i", pair.client_dev, "-w", traffic_recordings_file_name_client],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
         )
         # fmt: on
+
+        # Wait for wireshark to start
+        wireshark_client_output = OutputWatcher(wireshark_client.stderr, "Capturing on")
+        if not wireshark_client_output.wait_until_ready(
+            wireshark_client, CAPTURE_READY_TIMEOUT
+        ):
+            print("\n".join(wireshark_client_output.last_lines))
+            print_error(
+                "ERROR: Failure during start of wireshark for client. Aborting."
+            )
+            wireshark_server.terminate()
+            wireshark_client.terminate()
+            sys.exit(-1)
+
+    # Rows of the cell, which are handed to the results sink together once the cell is completed
+    cell_rows = []
+    cell_started_ns = time.time_ns()
+    # Every TLS configuration (key exchange group and cipher suite) is measured with the same server and emulation
+    tls_summaries = [
+        run_tls_config(pair, tls_server, alg, algname, rate, delay, loss, group, ciphersuite, cell_rows)
+        for group, ciphersuite in tls_configs
+    ]
+    completed_rounds = sum(summary["rounds"] for summary in tls_summaries)
+    if tls_columns:
+        cell_summary = {
+            "timeouts": sum(summary["timeouts"] for summary in tls_summaries),
+            "tls_configs": tls_summaries,
+        }
     else:
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Test Intermediate CA"
+        # The number of rounds is part of the completed cell itself
+        cell_summary = {name: value for name, value in tls_summaries[0].items() if name != "rounds"}
+    # The server records of the cell are the ones accepted between started_ns and finished_ns
+    if tls_server.records_path:
+        cell_summary.update(
+            server_records=tls_server.records_path.name, started_ns=cell_started_ns, finished_ns=time.time_ns()
         )
-        # fmt: off
-        ica_key_process = subprocess.run(
-            ["openssl", "genpkey", "-algorithm", alg, "-out", ica_key, "-config", ica_config],
-            capture_output=True,
-            text=True,
-        )
-        # fmt: on
 
-    # fmt: off
-    ica_csr_process = subprocess.run(
-        [
-            "openssl", "req", "-new", "-sha256", "-key", ica_key,
-            "-out", ica_csr, "-subj", subject, "-config", ica_config,
-        ],
-        capture_output=True,
-        text=True,
+    # Checkpoint the results of the cell (depending on the checkpoint mode)
+    # Note: The campaign manifest lists the cell as completed as soon as its rows are synced to disk
+    results.write_rows(
+        cell_rows,
+        on_durable=lambda results_bytes: campaign.mark_completed(
+            alg, rate, delay, loss, completed_rounds, results_bytes, **cell_summary
+        ),
     )
-    ica_cert_process = subprocess.run(
-        [
-            "openssl", "ca", "-extensions", "v3_intermediate_ca", "-md", "sha256", "-batch",
-            "-in", ica_csr, "-out", ica_cert, "-days", "3650", "-config", ca_config
-        ],
-        capture_output=True,
-        text=True,
-    )
-    # fmt: on
+    results.cell_completed()
 
-    if (
-        ica_key_process.returncode != 0
-        or ica_csr_process.returncode != 0
-        or ica_cert_process.returncode != 0
-    ):
-        # Print the error messages from subprocess
-        print(ica_key_process.stderr)
-        print(ica_csr_process.stderr)
-        print(ica_cert_process.stderr)
-        print_error("ERROR: Error during ICA setup. Aborting.")
-        sys.exit(-1)
+    if record_traffic:
+        # The last packets of the cell (e.g. the RST of the client) are delayed by netem on each of the two veth devices
+        time.sleep(2 * delay / 1000 + CAPTURE_STOP_GRACE)
+        # tshark writes out the remaining packets when terminated, so wait until both have exited
+        wireshark_server.terminate()
+        wireshark_client.terminate()
+        wireshark_server.wait()
+        wireshark_client.wait()
 
-    ####################################################################
-    # Create Server key, CSR and certificate
-    if alg.startswith("ECDSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg[5:]
-            + " - Server Certificate"
-        )
-        # fmt: off
-        server_key_process = subprocess.run(
-            ["openssl", "ecparam", "-name", alg[5:], "-genkey", "-out", server_key],
-            capture_output=True,
-            text=True,
-        )
-        # fmt: on
-    elif alg.startswith("RSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Server Certificate"
-        )
-        # fmt: off
-        server_key_process = subprocess.run(
-            ["openssl", "genpkey", "-algorithm", alg[:3], "-pkeyopt", f"rsa_keygen_bits:{alg[4:]}", "-out", server_key, "-config", ica_config],
-            capture_output=True,
-            text=True,
-        )
-        # fmt: on
-    else:
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Server Certificate"
-        )
-        # fmt: off
-        server_key_process = subprocess.run(
-            ["openssl", "genpkey", "-algorithm", alg, "-out", server_key, "-config", ica_config],
-            capture_output=True,
-            text=True,
-        )
-        # fmt: on
+    return
 
-    # fmt: off
-    server_csr_process = subprocess.run(
-        [
-            "openssl", "req", "-new", "-sha256", "-key", server_key, "-out",
-            server_csr, "-subj", subject, "-config", ica_config
-        ],
-        capture_output=True,
-        text=True,
-    )
-    server_cert_process = subprocess.run(
-        [
-            "openssl", "ca", "-extensions", "server_cert", "-md", "sha256", "-batch",
-            "-in", server_csr, "-out", server_cert, "-days", "365", "-config", ica_config
-        ],
-        capture_output=True,
-        text=True,
-    )
-    # fmt: on
 
-    if (
-        server_key_process.returncode != 0
-        or server_csr_process.returncode != 0
-        or server_cert_process.returncode != 0
-    ):
-        # Print the error messages from subprocess
-        print(server_key_process.stderr)
-        print(server_csr_process.stderr)
-        print(server_cert_process.stderr)
-        print_error("ERROR: Error during server certificate setup. Aborting.")
-        sys.exit(-1)
+def benchmark_worker(pair, units, tls_servers):
+    tls_server = TlsServerManager(pair)
+    tls_servers.append(tls_server)
+    current_alg = None
+    current_emulation = None
+
+    try:
+        while not benchmark_aborted.is_set():
+            # A unit is a list of cells in the planned order, which run back to back on this pair
+            try:
+                unit = units.get_nowait()
+            except queue.Empty:
+                break
+
+            for alg, rate, delay, loss in unit:
+                if benchmark_aborted.is_set():
+                    break
+
+                # For RSA, replace ":" with "" for the alg name used in the file paths
+                if alg.startswith("RSA"):
+                    algname = alg.replace(":", "")
+                else:
+                    algname = alg
+
+                if alg != current_alg:
+                    print_info(f"INFO: Starting {alg} benchmark tests{pair_info(pair)}.")
+                    current_alg = alg
+
+                print_info(
+                    f"INFO: Rate = {rate}Mbit/s, Delay = {delay}ms, Packet Loss Rate = {loss}%{pair_info(pair)}."
+                )
+                # Change network emulation to specified delay and loss (unless the previous cell used the same)
+                if (rate, delay, loss) != current_emulation:
+                    set_network_emulation(pair, rate, delay, loss)
+                    current_emulation = (rate, delay, loss)
+
+                # Execute the test using s_timer
+                run_benchmark_test(pair, tls_server, alg, algname, rate, delay, loss)
+    except SystemExit:
+        # sys.exit() only ends this worker thread, therefore tell the other workers and the main thread to stop
+        benchmark_aborted.set()
+    except BaseException as error:
+        # Any other failure (e.g. of ip, tc or netlink) ends the worker as well, so the remaining cells of its pair
+        # would be missing. Stop the others and report the traceback through the thread.
+        benchmark_aborted.set()
+        print_error(f"ERROR: Worker of {pair} failed with {error!r}. Aborting.")
+        raise
+    finally:
+        tls_server.stop()
+    return
 
-    ####################################################################
-    # Create Client key, CSR and certificate
-    if alg.startswith("ECDSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg[5:]
-            + " - Client Certificate"
-        )
-        # fmt: off
-        client_key_process = subprocess.run(
-            ["openssl", "ecparam", "-name", alg[5:], "-genkey", "-out", client_key],
-            capture_output=True,
-            text=True,
-        )
-        # fmt: on
-    elif alg.startswith("RSA"):
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Client Certificate"
-        )
-        # fmt: off
-        client_key_process = subprocess.run(
-            ["openssl", "genpkey", "-algorithm", alg[:3], "-pkeyopt", f"rsa_keygen_bits:{alg[4:]}", "-out", client_key, "-config", ica_config],
-            capture_output=True,
-            text=True,
-        )
-        # fmt: on
-    else:
-        subject = (
-            "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and Arts/OU=Applied Cyber Security Research Lab/CN="
-            + alg
-            + " - Client Certificate"
-        )
-        # fmt: off
-        client_key_process = subprocess.run(
-            ["openssl", "genpkey", "-algorithm", alg, "-out", client_key, "-config", ica_config],
-            capture_output=True,
-            text=True,
+
+def pair_info(pair):
+    # Only mention the namespace pair in messages if several pairs are running in parallel
+    if len(pairs) == 1:
+        return ""
+    return f" on {pair}"
+
+
+def parse_placement(value):
+    # Argument type for the "-pin" option: "auto" or explicit cores per role, e.g. "server=2,client=3,capture=4-5"
+    if value == "auto":
+        return value
+    placement = {}
+    for part in value.split(","):
+        role, _, cores = part.partition("=")
+        if role not in PROCESS_ROLES or not cores:
+            raise ValueError(f"invalid placement {part}, use auto or <role>=<cores> with roles {PROCESS_ROLES}")
+        placement[role] = parse_cpu_list(cores)
+    return placement
+
+
+def parse_cpu_list(value):
+    # CPU list in the format of taskset, e.g. "2" or "4-5" (separated by ":" instead of "," in -pin)
+    cpus = []
+    for item in value.split(":"):
+        first, _, last = item.partition("-")
+        cpus += range(int(first), int(last or first) + 1)
+    return cpus
+
+
+def assign_pair_cpus(pair_count, pin=None):
+    # Returns the CPU cores of the orchestrator (None if not pinned) and the placement of the roles of every pair
+    if pin is None and pair_count == 1:
+        # Without parallel mode and -pin the processes are not pinned, as before
+        return None, [{}]
+
+    if isinstance(pin, dict):
+        if pair_count != 1:
+            print_error("ERROR: An explicit placement with -pin requires -parallel 1. Aborting.")
+            sys.exit(-1)
+        return None, [pin]
+
+    cpus = sorted(os.sched_getaffinity(0))
+    # Leave the first core to the orchestrator and the kernel, if there are enough cores
+    orchestrator = None
+    if len(cpus) > pair_count:
+        orchestrator = cpus[:1]
+        cpus = cpus[1:]
+
+    cpus_per_pair = len(cpus) // pair_count
+    if cpus_per_pair == 0:
+        print_error(
+            f"ERROR: Not enough CPU cores ({len(cpus)}) for {pair_count} namespace pairs. Aborting."
         )
-        # fmt: on
+        sys.exit(-1)
+
+    placements = []
+    for i in range(pair_count):
+        pair_cpus = cpus[i * cpus_per_pair : (i + 1) * cpus_per_pair]
+        if pin is None:
+            # All processes of the pair share its cores
+            placements.append(dict.fromkeys(PROCESS_ROLES, pair_cpus))
+        elif len(pair_cpus) >= 3:
+            # Dedicated cores for server and client, the captures share the remaining ones
+            placements.append(
+                {"server": pair_cpus[:1], "client": pair_cpus[1:2], "capture": pair_cpus[2:]}
+            )
+        elif len(pair_cpus) == 2:
+            # The captures run next to the orchestrator, which mostly waits
+            placements.append(
+                {"server": pair_cpus[:1], "client": pair_cpus[1:], "capture": orchestrator or pair_cpus}
+            )
+        else:
+            print_warning(
+                f"WARNING: Only one CPU core per namespace pair, server, client and capture share core {pair_cpus[0]}."
+            )
+            placements.append(dict.fromkeys(PROCESS_ROLES, pair_cpus))
+
+    # Pin the orchestrator itself, so that it does not disturb the cores of the pairs
+    if pin is not None and orchestrator:
+        os.sched_setaffinity(0, orchestrator)
+    return orchestrator, placements
 
+
+def network_emulation_init(pair):
+    # With the netlink controller, the qdiscs and neighbor entries are already set up together with the namespaces
+    if pair.netlink:
+        return
+
+    # Initialize network emulation on both ends with rate limit of 10 Gbit/s, 0 delay and 0 packet loss
     # fmt: off
-    client_csr_process = subprocess.run(
-        [
-            "openssl", "req", "-new", "-sha256", "-key", client_key, "-out",
-            client_csr, "-subj", subject, "-config", ica_config
+    commands = [
+        pair.netns_exec(pair.server_ns) + [
+            "tc", "qdisc", "add", "dev", pair.server_dev, "root", "netem", "rate", "10000.0mbit",
+            "delay", "0ms", "loss", "0%"
         ],
-        capture_output=True,
-        text=True,
-    )
-    client_cert_process = subprocess.run(
-        [
-            "openssl", "ca", "-extensions", "server_cert", "-md", "sha256", "-batch", "-in",
-            client_csr, "-out", client_cert, "-days", "365", "-config", ica_config
+        pair.netns_exec(pair.client_ns) + [
+            "tc", "qdisc", "add", "dev", pair.client_dev, "root", "netem", "rate", "10000.0mbit",
+            "delay", "0ms", "loss", "0%"
         ],
-        capture_output=True,
-        text=True,
-    )
+        # Hard-Code MAC Addresses to prevent ARP resolutions which may cause the processes to hang, especially with high packet loss rates
+        pair.netns_exec(pair.server_ns) + [
+            "ip", "neighbor", "add", pair.client_ip, "lladdr", pair.client_mac,
+            "nud", "permanent", "dev", pair.server_dev
+        ],
+        pair.netns_exec(pair.client_ns) + [
+            "ip", "neighbor", "add", pair.server_ip, "lladdr", pair.server_mac,
+            "nud", "permanent", "dev", pair.client_dev
+        ],
+    ]
     # fmt: on
+    for command in commands:
+        process = subprocess.run(command, capture_output=True)
+        if process.returncode != 0:
+            print_error(
+                f"ERROR: Failure during network emulation setup of {pair}: {bytes.decode(process.stderr, "utf-8").strip()}. Aborting."
+            )
+            sys.exit(-1)
+    return
+
 
-    if (
-        client_key_process.returncode != 0
-        or client_csr_process.returncode != 0
-        or client_cert_process.returncode != 0
-    ):
-        # Print the error messages from subprocess
-        print(client_key_process.stderr)
-        print(client_csr_process.stderr)
-        print(client_cert_process.stderr)
-        print_error("ERROR: Error during server certificate setup. Aborting.")
+def check_netlink_rates(rate_values):
+    # The netlink controller only sets rates up to MAX_NETEM_RATE, fail before the campaign instead of in its first cell
+    too_fast = [rate for rate in rate_values if rate > MAX_NETEM_RATE]
+    if too_fast:
+        print_error(f"ERROR: Rates above {MAX_NETEM_RATE:.0f}mbit ({too_fast}) are not supported with -netlink. Aborting.")
         sys.exit(-1)
+    return
+
+
+def set_network_emulation(pair, rate, delay, loss):
+    # A cell must never run on stale emulation settings, so any failure aborts the benchmark
+    if pair.netlink:
+        # Changes both veth ends in-process and reads the applied parameters back
+        try:
+            pair.netlink.apply(rate, delay, loss)
+        except NetemError as error:
+            print_error(f"ERROR: {error}. Aborting.")
+            sys.exit(-1)
+        return
 
+    for namespace, device in [
+        (pair.server_ns, pair.server_dev),
+        (pair.client_ns, pair.client_dev),
+    ]:
+        # fmt: off
+        process = subprocess.run(pair.netns_exec(namespace) + [
+            "tc", "qdisc", "change", "dev", device, "root", "netem", "rate", f"{rate}mbit",
+            "delay", f"{delay}ms", "loss", f"{loss}%"
+        ], capture_output=True)
+        # fmt: on
+        if process.returncode != 0:
+            print_error(
+                f"ERROR: Failure during change of network emulation of {device} in {pair}: {bytes.decode(process.stderr, "utf-8").strip()}. Aborting."
+            )
+            sys.exit(-1)
     return
 
 
-def namespaces_setup(has_failed):
-    print_info("INFO: Setting up namespaces.")
+def namespaces_setup(has_failed, pair):
+    print_info(f"INFO: Setting up namespaces {pair}.")
 
-    ns_process = subprocess.run(["bash", NSPACE_SETUP], capture_output=True)
+    if pair.netlink:
+        try:
+            pair.netlink.setup()
+            returncode = 0
+        except NetemError as error:
+            print_warning(f"WARNING: {error}")
+            returncode = 1
+    else:
+        ns_process = subprocess.run(
+            ["bash", NSPACE_SETUP, str(pair.index)], capture_output=True
+        )
+        returncode = ns_process.returncode
 
-    if ns_process.returncode != 0 and not has_failed:
+    if returncode != 0 and not has_failed:
         print_warning(
             "WARNING: Error during namespace setup. Will do cleanup and retry again."
         )
-        namespaces_cleanup()
-        namespaces_setup(True)
-    elif ns_process.returncode != 0 and has_failed:
+        namespaces_cleanup(pair)
+        namespaces_setup(True, pair)
+    elif returncode != 0 and has_failed:
         print_error(
             "ERROR: Failure during namespace setup. Cleanup did not help. Aborting."
         )
@@ -614,9 +905,14 @@ def namespaces_setup(has_failed):
     return
 
 
-def namespaces_cleanup():
-    print_info("INFO: Cleaning up namespaces.")
-    ns_process = subprocess.run(["bash", NSPACE_CLEANUP], capture_output=True)
+def namespaces_cleanup(pair):
+    print_info(f"INFO: Cleaning up namespaces {pair}.")
+    if pair.netlink:
+        pair.netlink.cleanup()
+        return
+    ns_process = subprocess.run(
+        ["bash", NSPACE_CLEANUP, str(pair.index)], capture_output=True
+    )
     if ns_process.returncode != 0:
         print_error("ERROR: Failure during namespace cleanup. Aborting.")
         sys.exit(-1)
@@ -624,6 +920,13 @@ def namespaces_cleanup():
 
 
 def read_pq_sigalgs(sig_file):
+    # Get the signature algorithms from the file, one per line
+    with open(sig_file, "r", encoding="UTF-8") as file:
+        algnames = [line.rstrip() for line in file if line.strip()]
+    return check_pq_sigalgs(algnames, sig_file)
+
+
+def check_pq_sigalgs(algnames, source):
     algs_from_file = []
     algs_supported = []
 
@@ -637,24 +940,20 @@ def read_pq_sigalgs(sig_file):
         if l.endswith(" @ oqsprovider"):
             algs_supported.append(l[2:-14])
 
-    # Get the signature algorithms from the file and check if they are supported, otherwise exclude from list
-    with open(sig_file, "r", encoding="UTF-8") as file:
-        while line := file.readline():
-            algname = line.rstrip()
-            if algname in algs_supported:
-                # Algorithm is supported, add it to the list
-                algs_from_file.append(line.rstrip())
-            else:
-                print_warning(
-                    f"WARNING: Algorithm {algname} not supported, removed from list."
-                )
-
-        # Check if there are signature algorithms found in the file provided, otherwise exit with error
-        if not algs_from_file:
-            print_error(
-                f"ERROR: No supported algorithms found in {sig_file}. Aborting."
+    # Check if the signature algorithms are supported, otherwise exclude from list
+    for algname in algnames:
+        if algname in algs_supported:
+            # Algorithm is supported, add it to the list
+            algs_from_file.append(algname)
+        else:
+            print_warning(
+                f"WARNING: Algorithm {algname} not supported, removed from list."
             )
-            sys.exit(-1)
+
+    # Check if there are signature algorithms found in the file provided, otherwise exit with error
+    if not algs_from_file:
+        print_error(f"ERROR: No supported algorithms found in {source}. Aborting.")
+        sys.exit(-1)
     return algs_from_file
 
 
@@ -746,6 +1045,169 @@ if __name__ == "__main__":
         default=True,
         required=False,
     )
+    parser.add_argument(
+        "-phases",
+        help="if set, s_timer also measures the phases of every handshake (connect, ServerHello, Certificate, CertificateVerify, Finished), which are added as columns to the results",
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "-cpu-stats",
+        help="if set, s_timer also measures the CPU time and (where perf_event_open is permitted) the cycles and instructions of the client during every handshake, which are added as columns to the results",
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "-resumption",
+        help="if set, s_timer establishes a session first and measures resumed handshakes (PSK with (EC)DHE, PSK only or with early data), the kind of every handshake is added as column to the results",
+        choices=list(RESUMPTION_SERVER_OPTIONS),
+        required=False,
+    )
+    parser.add_argument(
+        "-server",
+        help="TLS server in the server namespace, openssl s_server or the multi-threaded benchmark server of tls-client, which records the server CPU time of every handshake to server-records/, default is s_server",
+        choices=["s_server", "bench_server"],
+        default="s_server",
+        required=False,
+    )
+    parser.add_argument(
+        "-groups",
+        help="comma-separated key exchange groups to measure in every cell (e.g. x25519,kyber768,x25519_kyber768, or groups in the [tls] section of -campaign), the group and cipher suite are added as columns to the results, default is the group of s_timer",
+        metavar="GROUP,...",
+        type=lambda value: value.split(","),
+        required=False,
+    )
+    parser.add_argument(
+        "-ciphersuites",
+        help="comma-separated TLS 1.3 cipher suites to measure in every cell with every group (or ciphersuites in the [tls] section of -campaign), the group and cipher suite are added as columns to the results, default is TLS_AES_256_GCM_SHA384",
+        metavar="SUITE,...",
+        type=lambda value: value.split(","),
+        required=False,
+    )
+    parser.add_argument(
+        "-cert-comp",
+        help="certificate compression (RFC 8879) offered by s_timer and s_server, the algorithms separated by \":\" (e.g. zlib:brotli:zstd, requires OpenSSL 3.2) or none, the compression and sizes of the certificates are added as columns to the results",
+        metavar="ALG:...|none",
+        required=False,
+    )
+    parser.add_argument(
+        "-resumption-ratio",
+        help="share of the rounds which are resumed with -resumption, the others are full handshakes, default is 1.0",
+        metavar="FLOAT",
+        type=float,
+        default="1.0",
+        required=False,
+    )
+    parser.add_argument(
+        "-checkpoint",
+        help="when the results are flushed and synced to disk, 'cell' (after every cell) or a number of rows, default is cell",
+        metavar="cell|INT",
+        type=parse_checkpoint,
+        default=CHECKPOINT_PER_CELL,
+        required=False,
+    )
+    parser.add_argument(
+        "-adaptive",
+        help="if set, every cell runs until the confidence intervals of -stats are narrower than -ci-width (instead of -rounds)",
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "-stats",
+        help="statistics whose confidence intervals decide when an adaptive cell stops, default is median,p95",
+        metavar="median,pNN,...",
+        type=parse_statistics,
+        default="median,p95",
+        required=False,
+    )
+    parser.add_argument(
+        "-ci-width",
+        help="target width of the confidence intervals relative to the estimate in adaptive mode, default is 0.05",
+        metavar="FLOAT",
+        type=float,
+        default="0.05",
+        required=False,
+    )
+    parser.add_argument(
+        "-confidence",
+        help="confidence level of the intervals in adaptive mode, default is 0.95",
+        metavar="FLOAT",
+        type=float,
+        default="0.95",
+        required=False,
+    )
+    parser.add_argument(
+        "-min-rounds",
+        help="minimum number of rounds per cell in adaptive mode, default is 30",
+        metavar="INT",
+        type=int,
+        default="30",
+        required=False,
+    )
+    parser.add_argument(
+        "-max-rounds",
+        help="maximum number of rounds per cell in adaptive mode, default is 1000",
+        metavar="INT",
+        type=int,
+        default="1000",
+        required=False,
+    )
+    parser.add_argument(
+        "-resume",
+        help="path to the .campaign.json file of an interrupted campaign, which is continued with its results file, PKIs and configuration: the namespaces are rebuilt, the rows of incomplete cells are cut off and only the missing cells are run",
+        metavar="<file path>",
+        required=False,
+    )
+    parser.add_argument(
+        "-parallel",
+        help=f"number of isolated namespace pairs (ns1/ns2, ns1-p1/ns2-p1, ... with the subnets 10.5.<N>.0/24 and 10.6.<N>.0/24) which run benchmark cells in parallel, each pinned to its own CPU cores (at most {MAX_PARALLEL_PAIRS}), default is 1",
+        metavar="INT",
+        type=int,
+        default="1",
+        required=False,
+    )
+
+    parser.add_argument(
+        "-campaign",
+        help="path to a TOML campaign file with the algorithms, network grid, rounds and recording, which replace the defaults of this script, the cells are ordered to minimise server restarts and qdisc changes and the plan is printed before the benchmark starts",
+        metavar="<file path>",
+        required=False,
+    )
+    parser.add_argument(
+        "-pin",
+        help="pin server, client and capture processes to their own CPU cores, 'auto' (every namespace pair gets its own cores, the script the first core) or e.g. server=2,client=3,capture=4:5 for a single pair (default auto if given without value)",
+        metavar="auto|<role>=<cores>,...",
+        nargs="?",
+        const="auto",
+        type=parse_placement,
+        required=False,
+    )
+    parser.add_argument(
+        "-priority",
+        help="raise the scheduling priority of server and client processes with nice (nice -n -10) or as realtime processes (chrt --fifo 50)",
+        choices=list(PRIORITY_COMMANDS),
+        required=False,
+    )
+    parser.add_argument(
+        "-pki-workers",
+        help="number of PKIs which are set up in parallel, the openssl output of every PKI is written to pki-setup.log in its directory and the cells of an algorithm whose PKI failed are skipped, default is the number of CPU cores",
+        metavar="INT",
+        type=int,
+        required=False,
+    )
+    parser.add_argument(
+        "-pki-cache",
+        help="directory of the PKI cache, PKIs with the same algorithm, config templates and OpenSSL/provider versions are reused across runs by hard-linking them into the output directory, PKIs expiring within 30 days are replaced (default: ~/.cache/pqc-tls-tests/pki)",
+        metavar="DIR",
+        type=Path,
+        required=False,
+    )
+    parser.add_argument(
+        "-netlink",
+        help="if set, namespaces and netem qdiscs are configured in-process over netlink (requires pyroute2 and root) instead of with ip/tc, the netem parameters of both veth ends are read back and verified before every cell",
+        action="store_true",
+        required=False,
+    )
 
     args = parser.parse_args()
 
@@ -753,111 +1215,363 @@ if __name__ == "__main__":
     sig_file = Path(args.sigs)
     out_dir = Path(args.out)
     record_traffic = args.rec
+    measure_phases = args.phases
+    kex_groups = None
+    cipher_suites = None
+    resumption = {"mode": args.resumption, "ratio": args.resumption_ratio} if args.resumption else None
+    cert_comp = args.cert_comp
+    cpu_stats = args.cpu_stats
+    tls_server_program = args.server
+
+    if not 0.0 <= args.resumption_ratio <= 1.0:
+        print_error("ERROR: -resumption-ratio has to be between 0 and 1.")
+        sys.exit(-1)
 
-    # Make sure that the PQ signature algorithm file exists
-    if not sig_file.is_file():
-        print_error(f"ERROR: File {sig_file} does not exist.")
+    if cert_comp and cert_comp != "none" and not set(cert_comp.split(":")) <= set(CERT_COMP_ALGORITHMS):
+        print_error(f"ERROR: -cert-comp has to be none or a list of {", ".join(CERT_COMP_ALGORITHMS)}.")
         sys.exit(-1)
 
-    # Check if output directory exists
-    if not out_dir.is_dir():
-        print_error(f"ERROR: Directory {out_dir} does not exist.")
+    if args.netlink and netlink_available() is not None:
+        print_error(f"ERROR: Cannot use -netlink, {netlink_available()}.")
         sys.exit(-1)
 
-    # Prepare file for benchmark results
-    results_file_name = (
-        out_dir / f"results_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.csv"
-    )
-    with open(results_file_name, "a") as results_file:
-        results_file.write(
-            "Signature Algorithm,Test Round,Rate Limit,Delay,Packet Loss,Success,Handshake Duration [ms]"
-            + "\n"
+    if not 1 <= args.parallel <= MAX_PARALLEL_PAIRS:
+        print_error(f"ERROR: -parallel has to be between 1 and {MAX_PARALLEL_PAIRS}.")
+        sys.exit(-1)
+
+    # Settings of the adaptive sample size (None for a fixed number of rounds per cell)
+    if args.adaptive:
+        if not 0 < args.min_rounds <= args.max_rounds:
+            print_error("ERROR: Adaptive mode requires 0 < -min-rounds <= -max-rounds.")
+            sys.exit(-1)
+        adaptive = {
+            "statistics": args.stats,
+            "ci_width": args.ci_width,
+            "confidence": args.confidence,
+            "min_rounds": args.min_rounds,
+            "max_rounds": args.max_rounds,
+        }
+    else:
+        adaptive = None
+
+    if args.resume:
+        campaign_file = Path(args.resume)
+        if not campaign_file.is_file():
+            print_error(f"ERROR: File {campaign_file} does not exist.")
+            sys.exit(-1)
+
+        # Continue the campaign with its original configuration and results file
+        campaign = load_campaign_manifest(campaign_file)
+        out_dir = campaign_file.parent
+        sig_algs = campaign.config("signature_algorithms")
+        rate_values = campaign.config("rate_values")
+        delay_values = campaign.config("delay_values")
+        loss_values = campaign.config("loss_values")
+        if args.netlink:
+            check_netlink_rates(rate_values)
+        rounds = campaign.config("rounds")
+        record_traffic = campaign.config("record", record_traffic)
+        measure_phases = campaign.config("phases", False)
+        resumption = campaign.config("resumption", None)
+        cert_comp = campaign.config("cert_comp", None)
+        cpu_stats = campaign.config("cpu_stats", False)
+        tls_server_program = campaign.config("server", "s_server")
+        # Note: Campaigns of older versions measured the default group and cipher suite of s_timer only
+        kex_groups = campaign.config("kex_groups", None)
+        cipher_suites = campaign.config("cipher_suites", None)
+        adaptive = campaign.config("adaptive")
+        results_file_name = campaign.results_path()
+
+        # Remove the rows of cells which were not completed anymore
+        campaign.truncate_results()
+    else:
+        # Settings of the campaign file, where a setting is not given the defaults of this script are used
+        settings = dict.fromkeys(
+            ["traditional", "pq", "pq_file", "rate_values", "delay_values", "loss_values", "kex_groups", "cipher_suites", "rounds", "record"]
+        )  # fmt: skip
+        if args.campaign:
+            try:
+                settings = load_campaign_file(args.campaign)
+            except (CampaignFileError, OSError) as error:
+                print_error(f"ERROR: Campaign file {args.campaign}: {error}. Aborting.")
+                sys.exit(-1)
+            if settings["pq_file"] is not None:
+                sig_file = Path(settings["pq_file"])
+            if settings["rounds"] is not None:
+                rounds = settings["rounds"]
+            if settings["record"] is not None:
+                record_traffic = settings["record"]
+
+        # Make sure that the PQ signature algorithm file exists (unless the campaign file lists the algorithms)
+        if settings["pq"] is None and not sig_file.is_file():
+            print_error(f"ERROR: File {sig_file} does not exist.")
+            sys.exit(-1)
+
+        # Check if output directory exists
+        if not out_dir.is_dir():
+            print_error(f"ERROR: Directory {out_dir} does not exist.")
+            sys.exit(-1)
+
+        # Read the post-quantum signature algorithms from file (or campaign file) and check if activated in oqs-provider
+        if settings["pq"] is not None:
+            pq_sig_algs = check_pq_sigalgs(settings["pq"], args.campaign)
+        else:
+            pq_sig_algs = read_pq_sigalgs(sig_file)
+
+        # Add the reference algorithms (traditional crypto, provided in global variable) to the list
+        sig_algs = (settings["traditional"] or TRADITIONAL_SIG_ALGS) + pq_sig_algs
+        rate_values = settings["rate_values"] or RATE_VALUES
+        delay_values = settings["delay_values"] or DELAY_VALUES
+        loss_values = settings["loss_values"] or LOSS_VALUES
+        if args.netlink:
+            check_netlink_rates(rate_values)
+        # The key exchange groups and cipher suites are only swept (and added as columns) if they are given
+        # Note: The options take precedence over the [tls] section of the campaign file
+        kex_groups = args.groups or settings["kex_groups"]
+        cipher_suites = args.ciphersuites or settings["cipher_suites"]
+        if kex_groups is not None or cipher_suites is not None:
+            kex_groups = kex_groups or KEX_GROUPS
+            cipher_suites = cipher_suites or CIPHER_SUITES
+
+        # Prepare file for benchmark results and the manifest of the campaign, which records the completed cells
+        results_file_name = (
+            out_dir / f"results_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.csv"
+        )
+        campaign = create_campaign_manifest(
+            results_file_name.with_name(results_file_name.stem + ".campaign.json"),
+            results_file_name,
+            {
+                "signature_algorithms": sig_algs,
+                "rate_values": rate_values,
+                "delay_values": delay_values,
+                "loss_values": loss_values,
+                "kex_groups": kex_groups,
+                "cipher_suites": cipher_suites,
+                "rounds": rounds,
+                "record": record_traffic,
+                "phases": measure_phases,
+                "resumption": resumption,
+                "cert_comp": cert_comp,
+                "cpu_stats": cpu_stats,
+                "server": tls_server_program,
+                "adaptive": adaptive,
+            },
         )
 
+    # TLS configurations measured in every cell, the key exchange group and cipher suite are recorded per row
+    tls_columns = kex_groups is not None
+    if tls_columns:
+        tls_configs = list(itertools.product(kex_groups, cipher_suites))
+        # The long-lived servers accept all groups and cipher suites of the campaign, the client chooses one
+        tls_server_options = ["-groups", ":".join(kex_groups), "-ciphersuites", ":".join(cipher_suites)]
+    else:
+        tls_configs = [(None, None)]
+        tls_server_options = []
+
+    # Note: The file is kept open and written in batches by the results sink, which is shared by all workers
+    results = ResultsSink(
+        results_file_name,
+        header=",".join(
+            ["Signature Algorithm", "Test Round", "Rate Limit", "Delay", "Packet Loss"]
+            + (["Key Exchange", "Cipher Suite"] if tls_columns else [])
+            + ["Success", "Handshake Duration [ms]"]
+            + (["Resumption"] if resumption else [])
+            + (CERT_COMP_COLUMNS if cert_comp else [])
+            + (CPU_COLUMNS if cpu_stats else [])
+            + (PHASE_COLUMNS if measure_phases else [])
+        ),
+        checkpoint=args.checkpoint,
+    )
+
+    # Handshake timeouts per cell, shared by all workers
+    # Note: A resumed campaign starts with the durations measured so far as history
+    timeout_model = HandshakeTimeoutModel()
+    if args.resume:
+        timeout_model.load_results(results_file_name)
+
     # If traffic is to be recorded, prepare folder
     if record_traffic:
-        # Prepare folder for wireshark dump files
+        # Prepare folder for wireshark dump files (a resumed campaign continues to use its folder)
         wireshark_folder_path = out_dir / "traffic-recordings"
-        create_dir(wireshark_folder_path)
+        if not (args.resume and wireshark_folder_path.is_dir()):
+            create_dir(wireshark_folder_path)
 
-    # Read the post-quantum signature algorithms from file and check if activated in oqs-provider
-    pq_sig_algs = read_pq_sigalgs(sig_file)
-
-    # Add the reference algorithms (traditional crypto, provided in global variable) to the list
-    sig_algs = TRADITIONAL_SIG_ALGS + pq_sig_algs
-
-    # Setup of namespaces and virtual Ethernet devices
-    # Note: Perform a cleanup first, just to make sure to have a clean state
-    namespaces_cleanup()
-    namespaces_setup(False)
-
-    # Initialize network emulation on ns1 and ns2 with rate limit of 10 Gbit/s, 0 delay and 0 packet loss
-    # fmt: off
-    subprocess.run([
-        "sudo", "ip", "netns", "exec", "ns1", "tc", "qdisc",
-        "add", "dev", "veth1", "root", "netem", "rate", "10000.0mbit",
-        "delay", "0ms", "loss", "0%"
-    ])
-    subprocess.run([
-        "sudo", "ip", "netns", "exec", "ns2", "tc", "qdisc",
-        "add", "dev", "veth2", "root", "netem", "rate", "10000.0mbit",
-        "delay", "0ms", "loss", "0%"
-    ])
-
-    # Hard-Code MAC Addresses to prevent ARP resolutions which may cause the processes to hang, especially with high packet loss rates
-    subprocess.run([
-        "sudo", "ip", "netns", "exec", "ns1", "ip", "neighbor",
-        "add", "10.5.0.1", "lladdr", "00:00:00:00:00:02",
-        "nud", "permanent", "dev", "veth1"
-    ])
-    subprocess.run([
-        "sudo", "ip", "netns", "exec", "ns2", "ip", "neighbor",
-        "add", "10.6.0.1", "lladdr", "00:00:00:00:00:01",
-        "nud", "permanent", "dev", "veth2"
-    ])
-    # fmt: on
+    # The benchmark server writes the server side of every handshake to a records file per server start
+    if tls_server_program == "bench_server":
+        if not BENCH_SERVER_BINARY.is_file():
+            print_error(f"ERROR: {BENCH_SERVER_BINARY} not found, build it with make -C tls-client bench_server.")
+            sys.exit(-1)
+        server_records_folder_path = out_dir / "server-records"
+        if not (args.resume and server_records_folder_path.is_dir()):
+            create_dir(server_records_folder_path)
+
+    # PKIs are linked from the cache, only PKIs which are not cached yet have to be built
+    # Note: A resumed campaign keeps its complete PKIs, so that all cells use the same key material
+    pki_cache = PkiCache(args.pki_cache)
+    pki_paths = {alg: out_dir / f"pki-{alg.replace(":", "")}" for alg in sig_algs}
+    reused_pkis = [alg for alg in sig_algs if args.resume and pki_complete(pki_paths[alg])]
+
+    # Expand the campaign into cells and order them to minimise TLS server restarts and qdisc changes
+    # Note: Cells completed before the campaign was interrupted are skipped
+    units, plan = plan_cells(
+        sig_algs,
+        rate_values,
+        delay_values,
+        loss_values,
+        pair_count=args.parallel,
+        skip=campaign.is_completed,
+        pki_builds=sum(
+            alg not in reused_pkis
+            and pki_cache.state(alg, pki_paths[alg], OSSL_RCA_CONFIG, OSSL_ICA_CONFIG) == PKI_MISSING
+            for alg in sig_algs
+        ),
+    )
+    print_info(
+        f"INFO: Planned {plan["cells"]} cells ({plan["order"]}) with {plan["pki_builds"]} PKI builds, "
+        f"{plan["server_restarts"]} TLS server starts and {plan["qdisc_changes"]} qdisc changes "
+        f"(approx. {plan["estimated_overhead_s"]}s of reconfiguration)."
+    )
+    if tls_columns:
+        print_info(
+            f"INFO: Every cell measures {len(tls_configs)} TLS configurations ({len(kex_groups)} key exchange groups, "
+            f"{len(cipher_suites)} cipher suites) on the same server."
+        )
 
-    # Perform benchmark test for each signature algorithm
+    # Set up the PKIs (CA, ICA and EE certificates) of all algorithms before the benchmark starts
+    # Note: Outdated PKIs in the output directory are replaced from the cache without asking, so that the setup runs unattended
+    pki_jobs = {}
     for alg in sig_algs:
-        print_info(f"INFO: Setting up {alg} PKI.")
+        if alg in reused_pkis:
+            print_info(f"INFO: Reusing {alg} PKI.")
+            continue
+        # fmt: off
+        pki_jobs[alg] = {"pki_path": pki_paths[alg], "rca_template": OSSL_RCA_CONFIG, "ica_template": OSSL_ICA_CONFIG}
+        # fmt: on
 
-        # For RSA, replace ":" with "" for the alg name used in the file paths
-        if alg.startswith("RSA"):
-            algname = alg.replace(":", "")
+    def report_pki(alg, state, error):
+        if error is not None:
+            print_error(f"ERROR: {error}.")
+        elif state == PKI_CURRENT:
+            print_info(f"INFO: {alg} PKI is up to date.")
+        elif state == PKI_CACHED:
+            print_success(f"SUCCESS: {alg} PKI linked from cache.")
         else:
-            algname = alg
-
-        # Setting up the PKI (CA, ICA and EE certificates)
-        pki_setup(alg, algname, out_dir)
-        pki_path = out_dir / f"pki-{algname}"
-
-        print_info(f"INFO: Starting {alg} benchmark tests.")
-        # Run s_timer benchmark test for each rate, delay and loss value
-        for rate in RATE_VALUES:
-            for delay in DELAY_VALUES:
-                for loss in LOSS_VALUES:
-                    print_info(
-                        f"INFO: Rate = {rate}Mbit/s, Delay = {delay}ms, Packet Loss Rate = {loss}%."
-                    )
-                    # Change network emulation to specified delay and loss
-                    # fmt: off
-                    subprocess.run([
-                        "sudo", "ip", "netns", "exec", "ns1", "tc", "qdisc", "change",
-                        "dev", "veth1", "root", "netem", "rate", f"{rate}mbit",
-                        "delay", f"{delay}ms", "loss", f"{loss}%"
-                    ])
-                    subprocess.run([
-                        "sudo", "ip", "netns", "exec", "ns2", "tc", "qdisc", "change",
-                        "dev", "veth2", "root", "netem", "rate", f"{rate}mbit",
-                        "delay", f"{delay}ms", "loss", f"{loss}%"
-                    ])
-                    # fmt: on
-
-                    # Execute the test using s_timer
-                    run_benchmark_test(0)
+            print_success(f"SUCCESS: {alg} PKI set up.")
+
+    # The PKIs of all algorithms are built concurrently, a failed PKI only removes its algorithm from the campaign
+    if pki_jobs:
+        print_info(f"INFO: Setting up {len(pki_jobs)} PKIs with up to {args.pki_workers or os.cpu_count()} in parallel.")
+    failed_pkis = build_pkis(pki_jobs, args.pki_workers, report_pki, build=pki_cache.materialize)
+    if failed_pkis:
+        if len(failed_pkis) == len(sig_algs):
+            print_error("ERROR: No PKI could be set up. Aborting.")
+            sys.exit(-1)
+        units = [[cell for cell in unit if cell[0] not in failed_pkis] for unit in units]
+        units = [unit for unit in units if unit]
+        plan["cells"] = sum(len(unit) for unit in units)
+        plan["failed_pkis"] = sorted(failed_pkis)
+        print_warning(
+            f"WARNING: Skipping {", ".join(sorted(failed_pkis))} as the PKI setup failed, {plan["cells"]} cells left."
+        )
+
+    # Setup of namespaces and virtual Ethernet devices, one pair per parallel worker
+    # Note: Every pair gets its own CPU cores (with -pin dedicated cores for server, client and capture)
+    orchestrator_cpus, placements = assign_pair_cpus(args.parallel, args.pin)
+    # Note: Perform a cleanup first, just to make sure to have a clean state
+    pairs = [
+        TestbedPair(index, placement, args.priority, args.netlink)
+        for index, placement in enumerate(placements)
+    ]
+    if args.pin and orchestrator_cpus:
+        print_info(f"INFO: Orchestrator pinned to CPU cores {orchestrator_cpus}.")
+    for pair in pairs:
+        if pair.placement:
+            placement = ", ".join(
+                f"{role} {pair.placement.get(role) or "unpinned"}" for role in PROCESS_ROLES
+            )
+            print_info(f"INFO: CPU placement of {pair}: {placement}.")
+    for pair in pairs:
+        namespaces_cleanup(pair)
+        namespaces_setup(False, pair)
+        network_emulation_init(pair)
+
+    # Work queue with the planned units of cells, every (algorithm, rate, delay, loss) combination is an independent cell
+    cells = queue.Queue()
+    for unit in units:
+        cells.put(unit)
+
+    if args.resume:
+        print_info(
+            f"INFO: Resuming campaign, {len(campaign.completed)} cells already completed, {plan["cells"]} cells to go."
+        )
+
+    # Set by a worker if it fails, so that all other workers stop as well
+    benchmark_aborted = threading.Event()
+
+    tls_servers = []
+    workers = [
+        threading.Thread(target=benchmark_worker, args=(pair, cells, tls_servers))
+        for pair in pairs
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    print_info(
+        f"INFO: TLS server was started {sum(server.starts for server in tls_servers)} times."
+    )
 
     # Cleaning up namespaces and virtual Ethernet devices
-    namespaces_cleanup()
+    for pair in pairs:
+        namespaces_cleanup(pair)
+
+    # Sync the pending rows, so that every cell whose rows were written is listed in the campaign manifest
+    results.checkpoint()
+    missing_cells = [cell for unit in units for cell in unit if not campaign.is_completed(*cell)]
+
+    if benchmark_aborted.is_set() or missing_cells:
+        # Keep the results measured so far, but do not mark the run as completed
+        results.close()
+        if benchmark_aborted.is_set():
+            print_error("ERROR: Benchmark aborted due to a failure of a worker.")
+        if missing_cells:
+            print_error(
+                f"ERROR: {len(missing_cells)} of {plan['cells']} planned cells were not recorded, resume with -resume {campaign.path}."
+            )
+        sys.exit(-1)
+
+    # Write the remaining results and the manifest of the completed run
+    results.finish(
+        {
+            "signature_algorithms": sig_algs,
+            "rate_values": rate_values,
+            "delay_values": delay_values,
+            "loss_values": loss_values,
+            "rounds": rounds,
+            "adaptive": adaptive,
+            "namespace_pairs": len(pairs),
+            "tls_server_starts": sum(server.starts for server in tls_servers),
+            "campaign_manifest": campaign.path.name,
+            "resumed": bool(args.resume),
+            "plan": plan,
+            "pki_cache": {
+                "path": str(pki_cache.cache_dir),
+                # Note: PKIs of a resumed campaign which were set up without the cache have no key
+                "keys": {
+                    alg: pki_cache.pki_key(pki_paths[alg])
+                    for alg in sig_algs
+                    if alg not in failed_pkis
+                },
+            },
+            "cpu_placement": {
+                "orchestrator": orchestrator_cpus if args.pin else None,
+                "priority": args.priority,
+                "pairs": {str(pair): pair.placement for pair in pairs},
+            },
+        }
+    )
+    campaign.mark_finished()
 
     print_success(
         f"SUCCESS: Results were stored in {results_file_name.name}. Finished."
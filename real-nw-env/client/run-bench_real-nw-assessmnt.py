@@ -9,16 +9,29 @@
 ##############################################################################################
 
 import argparse
+import itertools
 import os
 import sys
 import subprocess
 import shutil
 import time
 from datetime import datetime
+from pathlib import Path
+
+# Shared helpers of the benchmark runners (bench-common/ of the repository, or next to this script in the container)
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path[:0] = [str(SCRIPT_DIR / "bench-common"), str(SCRIPT_DIR.parent.parent / "bench-common")]
+from adaptive_sampling import STOP_FIXED, AdaptiveSampler, parse_statistics
+from results_sink import CHECKPOINT_PER_CELL, ResultsSink, parse_checkpoint
+from stimer_output import CERT_COMP_FIELDS, CPU_FIELDS, StimerOutput, StimerTimeout
 
 # Path to s_timer
 STIMER_BINARY = "/opt/stimer/s_timer"
 
+# Number of times the unfinished rounds of a batch are repeated after s_timer stopped printing records within -timeout
+# (or ended early), before they are recorded as failed
+MAX_TIMEOUT_RETRIES = 4
+
 # Dict with Signature Algorithm and Port Mapping
 algs = {}
 algs['RSA:3072'] = 50001
@@ -36,7 +49,7 @@ algs['sphincssha2192ssimple'] = 50012
 algs['sphincssha2256ssimple'] = 50013
 
 
-def run_benchmark_test(alg, algname, rounds, dest_ip, port):
+def run_benchmark_test(alg, algname, rounds, dest_ip, port, group, ciphersuite):
     # Prepare file paths
     pki_path="./pki/pki-{}".format(algname)
     ca_cert = pki_path+"/ca/ca.crt"
@@ -46,45 +59,108 @@ def run_benchmark_test(alg, algname, rounds, dest_ip, port):
     
     print(pki_path)
     
-    # Start s_timer process
-    # Note: Use run (not Popen), as it should be waited until the process execution in finished
-    #       The test is repeated "rounds" times
-    
-    results = subprocess.run([STIMER_BINARY, '-h', '{}:{}'.format(dest_ip, port), '-r', str(rounds), '--cert='+client_cert, '--key='+client_key, '--rootcert='+ca_cert, '--chaincert='+ica_cert], capture_output=True)
+    # With -groups/-ciphersuites, the key exchange group and cipher suite are passed to s_timer and added to every row
+    tls_values = [group, ciphersuite] if tls_columns else []
+    tls_args = ['--groups='+group, '--ciphersuites='+ciphersuite] if tls_columns else []
+    cert_comp_args = ['--cert-comp='+cert_comp] if cert_comp else []
+    cpu_stats_args = ['--cpu-stats'] if cpu_stats else []
     
+    # In adaptive mode, s_timer is run in batches until the sampler stops the algorithm
+    if adaptive:
+        sampler = AdaptiveSampler(adaptive['statistics'], adaptive['ci_width'], adaptive['confidence'], adaptive['min_rounds'], adaptive['max_rounds'])
+        open_rounds = sampler.next_rounds(0)
+    else:
+        sampler = None
+        open_rounds = rounds
     
-    # Save output line by line in array
-    s_time_output = bytes.decode(results.stdout, 'utf-8').splitlines()
+    i = 1
+    # Attempts of the current batch and timeouts of the algorithm
+    retries = 0
+    timeouts = 0
+    while open_rounds > 0:
+        # Start s_timer process
+        # Note: s_timer prints every handshake as soon as it is done, the rows are written while it is running
+        #       The test is repeated "open_rounds" times
         
-    # Check that OpenSSL 3.2.0 was used (no older version)
-    # Note: s_timer outputs the OpenSSL version in the first output line
+        resumption_args = ['--resumption='+resumption['mode'], '--resumption-ratio='+str(resumption['ratio'])] if resumption else []
+        stimer_process = subprocess.Popen([STIMER_BINARY, '-h', '{}:{}'.format(dest_ip, port), '-r', str(open_rounds), '--cert='+client_cert, '--key='+client_key, '--rootcert='+ca_cert, '--chaincert='+ica_cert] + resumption_args + tls_args + cert_comp_args + cpu_stats_args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        stimer = StimerOutput(stimer_process.stdout)
+        
+        # Every record has to arrive within the timeout, so a server which stops answering does not block the run
+        finished_rounds = 0
+        try:
+            s_time_header = stimer.read_header(timeout)
+            
+            # Check that OpenSSL 3.2.0 was used (no older version)
+            # Note: s_timer outputs the OpenSSL version in the first output line
+            
+            if not s_time_header or s_time_header[0].find('OpenSSL 3.2.0 ') < 0:
+                # Correct version string not found, abort
+                stimer_process.terminate()
+                print('\033[1;31mERROR:\t\tWrong OpenSSL version in s_timer. Aborting.\033[0m', file=sys.stderr)
+                sys.exit(-1)
+            else:
+                # Check if provider could be loaded successfully
+                # Note: s_timer output if provider load was successful on the second line
+                if len(s_time_header) < 2 or s_time_header[1].find('provider loaded successfully') < 0:
+                    # Provider not found
+                    stimer_process.terminate()
+                    print('\033[1;31mERROR:\t\tOQS-Provider in s_timer not loaded. Aborting.\033[0m', file=sys.stderr)
+                    sys.exit(-1)
+                else:
+                    # Provider loaded successfully, write the results as they arrive
+                    # Note: If connection was unsuccessful (success=false), a value of -1.0ms is returned as measurement
+                    # With -resumption, the kind of the handshake (full, psk_dhe, psk or early_data) is added to every row
+                    # With -cert-comp, the compression and the sizes of the certificates and of the handshake are added
+                    # With -cpu-stats, the CPU time, cycles and instructions of the client are added
+                    for measurement, success, handshake_type, message_sizes, cpu_usage, _ in stimer.records(timeout):
+                        results.write_row([alg, i] + tls_values + [success, measurement] + ([handshake_type] if resumption else []) + message_sizes + cpu_usage)
+                        if sampler and success == "1":
+                            sampler.add(float(measurement))
+                        i = i + 1
+                        finished_rounds += 1
+            stimer_process.wait()
+            timed_out = False
+        except StimerTimeout:
+            stimer_process.terminate()
+            stimer_process.wait()
+            timed_out = True
+        
+        # The rows of the finished handshakes are kept, only the unfinished rounds are repeated
+        unfinished_rounds = open_rounds - finished_rounds
+        if unfinished_rounds > 0:
+            retries += 1
+            timeouts += timed_out
+            reason = 'Timeout of {}s reached'.format(timeout) if timed_out else 's_timer ended after {} of {} rounds'.format(finished_rounds, open_rounds)
+            if retries <= MAX_TIMEOUT_RETRIES:
+                print('\033[1;31mERROR:\t\t{} for "{}". Repeating the {} unfinished round(s).\033[0m'.format(reason, alg, unfinished_rounds), file=sys.stderr)
+                open_rounds = unfinished_rounds
+                continue
+            
+            # Give up on the batch, but keep its rounds in the results as failed (like s_timer does for failed connections)
+            # Note: The kind, the message sizes and the CPU usage of a handshake which did not finish are unknown
+            print('\033[1;31mERROR:\t\t"{}" did not finish {} times. Recording {} round(s) as failed.\033[0m'.format(alg, retries, unfinished_rounds), file=sys.stderr)
+            for _ in range(unfinished_rounds):
+                results.write_row([alg, i] + tls_values + ["0", "-1.0"] + ([""] if resumption else []) + [""] * (len(CERT_COMP_FIELDS) if cert_comp else 0) + [""] * (len(CPU_FIELDS) if cpu_stats else 0))
+                i = i + 1
+        retries = 0
+        
+        # In adaptive mode, ask the sampler whether more rounds are needed
+        open_rounds = sampler.next_rounds(i - 1) if sampler else 0
     
-    if s_time_output[0].find('OpenSSL 3.2.0 ') < 0:
-        # Correct version string not found, abort
-        print('\033[1;31mERROR:\t\tWrong OpenSSL version in s_timer. Aborting.\033[0m', file=sys.stderr)
-        sys.exit(-1)
+    # Return why the algorithm stopped, for the manifest of the run
+    tls_info = ' ({}, {})'.format(group, ciphersuite) if tls_columns else ''
+    if sampler:
+        summary = sampler.summary(i - 1)
+        print('\033[1;34mINFO:\t\t"{}"{} stopped after {} rounds ({}).\033[0m'.format(alg, tls_info, i - 1, summary['stop_reason']), file=sys.stdout)
     else:
-        # Check if provider could be loaded successfully
-        # Note: s_timer output if provider load was successful on the second line
-        if s_time_output[1].find('provider loaded successfully') < 0:
-            # Provider not found
-            print('\033[1;31mERROR:\t\tOQS-Provider in s_timer not loaded. Aborting.\033[0m', file=sys.stderr)
-            sys.exit(-1)
-        else:
-            # Provider loaded successfully, print results
-            i = 1
-            for result in s_time_output[2].split(","):
-                # s_timer outputs results as pairs of measurement:success (float:bool)
-                # Note: If connection was unsuccessful (success=false), a dummy value of 0.0ms is returned as measurement
-                measurement, success = result.split(":")
-                results_file = open(results_file_name, "a")
-                results_file.write(alg+","+str(i)+","+success+","+measurement+"\n")
-                results_file.close()
-                i = i + 1
-            
-            print('\033[1;32mSUCCESS:\tResults for {} written to file.\n\033[0m'.format(alg), file=sys.stdout)
-                
-    return
+        summary = {'stop_reason': STOP_FIXED}
+    summary['rounds'] = i - 1
+    summary['timeouts'] = timeouts
+    if tls_columns:
+        summary.update(group=group, ciphersuite=ciphersuite)
+    
+    return summary
 
 def run_ping(dest_ip):
     # Prepare file for output
@@ -111,12 +187,47 @@ if __name__ == '__main__':
     parser.add_argument('-rounds', help='the number of times the test should be performed for, default is 10', metavar='INT', type=int, default='10', required=False)
     parser.add_argument('-out', help='path to directory where the results should be saved to', metavar='<dir path>', required=True)
     parser.add_argument('-ip', help='IP address of TLS server', metavar='<IP>', default='localhost', required=False)
+    parser.add_argument('-timeout', help='seconds after which s_timer is stopped if it printed no record, its unfinished rounds are repeated and recorded as failed after {} attempts, default is 60'.format(MAX_TIMEOUT_RETRIES), metavar='FLOAT', type=float, default='60', required=False)
+    parser.add_argument('-checkpoint', help='when the results are flushed and synced to disk, "cell" (after every algorithm) or a number of rows, default is cell', metavar='cell|INT', type=parse_checkpoint, default=CHECKPOINT_PER_CELL, required=False)
+    parser.add_argument('-adaptive', help='if set, every algorithm runs until the confidence intervals of -stats are narrower than -ci-width (instead of -rounds)', action='store_true', required=False)
+    parser.add_argument('-stats', help='statistics whose confidence intervals decide when an adaptive algorithm stops, default is median,p95', metavar='median,pNN,...', type=parse_statistics, default='median,p95', required=False)
+    parser.add_argument('-ci-width', help='target width of the confidence intervals relative to the estimate in adaptive mode, default is 0.05', metavar='FLOAT', type=float, default='0.05', required=False)
+    parser.add_argument('-confidence', help='confidence level of the intervals in adaptive mode, default is 0.95', metavar='FLOAT', type=float, default='0.95', required=False)
+    parser.add_argument('-min-rounds', help='minimum number of rounds per algorithm in adaptive mode, default is 30', metavar='INT', type=int, default='30', required=False)
+    parser.add_argument('-max-rounds', help='maximum number of rounds per algorithm in adaptive mode, default is 1000', metavar='INT', type=int, default='1000', required=False)
+    parser.add_argument('-resumption', help='if set, s_timer establishes a session first and measures resumed handshakes (PSK with (EC)DHE, PSK only or with early data)', choices=['psk-dhe', 'psk', 'early-data'], required=False)
+    parser.add_argument('-groups', help='comma-separated key exchange groups to measure for every algorithm (e.g. x25519,kyber768,x25519_kyber768), default is the group of s_timer', metavar='GROUP,...', type=lambda value: value.split(','), required=False)
+    parser.add_argument('-ciphersuites', help='comma-separated TLS 1.3 cipher suites to measure for every algorithm and group, default is TLS_AES_256_GCM_SHA384', metavar='SUITE,...', type=lambda value: value.split(','), required=False)
+    parser.add_argument('-cert-comp', help='certificate compression (RFC 8879) offered by s_timer, the algorithms separated by ":" (e.g. zlib:brotli:zstd) or none, the compression and sizes of the certificates are added to the results', metavar='ALG:...|none', required=False)
+    parser.add_argument('-cpu-stats', help='if set, s_timer also measures the CPU time and (where perf_event_open is permitted) the cycles and instructions of the client during every handshake, which are added to the results', action='store_true', required=False)
+    parser.add_argument('-resumption-ratio', help='share of the rounds which are resumed with -resumption, the others are full handshakes, default is 1.0', metavar='FLOAT', type=float, default='1.0', required=False)
     
     args = parser.parse_args()
     
     rounds = args.rounds
     out_dir = args.out
     dest_ip = args.ip
+    timeout = args.timeout
+    resumption = {'mode': args.resumption, 'ratio': args.resumption_ratio} if args.resumption else None
+    cert_comp = args.cert_comp
+    cpu_stats = args.cpu_stats
+    
+    # Key exchange groups and cipher suites, every combination is measured for every algorithm
+    # Note: The servers accept all groups of the oqs-provider and the default cipher suites of OpenSSL
+    tls_columns = args.groups is not None or args.ciphersuites is not None
+    tls_configs = list(itertools.product(args.groups or ['x25519_kyber768'], args.ciphersuites or ['TLS_AES_256_GCM_SHA384'])) if tls_columns else [(None, None)]
+    
+    # Settings of the adaptive sample size (None for a fixed number of rounds per algorithm)
+    if args.adaptive:
+        if not 0 < args.min_rounds <= args.max_rounds:
+            print('\033[1;31mERROR:\t\tAdaptive mode requires 0 < -min-rounds <= -max-rounds.\033[0m', file=sys.stderr)
+            sys.exit(-1)
+        adaptive = {'statistics': args.stats, 'ci_width': args.ci_width, 'confidence': args.confidence, 'min_rounds': args.min_rounds, 'max_rounds': args.max_rounds}
+    else:
+        adaptive = None
+    
+    # Number of rounds and stop reason of each algorithm
+    cell_summaries = {}
     
     # Check if output directory exists
     if not os.path.isdir(out_dir):
@@ -128,9 +239,7 @@ if __name__ == '__main__':
     
     # Prepare file for benchmark results
     results_file_name = out_dir+"results_"+datetime.now().strftime("%Y-%m-%d_%H-%M-%S")+".csv"
-    results_file = open(results_file_name, "a")
-    results_file.write("Signature Algorithm,Test Round,Success,Handshake Duration [ms]"+"\n")
-    results_file.close()
+    results = ResultsSink(results_file_name, header="Signature Algorithm,Test Round,"+("Key Exchange,Cipher Suite," if tls_columns else "")+"Success,Handshake Duration [ms]"+(",Resumption" if resumption else "")+(",Certificate Compression,Server Certificate [B],Server Certificate Uncompressed [B],Client Certificate [B],Client Certificate Uncompressed [B],Received [B],Sent [B]" if cert_comp else "")+(",Client CPU [ms],Cycles,Instructions" if cpu_stats else ""), checkpoint=args.checkpoint)
     
     # Perform benchmark test for each signature algorithm
     for alg, port in algs.items():
@@ -143,8 +252,15 @@ if __name__ == '__main__':
         else:
             algname = alg
         
-        # Run s_timer benchmark test
-        run_benchmark_test(alg, algname, rounds, dest_ip, port)
+        # Run s_timer benchmark test for every key exchange group and cipher suite
+        summaries = [run_benchmark_test(alg, algname, rounds, dest_ip, port, group, ciphersuite) for group, ciphersuite in tls_configs]
+        cell_summaries[alg] = {'tls_configs': summaries} if tls_columns else summaries[0]
+        
+        # Checkpoint the results of the algorithm (depending on the checkpoint mode)
+        results.cell_completed()
+    
+    # Write the remaining results and the manifest of the completed run
+    results.finish({"signature_algorithms": list(algs), "rounds": rounds, "adaptive": adaptive, "resumption": resumption, "cert_comp": cert_comp, "cpu_stats": cpu_stats, "tls_configs": tls_configs if tls_columns else None, "server_ip": dest_ip, "cells": cell_summaries})
     
     print('\033[1;32mSUCCESS:\tResults were stored in "{}". Finished.\033[0m'.format(results_file_name), file=sys.stdout)
     sys.exit(0)
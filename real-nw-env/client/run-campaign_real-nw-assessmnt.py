@@ -0,0 +1,321 @@
+##############################################################################################
+##      Title:           Concurrent Multi-Target Post-Quantum TLS Campaign                  ##
+##                                                                                          ##
+##      Description:     Benchmarks the TLS servers of several targets (e.g. locations) at  ##
+##                       once with s_timer. Every target has its own worker, which          ##
+##                       interleaves the signature algorithms round-robin in batches, so    ##
+##                       that drift of the network is spread evenly over the algorithms.    ##
+##                       The rows of all targets are streamed into one results file.        ##
+##                                                                                          ##
+##############################################################################################
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Shared helpers of the benchmark runners (bench-common/ of the repository, or next to this script in the container)
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path[:0] = [str(SCRIPT_DIR / "bench-common"), str(SCRIPT_DIR.parent.parent / "bench-common")]
+from adaptive_sampling import STOP_FIXED, AdaptiveSampler, parse_statistics
+from results_sink import CHECKPOINT_PER_CELL, ResultsSink, parse_checkpoint
+from stimer_output import HEADER_LINES, parse_record
+
+# The signature algorithms, their ports and the path of s_timer are the ones of the single-target benchmarker
+spec = importlib.util.spec_from_file_location("real_nw_assessmnt", SCRIPT_DIR / "run-bench_real-nw-assessmnt.py")
+real_nw_assessmnt = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(real_nw_assessmnt)
+algs = real_nw_assessmnt.algs
+STIMER_BINARY = real_nw_assessmnt.STIMER_BINARY
+
+# Number of times a batch of an algorithm is repeated after s_timer stopped printing records within -timeout,
+# before its unfinished rounds are recorded as failed
+MAX_TIMEOUT_RETRIES = 4
+
+
+class CampaignAborted(Exception):
+    pass
+
+
+class BenchmarkUnit:
+    # One algorithm (with a key exchange group and cipher suite) of a target, measured in batches of rounds
+
+    def __init__(self, alg, port, group, ciphersuite):
+        self.alg = alg
+        # For RSA, replace ":" with "" for the alg name used in the file paths
+        self.algname = alg.replace(":", "") if alg.startswith("RSA") else alg
+        self.port = port
+        self.group = group
+        self.ciphersuite = ciphersuite
+        self.timeouts = 0
+        self.total_timeouts = 0
+        # Number of the next test round, the rounds of an algorithm are numbered across its batches
+        self.next_round = 1
+        if adaptive:
+            self.sampler = AdaptiveSampler(adaptive['statistics'], adaptive['ci_width'], adaptive['confidence'], adaptive['min_rounds'], adaptive['max_rounds'])
+            self.open_rounds = self.sampler.next_rounds(0)
+        else:
+            self.sampler = None
+            self.open_rounds = rounds
+
+    def rounds_done(self):
+        return self.next_round - 1
+
+    def next_batch(self):
+        return min(self.open_rounds, batch_rounds)
+
+    def finish_batch(self, run_rounds, finished_rounds):
+        self.open_rounds -= finished_rounds
+        # In adaptive mode, ask the sampler whether more rounds are needed once the requested ones are done
+        if self.sampler and self.open_rounds == 0:
+            self.open_rounds = self.sampler.next_rounds(self.rounds_done())
+        return
+
+    def summary(self):
+        if self.sampler:
+            summary = self.sampler.summary(self.rounds_done())
+        else:
+            summary = {'stop_reason': STOP_FIXED}
+        summary['rounds'] = self.rounds_done()
+        summary['timeouts'] = self.total_timeouts
+        if tls_columns:
+            summary.update(group=self.group, ciphersuite=self.ciphersuite)
+        return summary
+
+    def info(self):
+        return '"{}"{}'.format(self.alg, ' ({}, {})'.format(self.group, self.ciphersuite) if tls_columns else '')
+
+
+async def run_ping(target, dest_ip):
+    # Prepare file for output, one per target
+    ping_file_name = out_dir+"ping_"+target+"_"+datetime.now().strftime("%Y-%m-%d_%H-%M-%S")+".txt"
+
+    print('\033[1;34mINFO:\t\tMeasuring RTT and Packet Loss to "{}" ({}).\033[0m'.format(target, dest_ip), file=sys.stdout)
+    ping_process = await asyncio.create_subprocess_exec('ping', '-c', '10', str(dest_ip), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    ping_output, _ = await ping_process.communicate()
+
+    # Write output to file
+    with open(ping_file_name, "a") as ping_file:
+        ping_file.write(bytes.decode(ping_output, 'utf-8'))
+    return
+
+
+async def next_line(stream):
+    # Returns the next line of s_timer, None once it has ended, raises asyncio.TimeoutError after -timeout seconds
+    line = await asyncio.wait_for(stream.readline(), timeout)
+    if not line:
+        return None
+    return bytes.decode(line, 'utf-8', errors='replace').rstrip()
+
+
+async def run_batch(target, dest_ip, unit, run_rounds):
+    # Runs s_timer for a batch of rounds of unit and writes the rows as they arrive
+    # Returns the number of finished rounds and whether s_timer timed out
+    pki_path = "./pki/pki-{}".format(unit.algname)
+    tls_values = [unit.group, unit.ciphersuite] if tls_columns else []
+    tls_args = ['--groups='+unit.group, '--ciphersuites='+unit.ciphersuite] if tls_columns else []
+    resumption_args = ['--resumption='+resumption['mode'], '--resumption-ratio='+str(resumption['ratio'])] if resumption else []
+    cert_comp_args = ['--cert-comp='+cert_comp] if cert_comp else []
+    cpu_stats_args = ['--cpu-stats'] if cpu_stats else []
+
+    stimer_process = await asyncio.create_subprocess_exec(
+        STIMER_BINARY, '-h', '{}:{}'.format(dest_ip, unit.port), '-r', str(run_rounds),
+        '--cert='+pki_path+"/client/client.crt", '--key='+pki_path+"/client/client.key",
+        '--rootcert='+pki_path+"/ca/ca.crt", '--chaincert='+pki_path+"/ica/ica.crt",
+        *resumption_args, *tls_args, *cert_comp_args, *cpu_stats_args,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+
+    finished_rounds = 0
+    try:
+        s_time_header = []
+        while len(s_time_header) < HEADER_LINES and (line := await next_line(stimer_process.stdout)) is not None:
+            s_time_header.append(line)
+
+        # Check that OpenSSL 3.2.0 was used (no older version) and that the provider could be loaded
+        # Note: s_timer outputs the OpenSSL version in the first and the provider status in the second output line
+        if not s_time_header or s_time_header[0].find('OpenSSL 3.2.0 ') < 0:
+            raise CampaignAborted('Wrong OpenSSL version in s_timer')
+        if len(s_time_header) < 2 or s_time_header[1].find('provider loaded successfully') < 0:
+            raise CampaignAborted('OQS-Provider in s_timer not loaded')
+
+        # Write the results as they arrive, tagged by the target
+        # Note: If connection was unsuccessful (success=false), a value of -1.0ms is returned as measurement
+        while (line := await next_line(stimer_process.stdout)) is not None:
+            record = parse_record(line)
+            if record is None:
+                continue
+            measurement, success, handshake_type, message_sizes, cpu_usage, _ = record
+            results.write_row([target, unit.alg, unit.next_round] + tls_values + [success, measurement] + ([handshake_type] if resumption else []) + message_sizes + cpu_usage)
+            if unit.sampler and success == "1":
+                unit.sampler.add(float(measurement))
+            unit.next_round += 1
+            finished_rounds += 1
+        await stimer_process.wait()
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        # Also ends s_timer if the campaign is aborted or cancelled
+        if stimer_process.returncode is None:
+            stimer_process.terminate()
+            await stimer_process.wait()
+
+    return finished_rounds, timed_out
+
+
+def record_failed(target, unit, failed_rounds):
+    # The rounds are kept in the results as failed (like s_timer does for failed connections)
+    # The kind, the message sizes and the CPU usage of a handshake which did not finish are unknown
+    tls_values = [unit.group, unit.ciphersuite] if tls_columns else []
+    failed_fields = ([""] if resumption else []) + [""] * (7 if cert_comp else 0) + [""] * (3 if cpu_stats else 0)
+    for _ in range(failed_rounds):
+        results.write_row([target, unit.alg, unit.next_round] + tls_values + ["0", "-1.0"] + failed_fields)
+        unit.next_round += 1
+    return
+
+
+async def run_target(target, dest_ip):
+    # Worker of a target: runs one s_timer at a time and interleaves the algorithms round-robin, i.e. every
+    # algorithm with open rounds gets a batch of -batch rounds per pass
+    await run_ping(target, dest_ip)
+    units = [BenchmarkUnit(alg, port, group, ciphersuite) for alg, port in algs.items() for group, ciphersuite in tls_configs]
+    print('\033[1;34mINFO:\t\tStarting benchmark tests of "{}" ({} algorithms).\033[0m'.format(target, len(units)), file=sys.stdout)
+
+    passes = 0
+    while open_units := [unit for unit in units if unit.open_rounds > 0]:
+        # The first algorithm of a pass rotates, so that no algorithm always follows the same one
+        offset = passes % len(open_units)
+        for unit in open_units[offset:] + open_units[:offset]:
+            run_rounds = unit.next_batch()
+            finished_rounds, timed_out = await run_batch(target, dest_ip, unit, run_rounds)
+            unfinished_rounds = run_rounds - finished_rounds
+
+            if unfinished_rounds > 0:
+                unit.timeouts += 1
+                unit.total_timeouts += timed_out
+                reason = 'Timeout of {}s reached'.format(timeout) if timed_out else 's_timer ended after {} of {} rounds'.format(finished_rounds, run_rounds)
+                if unit.timeouts <= MAX_TIMEOUT_RETRIES:
+                    # The unfinished rounds stay open and are repeated in the next pass
+                    print('\033[1;31mERROR:\t\t{} for {} at "{}". Repeating the {} unfinished round(s) in the next pass.\033[0m'.format(reason, unit.info(), target, unfinished_rounds), file=sys.stderr)
+                else:
+                    print('\033[1;31mERROR:\t\t{} at "{}" did not finish {} times. Recording {} round(s) as failed.\033[0m'.format(unit.info(), target, unit.timeouts, unfinished_rounds), file=sys.stderr)
+                    record_failed(target, unit, unfinished_rounds)
+                    finished_rounds = run_rounds
+                    unit.timeouts = 0
+            else:
+                unit.timeouts = 0
+            unit.finish_batch(run_rounds, finished_rounds)
+
+            if unit.open_rounds == 0:
+                print('\033[1;34mINFO:\t\t{} at "{}" finished after {} rounds.\033[0m'.format(unit.info(), target, unit.rounds_done()), file=sys.stdout)
+                # Checkpoint the results of the algorithm (depending on the checkpoint mode), without blocking the other targets
+                await asyncio.to_thread(results.cell_completed)
+        passes += 1
+
+    print('\033[1;32mSUCCESS:\t"{}" finished after {} passes.\033[0m'.format(target, passes), file=sys.stdout)
+
+    # Number of rounds and stop reason of each algorithm
+    cells = {}
+    for alg in algs:
+        summaries = [unit.summary() for unit in units if unit.alg == alg]
+        cells[alg] = {'tls_configs': summaries} if tls_columns else summaries[0]
+    return {'server_ip': dest_ip, 'passes': passes, 'cells': cells}
+
+
+async def run_campaign():
+    # All targets are measured at the same time, each by its own worker
+    summaries = await asyncio.gather(*[run_target(target, dest_ip) for target, dest_ip in targets.items()])
+    return dict(zip(targets, summaries))
+
+
+def parse_target(value):
+    # Argument type for the "-target" option: NAME=IP
+    name, separator, dest_ip = value.partition('=')
+    if not separator or not name or not dest_ip or ',' in name:
+        raise ValueError('invalid target {}, use NAME=IP'.format(value))
+    return name, dest_ip
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Concurrent Multi-Target Post-Quantum TLS Campaign',
+        description='Benchmarking Post-Quantum TLS Handshake performance of several targets at once using different signature algorithms with s_timer.')
+    parser.add_argument('-target', help='name and IP address of a TLS server, e.g. zurich=192.0.2.10, can be given several times', metavar='NAME=IP', type=parse_target, action='append', required=True)
+    parser.add_argument('-rounds', help='the number of times the test should be performed for every algorithm and target, default is 10', metavar='INT', type=int, default='10', required=False)
+    parser.add_argument('-batch', help='the number of rounds of an algorithm before the next algorithm of the target is measured, the first algorithm of every pass rotates, default is 10', metavar='INT', type=int, default='10', required=False)
+    parser.add_argument('-timeout', help='seconds after which a batch is aborted if s_timer printed no record, its unfinished rounds are repeated in the next pass and recorded as failed after {} attempts, default is 60'.format(MAX_TIMEOUT_RETRIES), metavar='FLOAT', type=float, default='60', required=False)
+    parser.add_argument('-out', help='path to directory where the results should be saved to', metavar='<dir path>', required=True)
+    parser.add_argument('-checkpoint', help='when the results are flushed and synced to disk, "cell" (after every algorithm of a target) or a number of rows, default is cell', metavar='cell|INT', type=parse_checkpoint, default=CHECKPOINT_PER_CELL, required=False)
+    parser.add_argument('-adaptive', help='if set, every algorithm runs until the confidence intervals of -stats are narrower than -ci-width (instead of -rounds)', action='store_true', required=False)
+    parser.add_argument('-stats', help='statistics whose confidence intervals decide when an adaptive algorithm stops, default is median,p95', metavar='median,pNN,...', type=parse_statistics, default='median,p95', required=False)
+    parser.add_argument('-ci-width', help='target width of the confidence intervals relative to the estimate in adaptive mode, default is 0.05', metavar='FLOAT', type=float, default='0.05', required=False)
+    parser.add_argument('-confidence', help='confidence level of the intervals in adaptive mode, default is 0.95', metavar='FLOAT', type=float, default='0.95', required=False)
+    parser.add_argument('-min-rounds', help='minimum number of rounds per algorithm in adaptive mode, default is 30', metavar='INT', type=int, default='30', required=False)
+    parser.add_argument('-max-rounds', help='maximum number of rounds per algorithm in adaptive mode, default is 1000', metavar='INT', type=int, default='1000', required=False)
+    parser.add_argument('-resumption', help='if set, s_timer establishes a session first and measures resumed handshakes (PSK with (EC)DHE, PSK only or with early data)', choices=['psk-dhe', 'psk', 'early-data'], required=False)
+    parser.add_argument('-resumption-ratio', help='share of the rounds which are resumed with -resumption, the others are full handshakes, default is 1.0', metavar='FLOAT', type=float, default='1.0', required=False)
+    parser.add_argument('-groups', help='comma-separated key exchange groups to measure for every algorithm (e.g. x25519,kyber768,x25519_kyber768), default is the group of s_timer', metavar='GROUP,...', type=lambda value: value.split(','), required=False)
+    parser.add_argument('-ciphersuites', help='comma-separated TLS 1.3 cipher suites to measure for every algorithm and group, default is TLS_AES_256_GCM_SHA384', metavar='SUITE,...', type=lambda value: value.split(','), required=False)
+    parser.add_argument('-cert-comp', help='certificate compression (RFC 8879) offered by s_timer, the algorithms separated by ":" (e.g. zlib:brotli:zstd) or none, the compression and sizes of the certificates are added to the results', metavar='ALG:...|none', required=False)
+    parser.add_argument('-cpu-stats', help='if set, s_timer also measures the CPU time and (where perf_event_open is permitted) the cycles and instructions of the client during every handshake, which are added to the results', action='store_true', required=False)
+
+    args = parser.parse_args()
+
+    rounds = args.rounds
+    batch_rounds = args.batch
+    timeout = args.timeout
+    out_dir = args.out
+    resumption = {'mode': args.resumption, 'ratio': args.resumption_ratio} if args.resumption else None
+    cert_comp = args.cert_comp
+    cpu_stats = args.cpu_stats
+
+    # Targets by name, every name is a value of the "Target" column
+    targets = dict(args.target)
+    if len(targets) < len(args.target):
+        print('\033[1;31mERROR:\t\tThe names of the targets have to be unique.\033[0m', file=sys.stderr)
+        sys.exit(-1)
+
+    if batch_rounds < 1:
+        print('\033[1;31mERROR:\t\tA batch requires at least one round.\033[0m', file=sys.stderr)
+        sys.exit(-1)
+
+    # Key exchange groups and cipher suites, every combination is measured for every algorithm
+    # Note: The servers accept all groups of the oqs-provider and the default cipher suites of OpenSSL
+    tls_columns = args.groups is not None or args.ciphersuites is not None
+    tls_configs = list(itertools.product(args.groups or ['x25519_kyber768'], args.ciphersuites or ['TLS_AES_256_GCM_SHA384'])) if tls_columns else [(None, None)]
+
+    # Settings of the adaptive sample size (None for a fixed number of rounds per algorithm)
+    if args.adaptive:
+        if not 0 < args.min_rounds <= args.max_rounds:
+            print('\033[1;31mERROR:\t\tAdaptive mode requires 0 < -min-rounds <= -max-rounds.\033[0m', file=sys.stderr)
+            sys.exit(-1)
+        adaptive = {'statistics': args.stats, 'ci_width': args.ci_width, 'confidence': args.confidence, 'min_rounds': args.min_rounds, 'max_rounds': args.max_rounds}
+    else:
+        adaptive = None
+
+    # Check if output directory exists
+    if not os.path.isdir(out_dir):
+        print('\033[1;31mERROR:\t\tDirectory "{}" does not exist. Please provide a directory to store the resulting files in.\033[0m'.format(out_dir), file=sys.stderr)
+        sys.exit(-1)
+
+    # Prepare one file for the benchmark results of all targets
+    results_file_name = out_dir+"results_"+datetime.now().strftime("%Y-%m-%d_%H-%M-%S")+".csv"
+    results = ResultsSink(results_file_name, header="Target,Signature Algorithm,Test Round,"+("Key Exchange,Cipher Suite," if tls_columns else "")+"Success,Handshake Duration [ms]"+(",Resumption" if resumption else "")+(",Certificate Compression,Server Certificate [B],Server Certificate Uncompressed [B],Client Certificate [B],Client Certificate Uncompressed [B],Received [B],Sent [B]" if cert_comp else "")+(",Client CPU [ms],Cycles,Instructions" if cpu_stats else ""), checkpoint=args.checkpoint)
+
+    try:
+        target_summaries = asyncio.run(run_campaign())
+    except CampaignAborted as error:
+        # Keep the rows measured so far, but publish no manifest of an incomplete run
+        results.close()
+        print('\033[1;31mERROR:\t\t{}. Aborting.\033[0m'.format(error), file=sys.stderr)
+        sys.exit(-1)
+
+    # Write the remaining results and the manifest of the completed run
+    results.finish({"signature_algorithms": list(algs), "rounds": rounds, "batch_rounds": batch_rounds, "adaptive": adaptive, "resumption": resumption, "cert_comp": cert_comp, "cpu_stats": cpu_stats, "tls_configs": tls_configs if tls_columns else None, "targets": target_summaries})
+
+    print('\033[1;32mSUCCESS:\tResults were stored in "{}". Finished.\033[0m'.format(results_file_name), file=sys.stdout)
+    sys.exit(0)
@@ -0,0 +1,742 @@
+/*
+ * Benchmark TLS server for s_timer.
+ *
+ * Drop-in replacement for the openssl s_server invocations of the benchmark
+ * runners: it takes the same options (-accept, -cert, -key, -CAfile,
+ * -chainCAfile, -verify/-Verify, ...) and prints ACCEPT as soon as it
+ * listens. Unlike s_server, the connections are accepted by a pool of worker
+ * threads, and the wall time and CPU time the server spends on every
+ * handshake are recorded, with the CPU time split into signing (server
+ * CertificateVerify) and verification (client certificate chain and
+ * CertificateVerify).
+ *
+ * With -records, every handshake is appended as a CSV line to that file (stdout
+ * only carries the ACCEPT line the runners wait for):
+ *
+ *   accepted_ns,wall_ms,cpu_ms,sign_cpu_ms,verify_cpu_ms,success,type,group
+ *
+ * accepted_ns is the time of the accept in ns since the epoch (to relate the
+ * records to the cells of a benchmark), wall_ms and cpu_ms are measured from
+ * the accept until the handshake is done. The CPU times are the ones of the
+ * worker thread, which performs the whole handshake.
+ */
+
+#include <errno.h>
+#include <getopt.h>
+#include <netdb.h>
+#include <pthread.h>
+#include <signal.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <time.h>
+#include <unistd.h>
+
+#include <openssl/conf.h>
+#include <openssl/err.h>
+#include <openssl/pem.h>
+#include <openssl/ssl.h>
+#include <openssl/x509.h>
+
+#define NS_IN_MS 1000000.0
+#define MS_IN_S 1000
+#define NS_IN_S 1000000000L
+
+// Port of s_server if -accept is not given
+#define DEFAULT_PORT "4433"
+
+// Backlog of the listening socket, the clients of an open-loop s_timer run
+// may connect faster than the workers accept
+#define LISTEN_BACKLOG 1024
+
+// Session ID context of the server, required to resume sessions with client
+// authentication
+#define SESSION_ID_CONTEXT "bench_server"
+
+// Maximum length of the output line of a single handshake
+#define RECORD_SIZE 256
+
+// Kinds of handshakes (as in s_timer)
+enum handshake_type {
+  HANDSHAKE_FULL,
+  HANDSHAKE_PSK_DHE,
+  HANDSHAKE_PSK,
+  HANDSHAKE_EARLY_DATA,
+};
+
+static const char *handshake_type_names[] = {"full", "psk_dhe", "psk",
+                                             "early_data"};
+
+// Command line options, named as the ones of openssl s_server
+struct arguments {
+  const char *host;
+  const char *port;
+  const char *cert;
+  const char *key;
+  const char *ca_file;
+  const char *chain_ca_file;
+  int verify_mode;
+  int verify_depth;
+  bool verify_return_error;
+  bool ignore_unexpected_eof;
+  const char *keylog_file;
+  bool allow_no_dhe_kex;
+  bool early_data;
+  bool cert_comp;
+  const char *groups;
+  const char *ciphersuites;
+  const char *config_file;
+  long workers;
+  const char *records_file;
+  long timeout;
+};
+
+static struct arguments arguments;
+
+enum option_key {
+  OPT_ACCEPT = 256,
+  OPT_CERT,
+  OPT_KEY,
+  OPT_CA_FILE,
+  OPT_CHAIN_CA_FILE,
+  OPT_VERIFY,
+  OPT_VERIFY_REQUIRED,
+  OPT_VERIFY_RETURN_ERROR,
+  OPT_TLS1_3,
+  OPT_IGNORE_UNEXPECTED_EOF,
+  OPT_KEYLOG_FILE,
+  OPT_ALLOW_NO_DHE_KEX,
+  OPT_EARLY_DATA,
+  OPT_CERT_COMP,
+  OPT_GROUPS,
+  OPT_CIPHERSUITES,
+  OPT_QUIET,
+  OPT_CONFIG,
+  OPT_WORKERS,
+  OPT_RECORDS,
+  OPT_TIMEOUT,
+  OPT_HELP,
+};
+
+static const struct option options[] = {
+    {"accept", required_argument, NULL, OPT_ACCEPT},
+    {"cert", required_argument, NULL, OPT_CERT},
+    {"key", required_argument, NULL, OPT_KEY},
+    {"CAfile", required_argument, NULL, OPT_CA_FILE},
+    {"chainCAfile", required_argument, NULL, OPT_CHAIN_CA_FILE},
+    {"verify", required_argument, NULL, OPT_VERIFY},
+    {"Verify", required_argument, NULL, OPT_VERIFY_REQUIRED},
+    {"verify_return_error", no_argument, NULL, OPT_VERIFY_RETURN_ERROR},
+    {"tls1_3", no_argument, NULL, OPT_TLS1_3},
+    {"ignore_unexpected_eof", no_argument, NULL, OPT_IGNORE_UNEXPECTED_EOF},
+    {"keylogfile", required_argument, NULL, OPT_KEYLOG_FILE},
+    {"allow_no_dhe_kex", no_argument, NULL, OPT_ALLOW_NO_DHE_KEX},
+    {"early_data", no_argument, NULL, OPT_EARLY_DATA},
+    {"cert_comp", no_argument, NULL, OPT_CERT_COMP},
+    {"groups", required_argument, NULL, OPT_GROUPS},
+    {"ciphersuites", required_argument, NULL, OPT_CIPHERSUITES},
+    {"quiet", no_argument, NULL, OPT_QUIET},
+    {"config", required_argument, NULL, OPT_CONFIG},
+    {"workers", required_argument, NULL, OPT_WORKERS},
+    {"records", required_argument, NULL, OPT_RECORDS},
+    {"timeout", required_argument, NULL, OPT_TIMEOUT},
+    {"help", no_argument, NULL, OPT_HELP},
+    {0}};
+
+static void usage(FILE *stream, const char *program) {
+  fprintf(
+      stream,
+      "Usage: %s -cert PATH -key PATH [OPTION...]\n"
+      "TLS 1.3 server for the s_timer benchmarks, which records the wall and "
+      "CPU time of every handshake.\n\n"
+      "Options of openssl s_server:\n"
+      "  -accept [HOST:]PORT     Address to listen on (default port 4433)\n"
+      "  -cert PATH              Server certificate\n"
+      "  -key PATH               Server key\n"
+      "  -CAfile PATH            CA certificates to verify client "
+      "certificates\n"
+      "  -chainCAfile PATH       Certificates sent with the server "
+      "certificate\n"
+      "  -verify DEPTH           Request a client certificate\n"
+      "  -Verify DEPTH           Require a client certificate\n"
+      "  -verify_return_error    Fail the handshake if the client "
+      "certificate is invalid\n"
+      "  -tls1_3                 Only TLS 1.3 (always)\n"
+      "  -ignore_unexpected_eof  Accept connections closed without "
+      "close_notify\n"
+      "  -keylogfile PATH        Write the session secrets to PATH\n"
+      "  -allow_no_dhe_kex       Allow PSK-only resumption\n"
+      "  -early_data             Accept early data (0-RTT)\n"
+      "  -cert_comp              Pre-compress the certificates (RFC 8879)\n"
+      "  -groups LIST            Key exchange groups, separated by \":\"\n"
+      "  -ciphersuites LIST      TLS 1.3 cipher suites, separated by \":\"\n"
+      "  -quiet                  Ignored, the server prints no connection "
+      "details\n\n"
+      "Options of the benchmark server:\n"
+      "  -config PATH            OpenSSL config file that loads the "
+      "oqs-provider (default OPENSSL_CONF)\n"
+      "  -workers INT            Number of worker threads (default number of "
+      "CPU cores)\n"
+      "  -records PATH           Append the handshake records to PATH (CSV, "
+      "not recorded without it)\n"
+      "  -timeout SEC            Close connections which are idle for SEC "
+      "seconds (default 30)\n",
+      program);
+}
+
+static bool parse_arguments(int argc, char *argv[]) {
+  int key;
+  while ((key = getopt_long_only(argc, argv, "", options, NULL)) != -1) {
+    switch (key) {
+    case OPT_ACCEPT: {
+      // [HOST:]PORT, as in s_server
+      char *separator = strrchr(optarg, ':');
+      if (separator) {
+        *separator = '\0';
+        arguments.host = optarg;
+        arguments.port = separator + 1;
+      } else {
+        arguments.port = optarg;
+      }
+      break;
+    }
+    case OPT_CERT:
+      arguments.cert = optarg;
+      break;
+    case OPT_KEY:
+      arguments.key = optarg;
+      break;
+    case OPT_CA_FILE:
+      arguments.ca_file = optarg;
+      break;
+    case OPT_CHAIN_CA_FILE:
+      arguments.chain_ca_file = optarg;
+      break;
+    case OPT_VERIFY:
+      arguments.verify_mode = SSL_VERIFY_PEER | SSL_VERIFY_CLIENT_ONCE;
+      arguments.verify_depth = atoi(optarg);
+      break;
+    case OPT_VERIFY_REQUIRED:
+      arguments.verify_mode = SSL_VERIFY_PEER | SSL_VERIFY_CLIENT_ONCE |
+                              SSL_VERIFY_FAIL_IF_NO_PEER_CERT;
+      arguments.verify_depth = atoi(optarg);
+      break;
+    case OPT_VERIFY_RETURN_ERROR:
+      arguments.verify_return_error = true;
+      break;
+    case OPT_TLS1_3:
+    case OPT_QUIET:
+      break;
+    case OPT_IGNORE_UNEXPECTED_EOF:
+      arguments.ignore_unexpected_eof = true;
+      break;
+    case OPT_KEYLOG_FILE:
+      arguments.keylog_file = optarg;
+      break;
+    case OPT_ALLOW_NO_DHE_KEX:
+      arguments.allow_no_dhe_kex = true;
+      break;
+    case OPT_EARLY_DATA:
+      arguments.early_data = true;
+      break;
+    case OPT_CERT_COMP:
+      arguments.cert_comp = true;
+      break;
+    case OPT_GROUPS:
+      arguments.groups = optarg;
+      break;
+    case OPT_CIPHERSUITES:
+      arguments.ciphersuites = optarg;
+      break;
+    case OPT_CONFIG:
+      arguments.config_file = optarg;
+      break;
+    case OPT_WORKERS:
+      arguments.workers = atol(optarg);
+      break;
+    case OPT_RECORDS:
+      arguments.records_file = optarg;
+      break;
+    case OPT_TIMEOUT:
+      arguments.timeout = atol(optarg);
+      break;
+    case OPT_HELP:
+      usage(stdout, argv[0]);
+      exit(0);
+    default:
+      usage(stderr, argv[0]);
+      return false;
+    }
+  }
+  if (optind < argc || !arguments.cert || !arguments.key) {
+    usage(stderr, argv[0]);
+    return false;
+  }
+  return true;
+}
+
+// Output of the handshake records and of the session secrets, shared by the
+// workers
+static FILE *records_out = NULL;
+static FILE *keylog_out = NULL;
+static pthread_mutex_t keylog_lock = PTHREAD_MUTEX_INITIALIZER;
+
+static int listen_fd = -1;
+static SSL_CTX *ssl_ctx = NULL;
+
+static double elapsed_ms(const struct timespec *start,
+                         const struct timespec *finish) {
+  return ((finish->tv_sec - start->tv_sec) * MS_IN_S) +
+         ((finish->tv_nsec - start->tv_nsec) / NS_IN_MS);
+}
+
+// CPU time the current thread has used so far
+static struct timespec thread_cpu_time(void) {
+  struct timespec now;
+  clock_gettime(CLOCK_THREAD_CPUTIME_ID, &now);
+  return now;
+}
+
+// CPU time spent on signing and verifying in the current handshake, set by the
+// callbacks below (attached to the SSL object as app data)
+struct handshake_cpu {
+  struct timespec certificate_sent;
+  struct timespec certificate_verify_received;
+  bool certificate_verify_seen;
+  double sign_ms;
+  double verify_ms;
+};
+
+// Called for every handshake message as soon as it is sent or received (but
+// before a received message is processed)
+// The server CertificateVerify is signed between writing the Certificate and
+// the CertificateVerify message, the one of the client is verified between
+// receiving the CertificateVerify and the Finished message of the client
+static void cpu_msg_callback(int write_p, int version, int content_type,
+                             const void *buf, size_t len, SSL *ssl,
+                             void *arg) {
+  struct handshake_cpu *cpu = SSL_get_app_data(ssl);
+  (void)version;
+  (void)arg;
+  if (!cpu || content_type != SSL3_RT_HANDSHAKE || len == 0) {
+    return;
+  }
+  int msg_type = ((const unsigned char *)buf)[0];
+  bool certificate = msg_type == SSL3_MT_CERTIFICATE;
+#ifdef SSL3_MT_COMPRESSED_CERTIFICATE
+  certificate = certificate || msg_type == SSL3_MT_COMPRESSED_CERTIFICATE;
+#endif
+  struct timespec now = thread_cpu_time();
+  if (write_p && certificate) {
+    cpu->certificate_sent = now;
+  } else if (write_p && msg_type == SSL3_MT_CERTIFICATE_VERIFY) {
+    cpu->sign_ms += elapsed_ms(&cpu->certificate_sent, &now);
+  } else if (!write_p && msg_type == SSL3_MT_CERTIFICATE_VERIFY) {
+    cpu->certificate_verify_received = now;
+    cpu->certificate_verify_seen = true;
+  } else if (!write_p && msg_type == SSL3_MT_FINISHED &&
+             cpu->certificate_verify_seen) {
+    cpu->verify_ms += elapsed_ms(&cpu->certificate_verify_received, &now);
+  }
+}
+
+// Verifies the client certificate chain as OpenSSL would, and measures it
+static int timed_cert_verify_callback(X509_STORE_CTX *store_ctx, void *arg) {
+  (void)arg;
+  SSL *ssl = X509_STORE_CTX_get_ex_data(store_ctx,
+                                        SSL_get_ex_data_X509_STORE_CTX_idx());
+  struct handshake_cpu *cpu = ssl ? SSL_get_app_data(ssl) : NULL;
+  struct timespec start = thread_cpu_time();
+  int ret = X509_verify_cert(store_ctx);
+  struct timespec finish = thread_cpu_time();
+  if (cpu) {
+    cpu->verify_ms += elapsed_ms(&start, &finish);
+  }
+  return ret;
+}
+
+// As s_server, an invalid client certificate only fails the handshake with
+// -verify_return_error
+static int verify_callback(int ok, X509_STORE_CTX *store_ctx) {
+  (void)store_ctx;
+  return arguments.verify_return_error ? ok : 1;
+}
+
+static void keylog_callback(const SSL *ssl, const char *line) {
+  (void)ssl;
+  pthread_mutex_lock(&keylog_lock);
+  fputs(line, keylog_out);
+  fputc('\n', keylog_out);
+  fflush(keylog_out);
+  pthread_mutex_unlock(&keylog_lock);
+}
+
+// Kind of a completed handshake, as negotiated with the client
+static enum handshake_type handshake_type(SSL *ssl) {
+  EVP_PKEY *peer_key = NULL;
+  if (!SSL_session_reused(ssl)) {
+    return HANDSHAKE_FULL;
+  }
+  if (SSL_get_early_data_status(ssl) == SSL_EARLY_DATA_ACCEPTED) {
+    return HANDSHAKE_EARLY_DATA;
+  }
+  // Without (EC)DHE, the client key share is not used
+  if (!SSL_get_peer_tmp_key(ssl, &peer_key)) {
+    return HANDSHAKE_PSK;
+  }
+  EVP_PKEY_free(peer_key);
+  return HANDSHAKE_PSK_DHE;
+}
+
+// Performs the handshake, reading the early data of the client (if any)
+static bool accept_handshake(SSL *ssl) {
+  if (arguments.early_data) {
+    char buffer[1024];
+    size_t read_bytes;
+    int ret;
+    do {
+      ret = SSL_read_early_data(ssl, buffer, sizeof(buffer), &read_bytes);
+    } while (ret == SSL_READ_EARLY_DATA_SUCCESS);
+    if (ret == SSL_READ_EARLY_DATA_ERROR) {
+      return false;
+    }
+  }
+  return SSL_accept(ssl) == 1;
+}
+
+static void print_record(const struct timespec *accepted, double wall_ms,
+                         double cpu_ms, const struct handshake_cpu *cpu,
+                         SSL *ssl, bool success) {
+  char record[RECORD_SIZE];
+  const char *group = NULL;
+  if (!records_out) {
+    return;
+  }
+  if (success) {
+    group = SSL_group_to_name(ssl, SSL_get_negotiated_group(ssl));
+  }
+  snprintf(record, sizeof(record), "%lld,%f,%f,%f,%f,%i,%s,%s",
+           (long long)accepted->tv_sec * NS_IN_S + accepted->tv_nsec, wall_ms,
+           cpu_ms, cpu->sign_ms, cpu->verify_ms, success,
+           success ? handshake_type_names[handshake_type(ssl)] : "",
+           group ? group : "");
+
+  // The workers write their records in the order the handshakes finish
+  flockfile(records_out);
+  fputs(record, records_out);
+  fputc('\n', records_out);
+  fflush(records_out);
+  funlockfile(records_out);
+}
+
+// Handles one connection: the handshake is measured and recorded, afterwards
+// the connection is kept open until the client closes it
+static void serve_connection(int fd) {
+  struct handshake_cpu cpu;
+  struct timespec accepted, start, finish, cpu_start, cpu_finish;
+  char buffer[1024];
+
+  clock_gettime(CLOCK_REALTIME, &accepted);
+  clock_gettime(CLOCK_MONOTONIC_RAW, &start);
+  cpu_start = thread_cpu_time();
+  memset(&cpu, 0, sizeof(cpu));
+
+  // A client which was killed in the middle of a handshake must not block the
+  // worker forever
+  struct timeval timeout = {.tv_sec = arguments.timeout};
+  setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof(timeout));
+  setsockopt(fd, SOL_SOCKET, SO_SNDTIMEO, &timeout, sizeof(timeout));
+
+  SSL *ssl = SSL_new(ssl_ctx);
+  if (!ssl) {
+    ERR_print_errors_fp(stderr);
+    close(fd);
+    return;
+  }
+  SSL_set_fd(ssl, fd);
+  SSL_set_app_data(ssl, &cpu);
+
+  bool success = accept_handshake(ssl);
+  clock_gettime(CLOCK_MONOTONIC_RAW, &finish);
+  cpu_finish = thread_cpu_time();
+  print_record(&accepted, elapsed_ms(&start, &finish),
+               elapsed_ms(&cpu_start, &cpu_finish), &cpu, ssl, success);
+
+  if (success) {
+    // Wait for the client to close the connection (s_timer reads the session
+    // tickets until the server closes it as well)
+    while (SSL_read(ssl, buffer, sizeof(buffer)) > 0) {
+    }
+    SSL_shutdown(ssl);
+  }
+  ERR_clear_error();
+  SSL_free(ssl);
+  close(fd);
+}
+
+static void *connection_worker(void *arg) {
+  (void)arg;
+  for (;;) {
+    int fd = accept(listen_fd, NULL, NULL);
+    if (fd < 0) {
+      if (errno == EINTR || errno == ECONNABORTED) {
+        continue;
+      }
+      perror("accept");
+      return NULL;
+    }
+    serve_connection(fd);
+  }
+}
+
+// Returns a socket listening on the -accept address, -1 on failure
+static int open_listener(void) {
+  struct addrinfo hints = {.ai_family = AF_UNSPEC,
+                           .ai_socktype = SOCK_STREAM,
+                           .ai_flags = AI_PASSIVE};
+  struct addrinfo *addresses;
+  int fd = -1;
+
+  int ret = getaddrinfo(arguments.host, arguments.port, &hints, &addresses);
+  if (ret != 0) {
+    fprintf(stderr, "Invalid address %s: %s\n", arguments.port,
+            gai_strerror(ret));
+    return -1;
+  }
+  // Prefer a dual-stack IPv6 socket (as s_server), but fall back to IPv4
+  for (int family = 0; family < 2 && fd < 0; family++) {
+    for (struct addrinfo *address = addresses; address && fd < 0;
+         address = address->ai_next) {
+      if ((address->ai_family == AF_INET6) != (family == 0)) {
+        continue;
+      }
+      fd = socket(address->ai_family, address->ai_socktype,
+                  address->ai_protocol);
+      if (fd < 0) {
+        continue;
+      }
+      int on = 1;
+      setsockopt(fd, SOL_SOCKET, SO_REUSEADDR, &on, sizeof(on));
+      if (bind(fd, address->ai_addr, address->ai_addrlen) != 0 ||
+          listen(fd, LISTEN_BACKLOG) != 0) {
+        close(fd);
+        fd = -1;
+      }
+    }
+  }
+  freeaddrinfo(addresses);
+  if (fd < 0) {
+    perror("Failed to listen");
+  }
+  return fd;
+}
+
+// Adds all certificates of path to the chain sent with the server certificate
+static bool add_chain_certs(const char *path) {
+  FILE *file = fopen(path, "r");
+  X509 *cert;
+  int count = 0;
+  if (!file) {
+    return false;
+  }
+  while ((cert = PEM_read_X509(file, NULL, NULL, NULL))) {
+    if (!SSL_CTX_add0_chain_cert(ssl_ctx, cert)) {
+      X509_free(cert);
+      fclose(file);
+      return false;
+    }
+    count++;
+  }
+  fclose(file);
+  // The end of the file is reported as error
+  ERR_clear_error();
+  return count > 0;
+}
+
+static bool setup_context(void) {
+  ssl_ctx = SSL_CTX_new(TLS_server_method());
+  if (!ssl_ctx || !SSL_CTX_set_min_proto_version(ssl_ctx, TLS1_3_VERSION) ||
+      !SSL_CTX_set_max_proto_version(ssl_ctx, TLS1_3_VERSION)) {
+    return false;
+  }
+  SSL_CTX_set_options(ssl_ctx, SSL_OP_NO_COMPRESSION);
+  if (arguments.ignore_unexpected_eof) {
+    SSL_CTX_set_options(ssl_ctx, SSL_OP_IGNORE_UNEXPECTED_EOF);
+  }
+  if (arguments.allow_no_dhe_kex) {
+    SSL_CTX_set_options(ssl_ctx, SSL_OP_ALLOW_NO_DHE_KEX);
+  }
+  if (arguments.ciphersuites &&
+      !SSL_CTX_set_ciphersuites(ssl_ctx, arguments.ciphersuites)) {
+    return false;
+  }
+  if (arguments.groups &&
+      !SSL_CTX_set1_groups_list(ssl_ctx, arguments.groups)) {
+    return false;
+  }
+
+  if (SSL_CTX_use_certificate_file(ssl_ctx, arguments.cert,
+                                   SSL_FILETYPE_PEM) <= 0 ||
+      SSL_CTX_use_PrivateKey_file(ssl_ctx, arguments.key, SSL_FILETYPE_PEM) <=
+          0 ||
+      !SSL_CTX_check_private_key(ssl_ctx)) {
+    fprintf(stderr, "Error loading the server certificate and key.\n");
+    return false;
+  }
+  if (arguments.chain_ca_file && !add_chain_certs(arguments.chain_ca_file)) {
+    fprintf(stderr, "Error loading the chain certificates from %s.\n",
+            arguments.chain_ca_file);
+    return false;
+  }
+
+  // As s_server, the CA names are sent in the CertificateRequest
+  if (arguments.ca_file) {
+    STACK_OF(X509_NAME) *ca_names = SSL_load_client_CA_file(arguments.ca_file);
+    if (!ca_names ||
+        !SSL_CTX_load_verify_locations(ssl_ctx, arguments.ca_file, NULL)) {
+      fprintf(stderr, "Error loading the CA certificates from %s.\n",
+              arguments.ca_file);
+      sk_X509_NAME_pop_free(ca_names, X509_NAME_free);
+      return false;
+    }
+    SSL_CTX_set_client_CA_list(ssl_ctx, ca_names);
+  }
+  if (arguments.verify_mode != SSL_VERIFY_NONE) {
+    SSL_CTX_set_verify(ssl_ctx, arguments.verify_mode, verify_callback);
+    SSL_CTX_set_verify_depth(ssl_ctx, arguments.verify_depth);
+  }
+  SSL_CTX_set_cert_verify_callback(ssl_ctx, timed_cert_verify_callback, NULL);
+  SSL_CTX_set_msg_callback(ssl_ctx, cpu_msg_callback);
+
+  if (!SSL_CTX_set_session_id_context(
+          ssl_ctx, (const unsigned char *)SESSION_ID_CONTEXT,
+          strlen(SESSION_ID_CONTEXT))) {
+    return false;
+  }
+  if (arguments.early_data) {
+    SSL_CTX_set_max_early_data(ssl_ctx, SSL3_RT_MAX_PLAIN_LENGTH);
+  }
+  if (arguments.cert_comp) {
+#ifdef SSL_OP_NO_TX_CERTIFICATE_COMPRESSION
+    if (!SSL_CTX_compress_certs(ssl_ctx, 0)) {
+      fprintf(stderr, "Failed to compress the certificates.\n");
+      return false;
+    }
+#else
+    fprintf(stderr, "Certificate compression requires OpenSSL 3.2.\n");
+    return false;
+#endif
+  }
+  if (keylog_out) {
+    SSL_CTX_set_keylog_callback(ssl_ctx, keylog_callback);
+  }
+  return true;
+}
+
+int main(int argc, char *argv[]) {
+  int ret = 1;
+
+  arguments.port = DEFAULT_PORT;
+  arguments.timeout = 30;
+  arguments.workers = sysconf(_SC_NPROCESSORS_ONLN);
+  if (!parse_arguments(argc, argv)) {
+    return 1;
+  }
+  if (arguments.workers < 1) {
+    arguments.workers = 1;
+  }
+  // A client closing its connection early must not terminate the server
+  signal(SIGPIPE, SIG_IGN);
+
+  // Load the oqs-provider, otherwise it is loaded from OPENSSL_CONF
+  if (arguments.config_file &&
+      CONF_modules_load_file(arguments.config_file, NULL, 0) <= 0) {
+    fprintf(stderr, "Error loading OQS provider from %s\n",
+            arguments.config_file);
+    goto ossl_error;
+  }
+
+  // The records are appended, so that a restarted server keeps the earlier ones
+  if (arguments.records_file) {
+    records_out = fopen(arguments.records_file, "a");
+    if (!records_out) {
+      perror(arguments.records_file);
+      return 1;
+    }
+  }
+  if (arguments.keylog_file) {
+    keylog_out = fopen(arguments.keylog_file, "a");
+    if (!keylog_out) {
+      perror(arguments.keylog_file);
+      goto end;
+    }
+  }
+
+  if (!setup_context()) {
+    goto ossl_error;
+  }
+
+  listen_fd = open_listener();
+  if (listen_fd < 0) {
+    goto end;
+  }
+  // Only a new (empty) file gets the header
+  // Note: The size is taken from the file itself, as ftell of a file opened for
+  // appending may report 0 (e.g. with musl) before the first write
+  struct stat records_stat;
+  if (records_out && fstat(fileno(records_out), &records_stat) == 0 &&
+      records_stat.st_size == 0) {
+    fputs("accepted_ns,wall_ms,cpu_ms,sign_cpu_ms,verify_cpu_ms,success,type,"
+          "group\n",
+          records_out);
+    fflush(records_out);
+  }
+  // The runners wait for ACCEPT, as with s_server
+  printf("ACCEPT\n");
+  fflush(stdout);
+
+  // The workers accept the connections on the shared socket, the server runs
+  // until it is terminated
+  pthread_t *workers = malloc(arguments.workers * sizeof(*workers));
+  long started = 0;
+  if (!workers) {
+    fprintf(stderr, "Memory allocation failed.\n");
+    goto end;
+  }
+  while (started < arguments.workers &&
+         pthread_create(&workers[started], NULL, connection_worker, NULL) ==
+             0) {
+    started++;
+  }
+  if (started < arguments.workers) {
+    fprintf(stderr, "Started %ld of %ld workers.\n", started,
+            arguments.workers);
+  }
+  for (long i = 0; i < started; i++) {
+    pthread_join(workers[i], NULL);
+  }
+  free(workers);
+  goto end;
+
+ossl_error:
+  fprintf(stderr, "Unrecoverable OpenSSL error.\n");
+  ERR_print_errors_fp(stderr);
+
+end:
+  if (listen_fd >= 0) {
+    close(listen_fd);
+  }
+  SSL_CTX_free(ssl_ctx);
+  if (keylog_out) {
+    fclose(keylog_out);
+  }
+  if (records_out) {
+    fclose(records_out);
+  }
+  return ret;
+}
@@ -0,0 +1,526 @@
+/*
+ * PKI builder for the benchmark runners.
+ *
+ * Sets up the PKI (Root CA, Intermediate CA, server and client certificate)
+ * of one or more signature algorithms inside a single process, instead of a
+ * dozen openssl CLI invocations per algorithm. The oqs-provider and the CA
+ * configs are loaded once, the directory layout is the same as the one of
+ * the openssl CLI based setup in bench-common/pki_builder.py:
+ *
+ *   ca/ca.{key,crt}, ica/ica.{key,csr,crt}, server/server.{key,csr,crt},
+ *   client/client.{key,csr,crt}, plus serial, index.txt and the issued
+ *   certificates (<serial>.pem) in the CA directories.
+ */
+
+#include <argp.h>
+#include <errno.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+
+#include <openssl/bn.h>
+#include <openssl/conf.h>
+#include <openssl/err.h>
+#include <openssl/evp.h>
+#include <openssl/pem.h>
+#include <openssl/x509.h>
+#include <openssl/x509v3.h>
+
+#define SUBJECT_PREFIX                                                         \
+  "/C=CH/ST=Zug/L=Rotkreuz/O=Lucerne University of Applied Sciences and "      \
+  "Arts/OU=Applied Cyber Security Research Lab/CN="
+
+// Serial number of the first certificate issued by a CA (as in the serial
+// file written by the CLI based setup)
+#define FIRST_SERIAL 0x1000
+
+#define MAX_PATH 4096
+// Leaves room for the file names in the directory of an entity
+#define MAX_DIR (MAX_PATH - 64)
+#define MAX_NAME 512
+
+// Command Line Argument Parser
+const char *argp_program_version = "pki_builder-0.0.1";
+static char doc[] =
+    "Sets up the PKI (Root CA, Intermediate CA, server and client "
+    "certificate) of each ALG in DIR within a single process.";
+static char args_doc[] = "--rca-config=PATH --ica-config=PATH ALG DIR "
+                         "[ALG DIR ...]";
+static struct argp_option options[] = {
+    {"rca-config", 1, "PATH", 0,
+     "Path to the Root CA config (loads the oqs-provider and defines the "
+     "v3_ca and v3_intermediate_ca extensions)."},
+    {"ica-config", 2, "PATH", 0,
+     "Path to the Intermediate CA config (defines the server_cert "
+     "extensions)."},
+    {"ca-days", 3, "INT", 0, "Validity of the Root CA certificate in days."},
+    {"ica-days", 4, "INT", 0,
+     "Validity of the Intermediate CA certificate in days."},
+    {"ee-days", 5, "INT", 0,
+     "Validity of the server and client certificate in days."},
+    {0}};
+
+struct arguments {
+  char *rca_config;
+  char *ica_config;
+  long ca_days;
+  long ica_days;
+  long ee_days;
+  char **pkis;
+  int pki_count;
+};
+
+static struct arguments arguments;
+
+static error_t parse_opt(int key, char *arg, struct argp_state *state) {
+  struct arguments *arguments = state->input;
+  switch (key) {
+  case 1:
+    arguments->rca_config = arg;
+    break;
+  case 2:
+    arguments->ica_config = arg;
+    break;
+  case 3:
+    arguments->ca_days = atol(arg);
+    break;
+  case 4:
+    arguments->ica_days = atol(arg);
+    break;
+  case 5:
+    arguments->ee_days = atol(arg);
+    break;
+  case ARGP_KEY_ARGS:
+    arguments->pkis = state->argv + state->next;
+    arguments->pki_count = state->argc - state->next;
+    break;
+  case ARGP_KEY_END:
+    if (arguments->pki_count == 0 || arguments->pki_count % 2 != 0) {
+      argp_usage(state);
+    }
+    break;
+  default:
+    return ARGP_ERR_UNKNOWN;
+  }
+  return 0;
+}
+
+static struct argp argp = {options, parse_opt, args_doc, doc};
+
+// A CA (or end entity) of the chain under construction
+struct entity {
+  EVP_PKEY *key;
+  X509 *cert;
+  char dir[MAX_DIR];
+  long next_serial;
+};
+
+static CONF *load_config(const char *path) {
+  CONF *conf = NCONF_new(NULL);
+  long error_line = -1;
+  if (!conf || NCONF_load(conf, path, &error_line) <= 0) {
+    fprintf(stderr, "Error loading config %s (line %ld)\n", path, error_line);
+    NCONF_free(conf);
+    return NULL;
+  }
+  return conf;
+}
+
+static int make_dir(const char *path) {
+  if (mkdir(path, 0755) != 0 && errno != EEXIST) {
+    fprintf(stderr, "Error creating directory %s: %s\n", path,
+            strerror(errno));
+    return 1;
+  }
+  return 0;
+}
+
+// Note: ECDSA and RSA need additional arguments than EdDSA and PQC
+static EVP_PKEY *generate_key(const char *alg) {
+  if (strncmp(alg, "ECDSA", 5) == 0) {
+    return EVP_PKEY_Q_keygen(NULL, NULL, "EC", alg + 5);
+  }
+  if (strncmp(alg, "RSA:", 4) == 0) {
+    return EVP_PKEY_Q_keygen(NULL, NULL, "RSA", (size_t)atol(alg + 4));
+  }
+  return EVP_PKEY_Q_keygen(NULL, NULL, alg);
+}
+
+// Same as the openssl CLI: the digest is ignored for algorithms which sign
+// the message directly (EdDSA and the PQC signatures)
+static const EVP_MD *sign_digest(EVP_PKEY *key) {
+  char name[80];
+  if (EVP_PKEY_get_default_digest_name(key, name, sizeof(name)) == 2 &&
+      strcmp(name, "UNDEF") == 0) {
+    return NULL;
+  }
+  return EVP_sha256();
+}
+
+// Parses a subject of the form /C=CH/ST=Zug/.../CN=name
+static X509_NAME *parse_subject(const char *subject) {
+  X509_NAME *name = X509_NAME_new();
+  char buffer[MAX_NAME];
+  if (!name || strlen(subject) >= sizeof(buffer)) {
+    X509_NAME_free(name);
+    return NULL;
+  }
+  strcpy(buffer, subject);
+
+  char *saveptr = NULL;
+  for (char *rdn = strtok_r(buffer, "/", &saveptr); rdn;
+       rdn = strtok_r(NULL, "/", &saveptr)) {
+    char *value = strchr(rdn, '=');
+    if (!value) {
+      X509_NAME_free(name);
+      return NULL;
+    }
+    *value++ = '\0';
+    if (!X509_NAME_add_entry_by_txt(name, rdn, MBSTRING_UTF8,
+                                    (unsigned char *)value, -1, -1, 0)) {
+      X509_NAME_free(name);
+      return NULL;
+    }
+  }
+  return name;
+}
+
+// Like openssl ca with preserve = no: only the fields of the policy of the
+// signing CA are taken from the request, in the order of the policy
+static X509_NAME *apply_policy(CONF *signer_conf, const X509_NAME *requested) {
+  const char *ca_section =
+      NCONF_get_string(signer_conf, "ca", "default_ca");
+  const char *policy =
+      ca_section ? NCONF_get_string(signer_conf, ca_section, "policy") : NULL;
+  STACK_OF(CONF_VALUE) *fields =
+      policy ? NCONF_get_section(signer_conf, policy) : NULL;
+  if (!fields) {
+    return X509_NAME_dup(requested);
+  }
+
+  X509_NAME *name = X509_NAME_new();
+  if (!name) {
+    return NULL;
+  }
+  for (int i = 0; i < sk_CONF_VALUE_num(fields); i++) {
+    int nid = OBJ_txt2nid(sk_CONF_VALUE_value(fields, i)->name);
+    int last = -1;
+    while ((last = X509_NAME_get_index_by_NID(requested, nid, last)) >= 0) {
+      if (!X509_NAME_add_entry(name, X509_NAME_get_entry(requested, last), -1,
+                               0)) {
+        X509_NAME_free(name);
+        return NULL;
+      }
+    }
+  }
+  return name;
+}
+
+static int write_key(const char *path, EVP_PKEY *key) {
+  FILE *file = fopen(path, "w");
+  if (!file) {
+    fprintf(stderr, "Error opening %s\n", path);
+    return 1;
+  }
+  int ret = PEM_write_PrivateKey(file, key, NULL, NULL, 0, NULL, NULL);
+  fclose(file);
+  return ret == 1 ? 0 : 1;
+}
+
+static int write_cert(const char *path, X509 *cert) {
+  FILE *file = fopen(path, "w");
+  if (!file) {
+    fprintf(stderr, "Error opening %s\n", path);
+    return 1;
+  }
+  int ret = PEM_write_X509(file, cert);
+  fclose(file);
+  return ret == 1 ? 0 : 1;
+}
+
+static int write_req(const char *path, X509_REQ *req) {
+  FILE *file = fopen(path, "w");
+  if (!file) {
+    fprintf(stderr, "Error opening %s\n", path);
+    return 1;
+  }
+  int ret = PEM_write_X509_REQ(file, req);
+  fclose(file);
+  return ret == 1 ? 0 : 1;
+}
+
+// Writes serial and index.txt of a CA directory, so that it can still be used
+// with openssl ca afterwards
+static int write_ca_database(struct entity *ca, X509 **issued, int count) {
+  char path[MAX_PATH];
+  FILE *file;
+
+  snprintf(path, sizeof(path), "%s/serial", ca->dir);
+  if (!(file = fopen(path, "w"))) {
+    fprintf(stderr, "Error opening %s\n", path);
+    return 1;
+  }
+  fprintf(file, "%lX\n", ca->next_serial);
+  fclose(file);
+
+  snprintf(path, sizeof(path), "%s/index.txt", ca->dir);
+  if (!(file = fopen(path, "w"))) {
+    fprintf(stderr, "Error opening %s\n", path);
+    return 1;
+  }
+  for (int i = 0; i < count; i++) {
+    char subject[MAX_NAME];
+    const ASN1_TIME *not_after = X509_get0_notAfter(issued[i]);
+    long serial = ASN1_INTEGER_get(X509_get0_serialNumber(issued[i]));
+    X509_NAME_oneline(X509_get_subject_name(issued[i]), subject,
+                      sizeof(subject));
+    fprintf(file, "V\t%.*s\t\t%lX\tunknown\t%s\n", not_after->length,
+            (const char *)not_after->data, serial, subject);
+
+    // Copy of the issued certificate in new_certs_dir
+    char cert_path[MAX_PATH];
+    snprintf(cert_path, sizeof(cert_path), "%s/%lX.pem", ca->dir, serial);
+    if (write_cert(cert_path, issued[i]) != 0) {
+      fclose(file);
+      return 1;
+    }
+  }
+  fclose(file);
+  return 0;
+}
+
+// Creates the certificate of subject, signed by issuer (or self-signed if
+// issuer is NULL), with the extensions of section in conf
+static X509 *issue_cert(struct entity *subject, struct entity *issuer,
+                        const X509_NAME *name, CONF *conf,
+                        const char *section, long days) {
+  X509 *cert = X509_new();
+  bool ok = cert != NULL;
+
+  ok = ok && X509_set_version(cert, X509_VERSION_3);
+  if (issuer) {
+    ok = ok &&
+         ASN1_INTEGER_set(X509_get_serialNumber(cert), issuer->next_serial++);
+  } else {
+    // Random serial number for the self-signed Root CA (as openssl req -x509)
+    BIGNUM *serial = BN_new();
+    ok = ok && serial && BN_rand(serial, 63, BN_RAND_TOP_ANY, BN_RAND_BOTTOM_ANY);
+    ok = ok && BN_to_ASN1_INTEGER(serial, X509_get_serialNumber(cert));
+    BN_free(serial);
+  }
+  ok = ok && X509_set_subject_name(cert, name);
+  ok = ok && X509_set_issuer_name(cert, issuer ? X509_get_subject_name(
+                                                     issuer->cert)
+                                               : name);
+  ok = ok && X509_gmtime_adj(X509_getm_notBefore(cert), 0);
+  ok = ok && X509_time_adj_ex(X509_getm_notAfter(cert), days, 0, NULL);
+  ok = ok && X509_set_pubkey(cert, subject->key);
+
+  if (ok) {
+    X509V3_CTX ctx;
+    X509V3_set_ctx(&ctx, issuer ? issuer->cert : cert, cert, NULL, NULL, 0);
+    X509V3_set_nconf(&ctx, conf);
+    ok = X509V3_EXT_add_nconf(conf, &ctx, section, cert);
+  }
+
+  EVP_PKEY *signer_key = issuer ? issuer->key : subject->key;
+  ok = ok && X509_sign(cert, signer_key, sign_digest(signer_key)) > 0;
+  if (!ok) {
+    X509_free(cert);
+    return NULL;
+  }
+  return cert;
+}
+
+// Creates key, CSR and certificate of an entity signed by issuer
+static int setup_entity(const char *alg, const char *pki_dir, const char *name,
+                        const char *subject_suffix, struct entity *entity,
+                        struct entity *issuer, CONF *signer_conf,
+                        CONF *ext_conf, const char *section, long days) {
+  char path[MAX_PATH], subject[MAX_NAME];
+  X509_NAME *requested = NULL, *granted = NULL;
+  X509_REQ *req = NULL;
+  int ret = 1;
+
+  snprintf(entity->dir, sizeof(entity->dir), "%s/%s", pki_dir, name);
+  entity->next_serial = FIRST_SERIAL;
+  if (make_dir(entity->dir) != 0) {
+    return 1;
+  }
+
+  entity->key = generate_key(alg);
+  if (!entity->key) {
+    fprintf(stderr, "Error generating %s key of %s\n", name, alg);
+    return 1;
+  }
+  snprintf(path, sizeof(path), "%s/%s.key", entity->dir, name);
+  if (write_key(path, entity->key) != 0) {
+    return 1;
+  }
+
+  snprintf(subject, sizeof(subject), "%s%s%s", SUBJECT_PREFIX,
+           strncmp(alg, "ECDSA", 5) == 0 ? alg + 5 : alg, subject_suffix);
+  requested = parse_subject(subject);
+  req = X509_REQ_new();
+  if (!requested || !req || !X509_REQ_set_version(req, X509_REQ_VERSION_1) ||
+      !X509_REQ_set_subject_name(req, requested) ||
+      !X509_REQ_set_pubkey(req, entity->key) ||
+      X509_REQ_sign(req, entity->key, sign_digest(entity->key)) <= 0) {
+    fprintf(stderr, "Error creating %s CSR of %s\n", name, alg);
+    goto end;
+  }
+  snprintf(path, sizeof(path), "%s/%s.csr", entity->dir, name);
+  if (write_req(path, req) != 0) {
+    goto end;
+  }
+
+  granted = apply_policy(signer_conf, requested);
+  entity->cert = granted ? issue_cert(entity, issuer, granted, ext_conf,
+                                      section, days)
+                         : NULL;
+  if (!entity->cert) {
+    fprintf(stderr, "Error creating %s certificate of %s\n", name, alg);
+    goto end;
+  }
+  snprintf(path, sizeof(path), "%s/%s.crt", entity->dir, name);
+  ret = write_cert(path, entity->cert);
+
+end:
+  X509_NAME_free(requested);
+  X509_NAME_free(granted);
+  X509_REQ_free(req);
+  return ret;
+}
+
+static void free_entity(struct entity *entity) {
+  EVP_PKEY_free(entity->key);
+  X509_free(entity->cert);
+}
+
+// Sets up the whole chain CA -> ICA -> server/client of alg in pki_dir
+static int build_pki(const char *alg, const char *pki_dir, CONF *rca_conf,
+                     CONF *ica_conf) {
+  struct entity ca = {0}, ica = {0}, server = {0}, client = {0};
+  char path[MAX_PATH], subject[MAX_NAME];
+  X509_NAME *name = NULL;
+  int ret = 1;
+
+  if (make_dir(pki_dir) != 0) {
+    return 1;
+  }
+
+  // Create CA key and self-signed certificate
+  snprintf(ca.dir, sizeof(ca.dir), "%s/ca", pki_dir);
+  ca.next_serial = FIRST_SERIAL;
+  if (make_dir(ca.dir) != 0) {
+    goto end;
+  }
+  ca.key = generate_key(alg);
+  if (!ca.key) {
+    fprintf(stderr, "Error generating CA key of %s\n", alg);
+    goto end;
+  }
+  snprintf(path, sizeof(path), "%s/ca.key", ca.dir);
+  if (write_key(path, ca.key) != 0) {
+    goto end;
+  }
+  snprintf(subject, sizeof(subject), "%s%s - Test Root CA", SUBJECT_PREFIX,
+           strncmp(alg, "ECDSA", 5) == 0 ? alg + 5 : alg);
+  name = parse_subject(subject);
+  ca.cert =
+      name ? issue_cert(&ca, NULL, name, rca_conf, "v3_ca", arguments.ca_days)
+           : NULL;
+  if (!ca.cert) {
+    fprintf(stderr, "Error creating CA certificate of %s\n", alg);
+    goto end;
+  }
+  snprintf(path, sizeof(path), "%s/ca.crt", ca.dir);
+  if (write_cert(path, ca.cert) != 0) {
+    goto end;
+  }
+
+  // Create Intermediate-CA, server and client key, CSR and certificate
+  if (setup_entity(alg, pki_dir, "ica", " - Test Intermediate CA", &ica, &ca,
+                   rca_conf, rca_conf, "v3_intermediate_ca",
+                   arguments.ica_days) != 0 ||
+      setup_entity(alg, pki_dir, "server", " - Server Certificate", &server,
+                   &ica, ica_conf, ica_conf, "server_cert",
+                   arguments.ee_days) != 0 ||
+      setup_entity(alg, pki_dir, "client", " - Client Certificate", &client,
+                   &ica, ica_conf, ica_conf, "server_cert",
+                   arguments.ee_days) != 0) {
+    goto end;
+  }
+
+  X509 *ca_issued[] = {ica.cert};
+  X509 *ica_issued[] = {server.cert, client.cert};
+  if (write_ca_database(&ca, ca_issued, 1) != 0 ||
+      write_ca_database(&ica, ica_issued, 2) != 0) {
+    goto end;
+  }
+  ret = 0;
+
+end:
+  if (ret != 0) {
+    ERR_print_errors_fp(stderr);
+  }
+  X509_NAME_free(name);
+  free_entity(&ca);
+  free_entity(&ica);
+  free_entity(&server);
+  free_entity(&client);
+  return ret;
+}
+
+int main(int argc, char *args[]) {
+  int ret = 0;
+  CONF *rca_conf = NULL, *ica_conf = NULL;
+
+  // Prepare for CLI arguments parsing
+  // Note: Same validity as in bench-common/pki_builder.py
+  arguments.rca_config = "";
+  arguments.ica_config = "";
+  arguments.ca_days = 7300;
+  arguments.ica_days = 3650;
+  arguments.ee_days = 365;
+  arguments.pkis = NULL;
+  arguments.pki_count = 0;
+
+  // Parse the CLI arguments
+  argp_parse(&argp, argc, args, 0, 0, &arguments);
+
+  // Load the OQS provider once for all PKIs (from the openssl_init section of
+  // the Root CA config)
+  if (CONF_modules_load_file(arguments.rca_config, NULL, 0) <= 0) {
+    fprintf(stderr, "Error loading OQS provider from %s\n",
+            arguments.rca_config);
+    ERR_print_errors_fp(stderr);
+    return 1;
+  }
+
+  rca_conf = load_config(arguments.rca_config);
+  ica_conf = load_config(arguments.ica_config);
+  if (!rca_conf || !ica_conf) {
+    ret = 1;
+    goto end;
+  }
+
+  // A failing algorithm does not stop the others
+  for (int i = 0; i < arguments.pki_count; i += 2) {
+    const char *alg = arguments.pkis[i];
+    const char *pki_dir = arguments.pkis[i + 1];
+    if (build_pki(alg, pki_dir, rca_conf, ica_conf) == 0) {
+      printf("%s PKI set up in %s\n", alg, pki_dir);
+    } else {
+      fprintf(stderr, "%s PKI setup failed\n", alg);
+      ret = 1;
+    }
+  }
+
+end:
+  NCONF_free(rca_conf);
+  NCONF_free(ica_conf);
+  return ret;
+}
@@ -19,11 +19,20 @@
  */
 
 #include <argp.h>
+#include <errno.h>
+#include <math.h>
+#include <pthread.h>
+#include <stdatomic.h>
 #include <stdbool.h>
+#include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/syscall.h>
 #include <time.h>
+#include <unistd.h>
+
+#include <linux/perf_event.h>
 
 #include <openssl/conf.h>
 #include <openssl/err.h>
@@ -32,6 +41,107 @@
 
 #define NS_IN_MS 1000000.0
 #define MS_IN_S 1000
+#define NS_IN_S 1000000000L
+
+// Default number of workers in open-loop mode, enough that handshakes rarely
+// have to wait for a free worker
+#define OPEN_LOOP_WORKERS 64
+
+// Time between the start of the workers and the first arrival in open-loop
+// mode, so that all workers are ready
+#define OPEN_LOOP_LEAD_MS 10
+
+// Maximum length of the output line of a single handshake
+#define RECORD_SIZE 256
+
+// Phases of a handshake reported with --phases, each ends with the event of
+// the same name (see handshake_phases)
+enum phase {
+  PHASE_CONNECT,            // TCP connection established
+  PHASE_SERVER_HELLO,       // ServerHello received
+  PHASE_CERTIFICATE,        // server Certificate received
+  PHASE_CERTIFICATE_VERIFY, // server chain and CertificateVerify verified
+  PHASE_FINISHED,           // client Finished sent
+  PHASE_COUNT
+};
+
+// Kinds of handshakes, the resumed ones are measured with --resumption
+enum handshake_type {
+  HANDSHAKE_FULL,       // full handshake with certificate authentication
+  HANDSHAKE_PSK_DHE,    // resumption with PSK and (EC)DHE
+  HANDSHAKE_PSK,        // resumption with PSK only
+  HANDSHAKE_EARLY_DATA, // PSK-DHE resumption with accepted early data (0-RTT)
+};
+
+static const char *handshake_type_names[] = {"full", "psk_dhe", "psk",
+                                             "early_data"};
+
+// Application data sent as early data in --resumption=early-data mode
+#define EARLY_DATA "s_timer early data\n"
+
+// Certificate compression algorithms (RFC 8879), indexed by their code point
+#define CERT_COMP_ALGORITHMS 4
+static const char *cert_comp_names[CERT_COMP_ALGORITHMS] = {"none", "zlib",
+                                                            "brotli", "zstd"};
+
+// Size of the messages of a handshake, recorded with --cert-comp. The sizes
+// of the Certificate messages include their 4 byte handshake header, the
+// uncompressed size of a compressed certificate is the one announced in the
+// CompressedCertificate message.
+struct handshake_bytes {
+  // Compression algorithm of the server certificate (0 for uncompressed)
+  int32_t server_cert_comp;
+  uint32_t server_cert_bytes;
+  uint32_t server_cert_uncompressed_bytes;
+  uint32_t client_cert_bytes;
+  uint32_t client_cert_uncompressed_bytes;
+  uint32_t reserved;
+  // Bytes received and sent on the TCP connection until the handshake is done
+  uint64_t received;
+  uint64_t sent;
+};
+
+// Computation of a handshake in the thread which performed it, recorded with
+// --cpu-stats. The hardware counters only count user space (as permitted with
+// perf_event_paranoid up to 2) and are -1 if perf_event_open is not permitted.
+struct handshake_cpu {
+  int64_t cpu_ns;
+  int64_t cycles;
+  int64_t instructions;
+};
+
+// Binary output (--binary-out): a header, followed by one fixed-width record
+// per handshake in the order the handshakes finish. All integers are in host
+// byte order, the reader detects the byte order from the version.
+// See bench-common/stimer_records.py
+#define BINARY_MAGIC "STIMERB"
+#define BINARY_VERSION 3
+
+struct binary_header {
+  char magic[8];
+  uint32_t version;
+  uint32_t record_size;
+  uint32_t phase_count;
+  uint32_t reserved;
+};
+
+struct binary_record {
+  uint64_t round;
+  // Start and end of the handshake in ns since the start of the run
+  int64_t start_ns;
+  int64_t end_ns;
+  // 1 if the handshake was successful, 0 otherwise
+  int32_t status;
+  // Kind of the handshake (enum handshake_type)
+  int32_t type;
+  // End of each phase in ns since the start of the handshake, -1 if the phase
+  // was not reached or --phases is not set
+  int64_t phase_end_ns[PHASE_COUNT];
+  // Message sizes, all 0 if --cert-comp is not set or the handshake failed
+  struct handshake_bytes bytes;
+  // Computation, all -1 if --cpu-stats is not set
+  struct handshake_cpu cpu;
+};
 
 // Command Line Argument Parser
 const char *argp_program_version = "s_timer-0.0.1";
@@ -50,6 +160,47 @@ static struct argp_option options[] = {
     {"chaincert", 3, "PATH", 0, "Path to the Intermediate-CA certificate."},
     {"cert", 4, "PATH", 0, "Path to the client certificate."},
     {"key", 5, "PATH", 0, "Path to the client key."},
+    {"phases", 6, 0, 0,
+     "Also report the duration of each handshake phase (connect, "
+     "ServerHello, Certificate, CertificateVerify, Finished)."},
+    {"concurrency", 7, "INT", 0,
+     "Number of workers performing handshakes in parallel (closed loop), "
+     "reports the handshake rate and the p50/p90/p99/max latency under load "
+     "in a Load: line. Default 1 (64 with --rate)."},
+    {"rate", 8, "FLOAT", 0,
+     "Open loop: start handshakes at this rate (handshakes/s) for --duration "
+     "seconds, regardless of when earlier handshakes finish. The latency is "
+     "measured from the scheduled start. Replaces -r."},
+    {"duration", 9, "FLOAT", 0, "Duration of the open-loop run in seconds."},
+    {"arrival", 10, "constant|poisson", 0,
+     "Arrival process of the open-loop run. Default constant."},
+    {"seed", 11, "INT", 0, "Seed of the Poisson arrivals."},
+    {"binary-out", 12, "PATH", 0,
+     "Write the handshakes as fixed-width binary records to PATH (a file or "
+     "pipe) instead of printing them as text (struct binary_record)."},
+    {"resumption", 13, "psk-dhe|psk|early-data", 0,
+     "Establish a session with an unmeasured full handshake first and resume "
+     "it in the measured rounds (PSK with (EC)DHE, PSK only or PSK-DHE with "
+     "early data). New session tickets are read outside of the measured "
+     "time. The kind of every handshake is added to its record."},
+    {"resumption-ratio", 14, "FLOAT", 0,
+     "Share of the rounds which are resumed with --resumption, the others are "
+     "full handshakes. Default 1.0."},
+    {"groups", 15, "LIST", 0,
+     "Key exchange groups offered to the server, separated by \":\" (e.g. "
+     "x25519, kyber1024 or p384_kyber768). Default x25519_kyber768."},
+    {"ciphersuites", 16, "LIST", 0,
+     "TLS 1.3 cipher suites offered to the server, separated by \":\". "
+     "Default TLS_AES_256_GCM_SHA384."},
+    {"cert-comp", 17, "LIST|none", 0,
+     "Offer certificate compression with the algorithms in LIST (zlib, "
+     "brotli, zstd), separated by \":\", or disable it with none. The size of "
+     "the certificates (as sent and uncompressed) and of the handshake is "
+     "added to every record. Requires OpenSSL 3.2 unless none."},
+    {"cpu-stats", 18, 0, 0,
+     "Also report the CPU time of every handshake in the thread which "
+     "performed it and, if perf_event_open is permitted, its cycles and "
+     "instructions in user space (-1 if the counters are not available)."},
     {0}};
 
 struct arguments {
@@ -60,6 +211,22 @@ struct arguments {
   char *ica_cert;
   char *client_cert;
   char *client_key;
+  bool phases;
+  size_t concurrency;
+  double rate;
+  double duration;
+  bool poisson;
+  long seed;
+  char *binary_out;
+  enum handshake_type resumption;
+  double resumption_ratio;
+  char *groups;
+  char *ciphersuites;
+  // With --cert-comp, the algorithms in order of preference (none if empty)
+  bool cert_comp;
+  int cert_comp_algorithms[CERT_COMP_ALGORITHMS];
+  size_t cert_comp_count;
+  bool cpu_stats;
 };
 
 static struct arguments arguments;
@@ -88,6 +255,79 @@ static error_t parse_opt(int key, char *arg, struct argp_state *state) {
   case 5:
     arguments->client_key = arg;
     break;
+  case 6:
+    arguments->phases = true;
+    break;
+  case 7:
+    arguments->concurrency = atoi(arg);
+    break;
+  case 8:
+    arguments->rate = atof(arg);
+    break;
+  case 9:
+    arguments->duration = atof(arg);
+    break;
+  case 10:
+    if (strcmp(arg, "poisson") == 0) {
+      arguments->poisson = true;
+    } else if (strcmp(arg, "constant") == 0) {
+      arguments->poisson = false;
+    } else {
+      argp_error(state, "unknown arrival process %s", arg);
+    }
+    break;
+  case 11:
+    arguments->seed = atol(arg);
+    break;
+  case 12:
+    arguments->binary_out = arg;
+    break;
+  case 13:
+    if (strcmp(arg, "psk-dhe") == 0) {
+      arguments->resumption = HANDSHAKE_PSK_DHE;
+    } else if (strcmp(arg, "psk") == 0) {
+      arguments->resumption = HANDSHAKE_PSK;
+    } else if (strcmp(arg, "early-data") == 0) {
+      arguments->resumption = HANDSHAKE_EARLY_DATA;
+    } else {
+      argp_error(state, "unknown resumption mode %s", arg);
+    }
+    break;
+  case 14:
+    arguments->resumption_ratio = atof(arg);
+    if (arguments->resumption_ratio < 0.0 ||
+        arguments->resumption_ratio > 1.0) {
+      argp_error(state, "--resumption-ratio must be between 0 and 1");
+    }
+    break;
+  case 15:
+    arguments->groups = arg;
+    break;
+  case 16:
+    arguments->ciphersuites = arg;
+    break;
+  case 17:
+    arguments->cert_comp = true;
+    arguments->cert_comp_count = 0;
+    for (char *name = strtok(arg, ":"); name; name = strtok(NULL, ":")) {
+      int algorithm = 0;
+      while (algorithm < CERT_COMP_ALGORITHMS &&
+             strcmp(name, cert_comp_names[algorithm]) != 0) {
+        algorithm++;
+      }
+      if (algorithm == CERT_COMP_ALGORITHMS) {
+        argp_error(state, "unknown certificate compression algorithm %s",
+                   name);
+      } else if (algorithm > 0 &&
+                 arguments->cert_comp_count < CERT_COMP_ALGORITHMS) {
+        arguments->cert_comp_algorithms[arguments->cert_comp_count++] =
+            algorithm;
+      }
+    }
+    break;
+  case 18:
+    arguments->cpu_stats = true;
+    break;
   default:
     return ARGP_ERR_UNKNOWN;
   }
@@ -96,6 +336,73 @@ static error_t parse_opt(int key, char *arg, struct argp_state *state) {
 
 static struct argp argp = {options, parse_opt, args_doc, doc};
 
+// Clock of all measurements, the open loop needs a clock which
+// clock_nanosleep supports
+static clockid_t measurement_clock = CLOCK_MONOTONIC_RAW;
+
+// Most recent session ticket of the server, which the resumed handshakes use.
+// Every handshake stores the tickets it receives, as a ticket with early data
+// is only accepted once.
+static SSL_SESSION *resumption_session = NULL;
+static pthread_mutex_t resumption_lock = PTHREAD_MUTEX_INITIALIZER;
+
+static int store_session(SSL *ssl, SSL_SESSION *session) {
+  (void)ssl;
+  pthread_mutex_lock(&resumption_lock);
+  SSL_SESSION_free(resumption_session);
+  resumption_session = session;
+  pthread_mutex_unlock(&resumption_lock);
+  // The session is owned by resumption_session now
+  return 1;
+}
+
+static SSL_SESSION *get_session(void) {
+  pthread_mutex_lock(&resumption_lock);
+  SSL_SESSION *session = resumption_session;
+  if (session) {
+    SSL_SESSION_up_ref(session);
+  }
+  pthread_mutex_unlock(&resumption_lock);
+  return session;
+}
+
+// Reads the session tickets the server sends after the handshake, by closing
+// the connection and waiting for the server to close it as well
+static void receive_session_tickets(SSL *ssl) {
+  char buffer[256];
+  // The context shuts down quietly, which would skip reading
+  SSL_set_quiet_shutdown(ssl, 0);
+  SSL_shutdown(ssl);
+  while (SSL_read(ssl, buffer, sizeof(buffer)) > 0) {
+  }
+  ERR_clear_error();
+}
+
+// Kind of a completed handshake, as negotiated with the server
+static enum handshake_type handshake_type(SSL *ssl) {
+  EVP_PKEY *peer_key = NULL;
+  if (!SSL_session_reused(ssl)) {
+    return HANDSHAKE_FULL;
+  }
+  if (SSL_get_early_data_status(ssl) == SSL_EARLY_DATA_ACCEPTED) {
+    return HANDSHAKE_EARLY_DATA;
+  }
+  // Without (EC)DHE, the server sends no key share
+  if (!SSL_get_peer_tmp_key(ssl, &peer_key)) {
+    return HANDSHAKE_PSK;
+  }
+  EVP_PKEY_free(peer_key);
+  return HANDSHAKE_PSK_DHE;
+}
+
+// Whether round i is resumed, the resumed rounds are spread evenly according
+// to --resumption-ratio
+static bool resume_round(size_t i) {
+  return arguments.resumption != HANDSHAKE_FULL &&
+         floor((i + 1) * arguments.resumption_ratio) >
+             floor(i * arguments.resumption_ratio);
+}
+
 int loadOQSProvider(const char *providerPath) {
   // Load the OQS provider dynamically
   if (providerPath) {
@@ -107,9 +414,95 @@ int loadOQSProvider(const char *providerPath) {
   return 0;
 }
 
+// Time of the end of each phase of the current handshake, set by the
+// callbacks below (attached to the SSL object as app data)
+struct handshake_phases {
+  struct timespec end[PHASE_COUNT];
+  bool seen[PHASE_COUNT];
+};
+
+static void mark_phase(const SSL *ssl, enum phase phase) {
+  struct handshake_phases *phases = SSL_get_app_data(ssl);
+  if (phases) {
+    clock_gettime(measurement_clock, &phases->end[phase]);
+    phases->seen[phase] = true;
+  }
+}
+
+// Records the size of a Certificate or CompressedCertificate message
+// The latter starts with the algorithm (2 bytes) and the uncompressed length
+// (3 bytes) after the handshake header
+static void record_certificate(const unsigned char *msg, size_t len,
+                               int32_t *comp, uint32_t *bytes,
+                               uint32_t *uncompressed_bytes) {
+  *bytes = len;
+  *uncompressed_bytes = len;
+  if (msg[0] != SSL3_MT_CERTIFICATE && len >= 9) {
+    *comp = (msg[4] << 8) | msg[5];
+    *uncompressed_bytes = ((msg[6] << 16) | (msg[7] << 8) | msg[8]) + 4;
+  }
+}
+
+// Called for every handshake message as soon as it is sent or received (but
+// before a received message is processed)
+// The phases are attached to the SSL object as app data, the message sizes
+// (with --cert-comp) as argument of the callback
+static void handshake_msg_callback(int write_p, int version, int content_type,
+                                   const void *buf, size_t len, SSL *ssl,
+                                   void *arg) {
+  struct handshake_bytes *bytes = arg;
+  (void)version;
+  if (content_type != SSL3_RT_HANDSHAKE || len == 0) {
+    return;
+  }
+  const unsigned char *msg = buf;
+  int msg_type = msg[0];
+  bool certificate = msg_type == SSL3_MT_CERTIFICATE;
+#ifdef SSL3_MT_COMPRESSED_CERTIFICATE
+  certificate = certificate || msg_type == SSL3_MT_COMPRESSED_CERTIFICATE;
+#endif
+  if (!write_p && msg_type == SSL3_MT_SERVER_HELLO) {
+    // Note: After a HelloRetryRequest, the second ServerHello counts
+    mark_phase(ssl, PHASE_SERVER_HELLO);
+  } else if (!write_p && certificate) {
+    mark_phase(ssl, PHASE_CERTIFICATE);
+  } else if (write_p && msg_type == SSL3_MT_FINISHED) {
+    mark_phase(ssl, PHASE_FINISHED);
+  }
+
+  if (bytes && certificate && !write_p) {
+    record_certificate(msg, len, &bytes->server_cert_comp,
+                       &bytes->server_cert_bytes,
+                       &bytes->server_cert_uncompressed_bytes);
+  } else if (bytes && certificate) {
+    // The algorithm of the client certificate is the one of the server
+    // certificate if both sides prefer the same algorithms
+    int32_t client_cert_comp;
+    record_certificate(msg, len, &client_cert_comp, &bytes->client_cert_bytes,
+                       &bytes->client_cert_uncompressed_bytes);
+  }
+}
+
+// The state machine reads the server Finished only after the chain and the
+// CertificateVerify signature have been verified
+static void phase_info_callback(const SSL *ssl, int where, int ret) {
+  (void)ret;
+  if (where & SSL_CB_CONNECT_LOOP &&
+      SSL_get_state(ssl) == TLS_ST_CR_FINISHED) {
+    mark_phase(ssl, PHASE_CERTIFICATE_VERIFY);
+  }
+}
+
+static double elapsed_ms(const struct timespec *start,
+                         const struct timespec *finish) {
+  return ((finish->tv_sec - start->tv_sec) * MS_IN_S) +
+         ((finish->tv_nsec - start->tv_nsec) / NS_IN_MS);
+}
+
 // This is the function for which the time is measured,
 // therefore keep it as clean as possible
-SSL *do_tls_handshake(SSL_CTX *ssl_ctx) {
+SSL *do_tls_handshake(SSL_CTX *ssl_ctx, struct handshake_phases *phases,
+                      struct handshake_bytes *bytes, bool resume) {
   BIO *conn = NULL;
   SSL *ssl = NULL;
   int ret;
@@ -130,6 +523,38 @@ SSL *do_tls_handshake(SSL_CTX *ssl_ctx) {
 
   SSL_set_bio(ssl, conn, conn);
 
+  if (phases) {
+    // Connect explicitly, so that the TCP handshake is a phase of its own
+    if (BIO_do_connect(conn) <= 0) {
+      ERR_print_errors_fp(stderr);
+      SSL_free(ssl);
+      return NULL;
+    }
+    SSL_set_app_data(ssl, phases);
+    mark_phase(ssl, PHASE_CONNECT);
+  }
+  if (bytes) {
+    SSL_set_msg_callback_arg(ssl, bytes);
+  }
+
+  if (resume) {
+    SSL_SESSION *session = get_session();
+    if (session && SSL_set_session(ssl, session) == 1 &&
+        arguments.resumption == HANDSHAKE_EARLY_DATA &&
+        SSL_SESSION_get_max_early_data(session) > 0) {
+      // The early data is sent with the ClientHello
+      size_t written;
+      if (!SSL_write_early_data(ssl, EARLY_DATA, strlen(EARLY_DATA),
+                                &written)) {
+        ERR_print_errors_fp(stderr);
+        SSL_SESSION_free(session);
+        SSL_free(ssl);
+        return NULL;
+      }
+    }
+    SSL_SESSION_free(session);
+  }
+
   /* ok, lets connect */
   ret = SSL_connect(ssl);
   if (ret <= 0) {
@@ -151,6 +576,381 @@ SSL *do_tls_handshake(SSL_CTX *ssl_ctx) {
   return ssl;
 }
 
+// Results of all rounds, shared by the handshake workers
+// Note: Every worker claims the next round, so each round is written by one
+// worker only
+struct benchmark {
+  SSL_CTX *ssl_ctx;
+  double *handshake_times_ms;
+  bool *conn_success;
+  enum handshake_type *handshake_types;
+  double (*phase_times_ms)[PHASE_COUNT];
+  struct handshake_bytes *handshake_bytes;
+  struct handshake_cpu *handshake_cpu;
+  // Open loop: scheduled start of each round relative to schedule_start
+  double *arrival_times_ms;
+  struct timespec schedule_start;
+  // Start of the run, the times of the binary records are relative to it
+  struct timespec epoch;
+  FILE *binary_out;
+  atomic_size_t next_round;
+  atomic_bool failed;
+};
+
+// Hardware counters of a worker thread (--cpu-stats), cycles and instructions
+// are read together as a group. The file descriptors are -1 if
+// perf_event_open is not permitted (e.g. in a container).
+struct cpu_counters {
+  int cycles_fd;
+  int instructions_fd;
+};
+
+static int open_counter(uint64_t config, int group_fd) {
+  struct perf_event_attr attr;
+  memset(&attr, 0, sizeof(attr));
+  attr.size = sizeof(attr);
+  attr.type = PERF_TYPE_HARDWARE;
+  attr.config = config;
+  attr.read_format = PERF_FORMAT_GROUP;
+  attr.exclude_kernel = 1;
+  attr.exclude_hv = 1;
+  // Counts the calling thread on any CPU
+  return syscall(SYS_perf_event_open, &attr, 0, -1, group_fd, 0);
+}
+
+static struct cpu_counters open_cpu_counters(void) {
+  static atomic_bool warned = false;
+  struct cpu_counters counters = {.cycles_fd = -1, .instructions_fd = -1};
+  counters.cycles_fd = open_counter(PERF_COUNT_HW_CPU_CYCLES, -1);
+  if (counters.cycles_fd >= 0) {
+    counters.instructions_fd =
+        open_counter(PERF_COUNT_HW_INSTRUCTIONS, counters.cycles_fd);
+  }
+  if (counters.instructions_fd < 0) {
+    if (counters.cycles_fd >= 0) {
+      close(counters.cycles_fd);
+      counters.cycles_fd = -1;
+    }
+    if (!atomic_exchange(&warned, true)) {
+      perror("perf_event_open, cycles and instructions are not reported");
+    }
+  }
+  return counters;
+}
+
+static void close_cpu_counters(struct cpu_counters *counters) {
+  if (counters->cycles_fd >= 0) {
+    close(counters->instructions_fd);
+    close(counters->cycles_fd);
+  }
+}
+
+// Takes a sample of the CPU time of the thread and of its counters
+static void sample_cpu(const struct cpu_counters *counters,
+                       struct handshake_cpu *sample) {
+  struct timespec cpu_time;
+  struct {
+    uint64_t count;
+    uint64_t values[2];
+  } group;
+
+  clock_gettime(CLOCK_THREAD_CPUTIME_ID, &cpu_time);
+  sample->cpu_ns = (int64_t)cpu_time.tv_sec * NS_IN_S + cpu_time.tv_nsec;
+  sample->cycles = -1;
+  sample->instructions = -1;
+  if (counters && counters->cycles_fd >= 0 &&
+      read(counters->cycles_fd, &group, sizeof(group)) == sizeof(group)) {
+    sample->cycles = group.values[0];
+    sample->instructions = group.values[1];
+  }
+}
+
+// Computation between two samples, the counters stay -1 if one is missing
+static struct handshake_cpu cpu_difference(const struct handshake_cpu *start,
+                                           const struct handshake_cpu *end) {
+  bool counted = start->cycles >= 0 && end->cycles >= 0;
+  struct handshake_cpu difference = {
+      .cpu_ns = end->cpu_ns - start->cpu_ns,
+      .cycles = counted ? end->cycles - start->cycles : -1,
+      .instructions = counted ? end->instructions - start->instructions : -1,
+  };
+  return difference;
+}
+
+static struct timespec add_ms(const struct timespec *time, double ms) {
+  long ns = time->tv_nsec + (long)(ms * NS_IN_MS);
+  struct timespec sum = {.tv_sec = time->tv_sec + ns / NS_IN_S,
+                         .tv_nsec = ns % NS_IN_S};
+  return sum;
+}
+
+// Scheduled start of every handshake in ms, evenly spaced or with
+// exponentially distributed gaps (Poisson arrivals)
+static double *arrival_schedule(size_t count) {
+  double *arrivals = malloc(count * sizeof(*arrivals));
+  double time_ms = 0.0;
+  if (!arrivals) {
+    return NULL;
+  }
+  srand48(arguments.seed);
+  for (size_t i = 0; i < count; i++) {
+    arrivals[i] = time_ms;
+    double gap = arguments.poisson ? -log(1.0 - drand48()) : 1.0;
+    time_ms += gap * MS_IN_S / arguments.rate;
+  }
+  return arrivals;
+}
+
+// Prints the result of round i as a line of its own, as soon as the handshake
+// is done, so that a reader gets every completed handshake even if s_timer is
+// killed later. With --phases, the measurement:success pair is followed by the
+// phase durations, e.g. 12.3:1:0.1;4.5;3.2;2.1;2.4
+// With --cert-comp, the message sizes are inserted before the phases as
+// algorithm/server certificate/uncompressed/client certificate/uncompressed/
+// received/sent, e.g. 12.3:1:zlib/3021/9102/2987/8955/6012/4731
+// With --cpu-stats, the CPU time in ms, the cycles and the instructions
+// follow (before the phases), e.g. 12.3:1:2.1/7011000/9802000
+static void print_record(const struct benchmark *benchmark, size_t i) {
+  char record[RECORD_SIZE];
+  int length = snprintf(record, sizeof(record), "%f:%i",
+                        benchmark->handshake_times_ms[i],
+                        benchmark->conn_success[i]);
+  if (arguments.resumption != HANDSHAKE_FULL) {
+    length += snprintf(record + length, sizeof(record) - length, ":%s",
+                       handshake_type_names[benchmark->handshake_types[i]]);
+  }
+  if (arguments.cert_comp) {
+    const struct handshake_bytes *bytes = &benchmark->handshake_bytes[i];
+    int32_t comp = bytes->server_cert_comp;
+    length += snprintf(
+        record + length, sizeof(record) - length,
+        ":%s/%u/%u/%u/%u/%llu/%llu",
+        comp >= 0 && comp < CERT_COMP_ALGORITHMS ? cert_comp_names[comp]
+                                                 : "unknown",
+        bytes->server_cert_bytes, bytes->server_cert_uncompressed_bytes,
+        bytes->client_cert_bytes, bytes->client_cert_uncompressed_bytes,
+        (unsigned long long)bytes->received, (unsigned long long)bytes->sent);
+  }
+  if (arguments.cpu_stats) {
+    const struct handshake_cpu *cpu = &benchmark->handshake_cpu[i];
+    length += snprintf(record + length, sizeof(record) - length,
+                       ":%f/%lld/%lld", cpu->cpu_ns / NS_IN_MS,
+                       (long long)cpu->cycles, (long long)cpu->instructions);
+  }
+  for (int phase = 0; arguments.phases && phase < PHASE_COUNT; phase++) {
+    length += snprintf(record + length, sizeof(record) - length, "%c%f",
+                       phase == 0 ? ':' : ';',
+                       benchmark->phase_times_ms[i][phase]);
+  }
+
+  // The workers print their records in the order the handshakes finish
+  flockfile(stdout);
+  fputs(record, stdout);
+  fputc('\n', stdout);
+  fflush(stdout);
+  funlockfile(stdout);
+}
+
+static int64_t elapsed_ns(const struct timespec *start,
+                          const struct timespec *finish) {
+  return (int64_t)(finish->tv_sec - start->tv_sec) * NS_IN_S +
+         (finish->tv_nsec - start->tv_nsec);
+}
+
+// Writes round i as binary record, the nanoseconds are kept without rounding
+static void write_binary_record(const struct benchmark *benchmark, size_t i,
+                                const struct timespec *start,
+                                const struct timespec *finish,
+                                const struct handshake_phases *phases) {
+  struct binary_record record = {
+      .round = i,
+      .start_ns = elapsed_ns(&benchmark->epoch, start),
+      .end_ns = elapsed_ns(&benchmark->epoch, finish),
+      .status = benchmark->conn_success[i],
+      .type = benchmark->handshake_types[i],
+  };
+  for (int phase = 0; phase < PHASE_COUNT; phase++) {
+    record.phase_end_ns[phase] =
+        arguments.phases && benchmark->conn_success[i] && phases->seen[phase]
+            ? elapsed_ns(start, &phases->end[phase])
+            : -1;
+  }
+  if (benchmark->handshake_bytes) {
+    record.bytes = benchmark->handshake_bytes[i];
+  }
+  if (benchmark->handshake_cpu) {
+    record.cpu = benchmark->handshake_cpu[i];
+  } else {
+    record.cpu.cpu_ns = record.cpu.cycles = record.cpu.instructions = -1;
+  }
+
+  flockfile(benchmark->binary_out);
+  fwrite(&record, sizeof(record), 1, benchmark->binary_out);
+  fflush(benchmark->binary_out);
+  funlockfile(benchmark->binary_out);
+}
+
+// Performs the handshake of round i, returns -1 on an unrecoverable error
+// In the open loop, the time is measured from the scheduled start, so that
+// waiting for the server (or a free worker) is part of the latency
+// counters are the hardware counters of the calling worker (with --cpu-stats)
+static int run_round(struct benchmark *benchmark, size_t i,
+                     const struct cpu_counters *counters) {
+  struct handshake_phases phases;
+  struct handshake_bytes bytes;
+  struct handshake_cpu cpu_start, cpu_end;
+  struct timespec start, finish;
+  SSL *ssl = NULL;
+
+  memset(&phases, 0, sizeof(phases));
+  memset(&bytes, 0, sizeof(bytes));
+  if (benchmark->arrival_times_ms) {
+    start = add_ms(&benchmark->schedule_start, benchmark->arrival_times_ms[i]);
+    while (clock_nanosleep(measurement_clock, TIMER_ABSTIME, &start, NULL) ==
+           EINTR) {
+    }
+  } else {
+    clock_gettime(measurement_clock, &start);
+  }
+  bool resume = resume_round(i);
+  if (arguments.cpu_stats) {
+    sample_cpu(counters, &cpu_start);
+  }
+  ssl = do_tls_handshake(benchmark->ssl_ctx, arguments.phases ? &phases : NULL,
+                         arguments.cert_comp ? &bytes : NULL, resume);
+  clock_gettime(measurement_clock, &finish);
+  if (arguments.cpu_stats) {
+    // Also the computation of failed handshakes is reported
+    sample_cpu(counters, &cpu_end);
+    benchmark->handshake_cpu[i] = cpu_difference(&cpu_start, &cpu_end);
+  }
+  if (!ssl) {
+    // Handshake unsuccessful, its kind is the one which was attempted
+    benchmark->conn_success[i] = false;
+    benchmark->handshake_times_ms[i] = -1.0;
+    benchmark->handshake_types[i] =
+        resume ? arguments.resumption : HANDSHAKE_FULL;
+  } else {
+    // Handshake successful
+    benchmark->conn_success[i] = true;
+    benchmark->handshake_times_ms[i] = elapsed_ms(&start, &finish);
+    benchmark->handshake_types[i] = handshake_type(ssl);
+    if (arguments.cert_comp) {
+      // Counted before the session tickets are read
+      bytes.received = BIO_number_read(SSL_get_rbio(ssl));
+      bytes.sent = BIO_number_written(SSL_get_wbio(ssl));
+    }
+
+    // The tickets for the next resumptions are received after the measurement
+    if (arguments.resumption != HANDSHAKE_FULL) {
+      receive_session_tickets(ssl);
+    }
+
+    SSL_set_shutdown(ssl, SSL_SENT_SHUTDOWN | SSL_RECEIVED_SHUTDOWN);
+    if (BIO_closesocket(SSL_get_fd(ssl)) == -1) {
+      SSL_free(ssl);
+      return -1;
+    }
+
+    SSL_free(ssl);
+  }
+
+  if (arguments.phases) {
+    // Duration of each phase since the end of the previous one, -1.0 if a
+    // phase was not reached (e.g. failed handshake)
+    const struct timespec *previous = &start;
+    for (int phase = 0; phase < PHASE_COUNT; phase++) {
+      if (benchmark->conn_success[i] && phases.seen[phase]) {
+        benchmark->phase_times_ms[i][phase] =
+            elapsed_ms(previous, &phases.end[phase]);
+        previous = &phases.end[phase];
+      } else {
+        benchmark->phase_times_ms[i][phase] = -1.0;
+      }
+    }
+  }
+  if (arguments.cert_comp) {
+    // The sizes of a failed handshake are unknown
+    if (!benchmark->conn_success[i]) {
+      memset(&bytes, 0, sizeof(bytes));
+    }
+    benchmark->handshake_bytes[i] = bytes;
+  }
+  if (benchmark->binary_out) {
+    write_binary_record(benchmark, i, &start, &finish, &phases);
+  } else {
+    print_record(benchmark, i);
+  }
+  return 0;
+}
+
+// Performs handshakes one after another until all rounds are claimed
+// Note: Unsuccessful connections are also counted as a test round
+static void *handshake_worker(void *arg) {
+  struct benchmark *benchmark = arg;
+  struct cpu_counters counters = {.cycles_fd = -1, .instructions_fd = -1};
+  size_t i;
+  // The counters count the thread which opened them
+  if (arguments.cpu_stats) {
+    counters = open_cpu_counters();
+  }
+  while (!atomic_load(&benchmark->failed) &&
+         (i = atomic_fetch_add(&benchmark->next_round, 1)) <
+             arguments.rounds) {
+    if (run_round(benchmark, i, &counters) != 0) {
+      // The OpenSSL error queue is per thread, so print it here
+      ERR_print_errors_fp(stderr);
+      atomic_store(&benchmark->failed, true);
+    }
+  }
+  close_cpu_counters(&counters);
+  return NULL;
+}
+
+static int compare_doubles(const void *a, const void *b) {
+  double x = *(const double *)a, y = *(const double *)b;
+  return (x > y) - (x < y);
+}
+
+// Nearest-rank percentile of sorted values
+static double percentile(const double *sorted, size_t count, double p) {
+  size_t rank = (size_t)(p / 100.0 * count + 0.999999);
+  return sorted[rank > 0 ? rank - 1 : 0];
+}
+
+// Prints the handshake rate and the latency distribution of the successful
+// handshakes under load
+static void print_load_summary(struct benchmark *benchmark, size_t rounds,
+                               double duration_ms) {
+  double *sorted = malloc(rounds * sizeof(*sorted));
+  size_t successful = 0;
+  if (!sorted) {
+    return;
+  }
+  for (size_t i = 0; i < rounds; i++) {
+    if (benchmark->conn_success[i]) {
+      sorted[successful++] = benchmark->handshake_times_ms[i];
+    }
+  }
+  qsort(sorted, successful, sizeof(*sorted), compare_doubles);
+
+  printf("Load: %zu workers, ", arguments.concurrency);
+  if (benchmark->arrival_times_ms) {
+    printf("offered %f handshakes/s (%s), ", arguments.rate,
+           arguments.poisson ? "poisson" : "constant");
+  }
+  printf("%zu of %zu handshakes successful in %f s, %f handshakes/s",
+         successful, rounds, duration_ms / MS_IN_S,
+         successful / (duration_ms / MS_IN_S));
+  if (successful > 0) {
+    printf(", latency [ms] p50 %f p90 %f p99 %f max %f",
+           percentile(sorted, successful, 50), percentile(sorted, successful, 90),
+           percentile(sorted, successful, 99), sorted[successful - 1]);
+  }
+  printf("\n");
+  free(sorted);
+}
+
 int main(int argc, char *args[]) {
   int ret = -1;
   SSL_CTX *ssl_ctx = NULL;
@@ -163,6 +963,20 @@ int main(int argc, char *args[]) {
   arguments.ica_cert = "";
   arguments.client_cert = "";
   arguments.client_key = "";
+  arguments.phases = false;
+  arguments.concurrency = 0;
+  arguments.rate = 0.0;
+  arguments.duration = 0.0;
+  arguments.poisson = false;
+  arguments.seed = 1;
+  arguments.binary_out = NULL;
+  arguments.resumption = HANDSHAKE_FULL;
+  arguments.resumption_ratio = 1.0;
+  arguments.groups = "x25519_kyber768";
+  arguments.ciphersuites = "TLS_AES_256_GCM_SHA384";
+  arguments.cert_comp = false;
+  arguments.cert_comp_count = 0;
+  arguments.cpu_stats = false;
 
   // Parse the CLI arguments
   argp_parse(&argp, argc, args, 0, 0, &arguments);
@@ -170,24 +984,59 @@ int main(int argc, char *args[]) {
   // Counter for number of measurements taken (performed rounds)
   size_t measurements = 0;
 
-  // Fix cipher suite
-  const char *ciphersuites = "TLS_AES_256_GCM_SHA384";
+  // The open loop performs rate * duration handshakes instead of -r rounds
+  if (arguments.rate > 0.0) {
+    if (arguments.duration <= 0.0) {
+      fprintf(stderr, "--rate requires a --duration.\n");
+      return 1;
+    }
+    arguments.rounds = (size_t)llround(arguments.rate * arguments.duration);
+    if (arguments.rounds < 1) {
+      arguments.rounds = 1;
+    }
+    measurement_clock = CLOCK_MONOTONIC;
+  }
+  if (arguments.concurrency < 1) {
+    arguments.concurrency = arguments.rate > 0.0 ? OPEN_LOOP_WORKERS : 1;
+  }
 
-  // Fix KEX mechanism
-  const char *kex = "x25519_kyber768";
+  // Cipher suites and KEX mechanisms offered to the server
+  const char *ciphersuites = arguments.ciphersuites;
+  const char *kex = arguments.groups;
 
   const SSL_METHOD *ssl_meth = TLS_client_method();
-  SSL *ssl = NULL;
 
   struct timespec start, finish;
   double *handshake_times_ms =
       malloc(arguments.rounds * sizeof(*handshake_times_ms));
   bool *conn_success = malloc(arguments.rounds * sizeof(*conn_success));
+  enum handshake_type *handshake_types =
+      malloc(arguments.rounds * sizeof(*handshake_types));
+  double(*phase_times_ms)[PHASE_COUNT] =
+      arguments.phases ? malloc(arguments.rounds * sizeof(*phase_times_ms))
+                       : NULL;
+  double *arrival_times_ms =
+      arguments.rate > 0.0 ? arrival_schedule(arguments.rounds) : NULL;
+  struct handshake_bytes *handshake_bytes =
+      arguments.cert_comp ? malloc(arguments.rounds * sizeof(*handshake_bytes))
+                          : NULL;
+  struct handshake_cpu *handshake_cpu =
+      arguments.cpu_stats ? malloc(arguments.rounds * sizeof(*handshake_cpu))
+                          : NULL;
 
-  if (!handshake_times_ms || !conn_success) {
+  if (!handshake_times_ms || !conn_success || !handshake_types ||
+      (arguments.phases && !phase_times_ms) ||
+      (arguments.rate > 0.0 && !arrival_times_ms) ||
+      (arguments.cert_comp && !handshake_bytes) ||
+      (arguments.cpu_stats && !handshake_cpu)) {
     fprintf(stderr, "Memory allocation failed.\n");
     free(handshake_times_ms);
     free(conn_success);
+    free(handshake_types);
+    free(phase_times_ms);
+    free(arrival_times_ms);
+    free(handshake_bytes);
+    free(handshake_cpu);
     return 1;
   }
 
@@ -196,9 +1045,32 @@ int main(int argc, char *args[]) {
     fprintf(stderr, "Failed to create SSL context.\n");
     free(handshake_times_ms);
     free(conn_success);
+    free(handshake_types);
+    free(phase_times_ms);
+    free(arrival_times_ms);
+    free(handshake_bytes);
+    free(handshake_cpu);
     return 1;
   }
 
+  // The binary records go to their own file (or named pipe), stdout keeps the
+  // text header
+  FILE *binary_out = NULL;
+  if (arguments.binary_out) {
+    struct binary_header header = {
+        .magic = BINARY_MAGIC,
+        .version = BINARY_VERSION,
+        .record_size = sizeof(struct binary_record),
+        .phase_count = PHASE_COUNT,
+    };
+    binary_out = fopen(arguments.binary_out, "wb");
+    if (!binary_out || fwrite(&header, sizeof(header), 1, binary_out) != 1) {
+      fprintf(stderr, "Failed to open %s.\n", arguments.binary_out);
+      ret = 1;
+      goto end;
+    }
+  }
+
   // Print OpenSSL version and build information
   printf("OpenSSL Version: %s\n", OpenSSL_version(OPENSSL_VERSION));
 
@@ -279,49 +1151,137 @@ int main(int argc, char *args[]) {
 
   SSL_CTX_set_verify(ssl_ctx, SSL_VERIFY_PEER, NULL);
 
+  // Certificate compression is negotiated in both directions: the client offers
+  // to receive compressed server certificates and compresses its own one if
+  // the server offers it as well. It is off unless --cert-comp lists
+  // algorithms, even if the OpenSSL build would enable it by default.
+  if (arguments.cert_comp_count == 0) {
+#ifdef SSL_OP_NO_TX_CERTIFICATE_COMPRESSION
+    SSL_CTX_set_options(ssl_ctx, SSL_OP_NO_TX_CERTIFICATE_COMPRESSION |
+                                     SSL_OP_NO_RX_CERTIFICATE_COMPRESSION);
+#endif
+  } else {
+#ifdef SSL_OP_NO_TX_CERTIFICATE_COMPRESSION
+    ret = SSL_CTX_set1_cert_comp_preference(ssl_ctx,
+                                            arguments.cert_comp_algorithms,
+                                            arguments.cert_comp_count);
+    if (ret != 1) {
+      fprintf(stderr, "Certificate compression algorithms not supported by "
+                      "this OpenSSL build.\n");
+      goto ossl_error;
+    }
+    // Compress the client certificate once instead of in every handshake (as
+    // s_server -cert_comp does for the server certificate)
+    if (!SSL_CTX_compress_certs(ssl_ctx, 0)) {
+      fprintf(stderr, "Failed to compress the client certificate.\n");
+      goto ossl_error;
+    }
+#else
+    fprintf(stderr, "Certificate compression requires OpenSSL 3.2.\n");
+    goto ossl_error;
+#endif
+  }
+
+  if (arguments.phases || arguments.cert_comp) {
+    SSL_CTX_set_msg_callback(ssl_ctx, handshake_msg_callback);
+  }
+  if (arguments.phases) {
+    SSL_CTX_set_info_callback(ssl_ctx, phase_info_callback);
+  }
+
+  // The session tickets are kept by store_session instead of the cache
+  if (arguments.resumption != HANDSHAKE_FULL) {
+    SSL_CTX_set_session_cache_mode(ssl_ctx, SSL_SESS_CACHE_CLIENT |
+                                                SSL_SESS_CACHE_NO_INTERNAL_STORE);
+    SSL_CTX_sess_set_new_cb(ssl_ctx, store_session);
+  }
+  // Offer resumption without (EC)DHE, the server has to allow it as well
+  if (arguments.resumption == HANDSHAKE_PSK) {
+    SSL_CTX_set_options(ssl_ctx, SSL_OP_ALLOW_NO_DHE_KEX);
+  }
+
   // Load OQS-Provider
   const char *providerPath = arguments.config_file;
   if (loadOQSProvider(providerPath) == 0) {
     printf("OQS provider loaded successfully.\n");
+    // The header is complete, a reader can check it before the first record
+    fflush(stdout);
   } else {
     fprintf(stderr, "Failed to load OQS provider.\n");
     goto ossl_error;
   }
 
-  while (measurements < arguments.rounds) {
-    clock_gettime(CLOCK_MONOTONIC_RAW, &start);
-    ssl = do_tls_handshake(ssl_ctx);
-    clock_gettime(CLOCK_MONOTONIC_RAW, &finish);
+  // Establish the session which the measured rounds resume
+  if (arguments.resumption != HANDSHAKE_FULL) {
+    SSL *ssl = do_tls_handshake(ssl_ctx, NULL, NULL, false);
     if (!ssl) {
-      // Handshake unsuccessful
-      conn_success[measurements] = false;
-      handshake_times_ms[measurements] = -1.0;
-    } else {
-      // Handshake successful
-      conn_success[measurements] = true;
-      handshake_times_ms[measurements] =
-          ((finish.tv_sec - start.tv_sec) * MS_IN_S) +
-          ((finish.tv_nsec - start.tv_nsec) / NS_IN_MS);
-
-      SSL_set_shutdown(ssl, SSL_SENT_SHUTDOWN | SSL_RECEIVED_SHUTDOWN);
-      ret = BIO_closesocket(SSL_get_fd(ssl));
-      if (ret == -1) {
-        goto ossl_error;
-      }
+      fprintf(stderr, "Failed to establish a session for resumption.\n");
+      goto ossl_error;
+    }
+    receive_session_tickets(ssl);
+    SSL_free(ssl);
+    if (!resumption_session) {
+      fprintf(stderr, "The server did not send a session ticket.\n");
+      goto ossl_error;
+    }
+  }
 
-      SSL_free(ssl);
+  struct benchmark benchmark = {
+      .ssl_ctx = ssl_ctx,
+      .handshake_times_ms = handshake_times_ms,
+      .conn_success = conn_success,
+      .handshake_types = handshake_types,
+      .phase_times_ms = phase_times_ms,
+      .handshake_bytes = handshake_bytes,
+      .handshake_cpu = handshake_cpu,
+      .arrival_times_ms = arrival_times_ms,
+      .binary_out = binary_out,
+  };
+  atomic_init(&benchmark.next_round, 0);
+  atomic_init(&benchmark.failed, false);
+
+  // With a single worker, the handshakes are performed in the main thread
+  clock_gettime(measurement_clock, &start);
+  benchmark.epoch = start;
+  benchmark.schedule_start = add_ms(&start, OPEN_LOOP_LEAD_MS);
+  if (arguments.concurrency == 1) {
+    handshake_worker(&benchmark);
+  } else {
+    pthread_t *workers = malloc(arguments.concurrency * sizeof(*workers));
+    size_t started = 0;
+    if (!workers) {
+      fprintf(stderr, "Memory allocation failed.\n");
+      goto ossl_error;
+    }
+    while (started < arguments.concurrency &&
+           pthread_create(&workers[started], NULL, handshake_worker,
+                          &benchmark) == 0) {
+      started++;
     }
+    if (started < arguments.concurrency) {
+      // Stop the workers which were started and give up
+      fprintf(stderr, "Failed to start handshake worker %zu.\n", started);
+      atomic_store(&benchmark.failed, true);
+    }
+    for (size_t i = 0; i < started; i++) {
+      pthread_join(workers[i], NULL);
+    }
+    free(workers);
+  }
+  clock_gettime(measurement_clock, &finish);
 
-    // Go to next test round
-    // Note: Unsuccessful connections are also counted as a test round
-    measurements++;
+  if (atomic_load(&benchmark.failed)) {
+    goto ossl_error;
   }
+  measurements = arguments.rounds;
 
-  for (size_t i = 0; i < measurements - 1; i++) {
-    printf("%f:%i,", handshake_times_ms[i], conn_success[i]);
+  if (arguments.concurrency > 1 || arrival_times_ms) {
+    // The open loop is measured from the first scheduled arrival
+    if (arrival_times_ms) {
+      start = benchmark.schedule_start;
+    }
+    print_load_summary(&benchmark, measurements, elapsed_ms(&start, &finish));
   }
-  printf("%f:%i", handshake_times_ms[measurements - 1],
-         conn_success[measurements - 1]);
 
   ret = 0;
   goto end;
@@ -332,7 +1292,16 @@ ossl_error:
 
 end:
   SSL_CTX_free(ssl_ctx);
+  SSL_SESSION_free(resumption_session);
   free(handshake_times_ms);
   free(conn_success);
+  free(handshake_types);
+  free(phase_times_ms);
+  free(arrival_times_ms);
+  free(handshake_bytes);
+  free(handshake_cpu);
+  if (binary_out) {
+    fclose(binary_out);
+  }
   return ret;
 }
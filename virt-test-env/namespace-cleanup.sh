@@ -3,11 +3,34 @@ set -euo pipefail
 
 IP=$(command -v ip)
 
+# Optional index of the namespace pair (default 0), see namespace-setup.sh
+PAIR=${1:-0}
+# The index is an octet of the subnets and MAC addresses of the pair
+case "$PAIR" in
+    ''|*[!0-9]*|0[0-9]*)
+        echo "Invalid pair index \"$PAIR\", expected a number between 0 and 255." >&2
+        exit 1
+        ;;
+esac
+if [ "$PAIR" -gt 255 ]; then
+    echo "Invalid pair index \"$PAIR\", expected a number between 0 and 255." >&2
+    exit 1
+fi
+if [[ $PAIR -eq 0 ]]; then
+    SUFFIX=""
+else
+    SUFFIX="-p$PAIR"
+fi
+NS1="ns1$SUFFIX"
+NS2="ns2$SUFFIX"
+VETH1="veth1$SUFFIX"
+VETH2="veth2$SUFFIX"
+
 # Starting
-echo "Start cleaning up..."
+echo "Start cleaning up $NS1/$NS2..."
 
-# We check if ns1 and ns2 namespaces exist
-netns=$($IP netns list | grep "ns[12]" || [[ $? == 1 ]])
+# We check if the two namespaces exist
+netns=$($IP netns list | grep -E "^ns[12]$SUFFIX( |$)" || [[ $? == 1 ]])
 
 if [[ ${#netns} -eq 0 ]]; then
     echo "Nothing to clean. Exiting..."
@@ -15,15 +38,15 @@ if [[ ${#netns} -eq 0 ]]; then
 fi
 
 # Shutting down the veth devices
-sudo $IP -n ns1 link set dev veth1 down
-sudo $IP -n ns2 link set dev veth2 down
+sudo $IP -n $NS1 link set dev $VETH1 down
+sudo $IP -n $NS2 link set dev $VETH2 down
 
 # Delete the veth pair (this command will remove both veth1 and veth2)
-sudo $IP -n ns1 link delete veth1 type veth
+sudo $IP -n $NS1 link delete $VETH1 type veth
 
 # Delete the two namespaces
-sudo $IP netns del ns1
-sudo $IP netns del ns2
+sudo $IP netns del $NS1
+sudo $IP netns del $NS2
 
 # Finished
 echo "Cleanup finished."
@@ -3,30 +3,55 @@ set -euo pipefail
 
 IP=$(command -v ip)
 
+# Optional index of the namespace pair (default 0)
+# Pair 0 uses ns1/ns2, veth1/veth2 and the subnets 10.5.0.0/24 and 10.6.0.0/24,
+# pair N uses ns1-pN/ns2-pN, veth1-pN/veth2-pN and the subnets 10.5.N.0/24 and 10.6.N.0/24
+PAIR=${1:-0}
+# The index is an octet of the subnets and MAC addresses of the pair
+case "$PAIR" in
+    ''|*[!0-9]*|0[0-9]*)
+        echo "Invalid pair index \"$PAIR\", expected a number between 0 and 255." >&2
+        exit 1
+        ;;
+esac
+if [ "$PAIR" -gt 255 ]; then
+    echo "Invalid pair index \"$PAIR\", expected a number between 0 and 255." >&2
+    exit 1
+fi
+if [ "$PAIR" -eq 0 ]; then
+    SUFFIX=""
+else
+    SUFFIX="-p$PAIR"
+fi
+NS1="ns1$SUFFIX"
+NS2="ns2$SUFFIX"
+VETH1="veth1$SUFFIX"
+VETH2="veth2$SUFFIX"
+MAC_INDEX=$(printf "%02x" "$PAIR")
+
 # Starting
-echo "Start the setup..."
+echo "Start the setup of $NS1/$NS2..."
 
 # Set up two namespaces with the name ns1 and ns2
-sudo $IP netns add ns1
-sudo $IP netns add ns2
+sudo $IP netns add $NS1
+sudo $IP netns add $NS2
 
-# Create a virtual Ethernet pair (veth101 and veth102) and link them to the namespaces (ns1 and ns2, respectively)
-sudo $IP link add name veth1 address 00:00:00:00:00:01 netns ns1 type veth peer name veth2 address 00:00:00:00:00:02 netns ns2
+# Create a virtual Ethernet pair (veth1 and veth2) and link them to the namespaces (ns1 and ns2, respectively)
+sudo $IP link add name $VETH1 address 00:00:00:00:$MAC_INDEX:01 netns $NS1 type veth peer name $VETH2 address 00:00:00:00:$MAC_INDEX:02 netns $NS2
 
 # Assign an IP address to each veth device and change the device state to "up"
-sudo $IP -n ns1 addr add 10.5.0.1/24 dev veth1
-sudo $IP -n ns1 link set dev veth1 up
-sudo $IP -n ns2 addr add 10.6.0.1/24 dev veth2
-sudo $IP -n ns2 link set dev veth2 up
+sudo $IP -n $NS1 addr add 10.5.$PAIR.1/24 dev $VETH1
+sudo $IP -n $NS1 link set dev $VETH1 up
+sudo $IP -n $NS2 addr add 10.6.$PAIR.1/24 dev $VETH2
+sudo $IP -n $NS2 link set dev $VETH2 up
 
 # Add routing tables between namespaces
-sudo $IP -n ns1 route add 10.6.0.0/24 dev veth1
-sudo $IP -n ns2 route add 10.5.0.0/24 dev veth2
+sudo $IP -n $NS1 route add 10.6.$PAIR.0/24 dev $VETH1
+sudo $IP -n $NS2 route add 10.5.$PAIR.0/24 dev $VETH2
 
-# Disable TCP Segmentation Offload (TSO), GSO and GRO
-sudo $IP netns exec ns1 ethtool -K veth1 gso off gro off tso off
-sudo $IP netns exec ns2 ethtool -K veth2 gso off gro off tso off
+# Disable TCP Segmentation Offload (TSO), GSO and GRO
+sudo $IP netns exec $NS1 ethtool -K $VETH1 gso off gro off tso off
+sudo $IP netns exec $NS2 ethtool -K $VETH2 gso off gro off tso off
 
 # Finished.
 echo "Setup finished."
-